@@ -0,0 +1,239 @@
+"""
+python alert_targeting.py alerts.json
+python alert_targeting.py alerts.json --batch-size 500 --output batches.ndjson --all-users
+
+Finds the device tokens to notify for a batch of weather alerts. alerts.json
+is a list of areas:
+
+    [{"id": "storm-17", "type": "circle", "center": {"latitude": -1.28, "longitude": 36.82}, "radiusKm": 40},
+     {"id": "flood-3", "type": "polygon",
+      "points": [{"latitude": 0.1, "longitude": 34.0}, {"latitude": 0.9, "longitude": 34.2}, ...]}]
+
+User locations are read once and bucketed into a lat/lon grid. Each area only
+tests the users in the grid cells its bounding box covers (haversine distance
+for circles, ray casting for polygons), and all alerts share one grid. The
+matched users are joined to their active tokens with a single query through a
+temp table. Results are handed out as per-alert token batches, 500 by default,
+which is the FCM multicast limit. Users whose notificationPreferences turn
+weatherAlerts off are skipped unless --all-users is given. Polygons must not
+cross the antimeridian.
+"""
+
+
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from database_manager import DatabaseManager
+from nearest_wells import EARTH_RADIUS_KM, valid_coordinates
+from profiler import run_main
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    h = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+@dataclass
+class AlertArea:
+    """A circle (center + radiusKm) or a polygon (points, implicitly closed)."""
+    id: str
+    type: str
+    center: Optional[Tuple[float, float]] = None
+    radius_km: float = 0.0
+    points: Optional[List[Tuple[float, float]]] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'AlertArea':
+        area_id, kind = str(data.get('id', '')), data.get('type')
+        if not area_id:
+            raise ValueError('Alert area is missing an id')
+        try:
+            if kind == 'circle':
+                center = (data['center']['latitude'], data['center']['longitude'])
+                radius = data['radiusKm']
+                if not valid_coordinates(*center) or not isinstance(radius, (int, float)) or radius <= 0:
+                    raise ValueError
+                return cls(area_id, kind, center=center, radius_km=float(radius))
+            if kind == 'polygon':
+                points = [(p['latitude'], p['longitude']) for p in data['points']]
+                if len(points) < 3 or not all(valid_coordinates(*p) for p in points):
+                    raise ValueError
+                return cls(area_id, kind, points=points)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Alert area {area_id}: invalid {kind} definition")
+        raise ValueError(f"Alert area {area_id}: unknown type {kind!r} (expected circle or polygon)")
+
+    def bounding_box(self) -> Tuple[float, float, float, float]:
+        """(min lat, min lon, max lat, max lon); longitudes may run past +-180 for circles."""
+        if self.type == 'polygon':
+            lats, lons = [p[0] for p in self.points], [p[1] for p in self.points]
+            return min(lats), min(lons), max(lats), max(lons)
+        lat, lon = self.center
+        dlat = self.radius_km / KM_PER_DEGREE
+        if abs(lat) + dlat >= 90:
+            return max(-90.0, lat - dlat), -180.0, min(90.0, lat + dlat), 180.0
+        dlon = dlat / math.cos(math.radians(abs(lat) + dlat))
+        if dlon >= 180:
+            return lat - dlat, -180.0, lat + dlat, 180.0
+        return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+    def contains(self, lat: float, lon: float) -> bool:
+        if self.type == 'circle':
+            return haversine_km(self.center[0], self.center[1], lat, lon) <= self.radius_km
+        inside = False
+        points = self.points
+        j = len(points) - 1
+        for i in range(len(points)):
+            lat_i, lon_i = points[i]
+            lat_j, lon_j = points[j]
+            if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+            j = i
+        return inside
+
+class UserGrid:
+    """User locations bucketed into cell_degrees x cell_degrees cells."""
+
+    def __init__(self, cell_degrees: float = 0.5):
+        self.cell_degrees = cell_degrees
+        self.columns = math.ceil(360 / cell_degrees)
+        self.cells: Dict[Tuple[int, int], List[Tuple[str, float, float]]] = {}
+        self.size = 0
+
+    def _row(self, lat: float) -> int:
+        return math.floor((lat + 90) / self.cell_degrees)
+
+    def _column(self, lon: float) -> int:
+        return math.floor((lon + 180) / self.cell_degrees) % self.columns
+
+    def add(self, user_id: str, lat: float, lon: float):
+        self.cells.setdefault((self._row(lat), self._column(lon)), []).append((user_id, lat, lon))
+        self.size += 1
+
+    def candidates(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> Iterator[tuple]:
+        """Users in every cell the box touches; longitudes past +-180 wrap around."""
+        first_column = math.floor((min_lon + 180) / self.cell_degrees)
+        last_column = math.floor((max_lon + 180) / self.cell_degrees)
+        columns = {c % self.columns for c in range(first_column, min(last_column, first_column + self.columns - 1) + 1)}
+        for row in range(self._row(min_lat), self._row(max_lat) + 1):
+            for column in columns:
+                yield from self.cells.get((row, column), ())
+
+def load_grid(manager: DatabaseManager, cell_degrees: float, respect_preferences: bool) -> UserGrid:
+    """Read every user location once into a grid."""
+    grid = UserGrid(cell_degrees)
+    users_db = manager.users()
+    try:
+        cursor = users_db._execute(f'''
+            SELECT userId, json_extract(location, '$.latitude'), json_extract(location, '$.longitude')
+            FROM users
+            WHERE json_valid(location) {'AND notifyWeatherAlerts IS NOT 0' if respect_preferences else ''}
+        ''')
+        for user_id, lat, lon in cursor:
+            if valid_coordinates(lat, lon):
+                grid.add(user_id, lat, lon)
+    finally:
+        users_db.conn.close()
+    return grid
+
+def match_users(grid: UserGrid, areas: List[AlertArea]) -> Dict[str, Set[str]]:
+    """alert id -> ids of the users inside the area."""
+    matches = {}
+    for area in areas:
+        matches[area.id] = {user_id for user_id, lat, lon in grid.candidates(*area.bounding_box())
+                            if area.contains(lat, lon)}
+    return matches
+
+def active_tokens(manager: DatabaseManager, user_ids: Set[str]) -> Dict[str, List[str]]:
+    """user id -> active device tokens, fetched with one join against a temp table of the ids."""
+    tokens_db = manager.deviceTokens()
+    try:
+        conn = tokens_db.conn
+        conn.execute('CREATE TEMP TABLE alert_targets (userId TEXT PRIMARY KEY) WITHOUT ROWID')
+        conn.executemany('INSERT INTO alert_targets (userId) VALUES (?)', ((u,) for u in user_ids))
+        cursor = tokens_db._execute('''
+            SELECT t.userId, t.token
+            FROM alert_targets a
+            JOIN device_tokens t ON t.userId = a.userId
+            WHERE t.isActive = 1
+        ''')
+        tokens: Dict[str, List[str]] = {}
+        for user_id, token in cursor:
+            tokens.setdefault(user_id, []).append(token)
+        conn.rollback()
+        return tokens
+    finally:
+        tokens_db.conn.close()
+
+def target_alerts(manager: DatabaseManager, areas: List[AlertArea], cell_degrees: float = 0.5,
+                  respect_preferences: bool = True) -> Dict[str, Any]:
+    """
+    Resolve a batch of alert areas to device tokens.
+
+    Returns:
+        {'tokens': {alert id: [token, ...]}, 'users': {alert id: user count}, 'timings': {...}}
+    """
+    start = time.perf_counter()
+    grid = load_grid(manager, cell_degrees, respect_preferences)
+    loaded = time.perf_counter()
+    matches = match_users(grid, areas)
+    joined = time.perf_counter()
+    tokens = active_tokens(manager, set().union(*matches.values()) if matches else set())
+    finished = time.perf_counter()
+    return {
+        'tokens': {alert_id: sorted({t for user_id in users for t in tokens.get(user_id, ())})
+                   for alert_id, users in matches.items()},
+        'users': {alert_id: len(users) for alert_id, users in matches.items()},
+        'timings': {'gridUsers': grid.size, 'loadSeconds': round(loaded - start, 4),
+                    'matchSeconds': round(joined - loaded, 4), 'tokenSeconds': round(finished - joined, 4)},
+    }
+
+def token_batches(tokens: Dict[str, List[str]], batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Split each alert's tokens into delivery batches of at most batch_size."""
+    for alert_id, alert_tokens in tokens.items():
+        for i in range(0, len(alert_tokens), batch_size):
+            yield {'alertId': alert_id, 'tokens': alert_tokens[i:i + batch_size]}
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve weather alert areas to device token batches')
+    parser.add_argument('alerts', help='JSON file with a list of circle/polygon alert areas')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    parser.add_argument('--cell-degrees', type=float, default=0.5, help='Grid cell size in degrees')
+    parser.add_argument('--batch-size', type=int, default=500, help='Tokens per delivery batch')
+    parser.add_argument('--all-users', action='store_true', help='Ignore notificationPreferences.weatherAlerts')
+    parser.add_argument('--output', help='Write the batches as NDJSON to this file (default: stdout)')
+
+    args = parser.parse_args()
+    with open(args.alerts, encoding='utf-8') as f:
+        raw_areas = json.load(f)
+    try:
+        areas = [AlertArea.from_dict(area) for area in raw_areas]
+    except ValueError as e:
+        parser.error(str(e))
+
+    result = target_alerts(DatabaseManager(data_dir=args.data_dir), areas, args.cell_degrees,
+                           not args.all_users)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    batches = 0
+    try:
+        for batch in token_batches(result['tokens'], args.batch_size):
+            out.write(json.dumps(batch) + '\n')
+            batches += 1
+    finally:
+        if args.output:
+            out.close()
+
+    for area in areas:
+        print(f"{area.id}: {result['users'][area.id]} user(s), {len(result['tokens'][area.id])} token(s)",
+              file=sys.stderr)
+    print(f"{batches} batch(es); " + ', '.join(f'{k}={v}' for k, v in result['timings'].items()), file=sys.stderr)
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,215 @@
+"""
+python backup_tool.py --dest /opt/bluebridge/backups --compress
+python backup_tool.py --data-dir /opt/bluebridge/data --dest /opt/bluebridge/backups --compress --manifest new.txt
+python backup_tool.py --dest /opt/bluebridge/backups --databases wells --keep-last 5 --keep-daily 14
+python backup_tool.py --dest /opt/bluebridge/backups --verify wells_db_20250101_120000.sqlite.gz
+
+Online snapshots of the SQLite databases using the sqlite3 backup API. Pages
+are copied in small steps with a pause between steps, so writers on the live
+files are never blocked for the length of the whole copy. Every database is
+backed up, the readings archive and each wells shard included; the databases
+themselves are only read. --manifest lists the snapshots written, for uploading.
+"""
+
+
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from database_manager import DatabaseManager
+from profiler import run_main
+
+SNAPSHOT_RE = re.compile(r'^(?P<db_name>\w+)_db_(?P<stamp>\d{8}_\d{6})\.sqlite(?P<gz>\.gz)?$')
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+
+@dataclass
+class BackupResult:
+    db_name: str
+    path: str
+    size_bytes: int
+    seconds: float
+    integrity: str
+    compressed: bool
+
+    @property
+    def mb_per_s(self) -> float:
+        return (self.size_bytes / (1024 * 1024)) / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.db_name}: {Path(self.path).name} "
+                f"{self.size_bytes / (1024 * 1024):.2f} MB in {self.seconds:.2f}s "
+                f"({self.mb_per_s:.2f} MB/s), integrity={self.integrity}")
+
+def online_backup(source_path: str, dest_path: str, pages: int = 256, pause: float = 0.01) -> None:
+    """
+    Copy a live database into dest_path without holding a lock for the whole copy.
+
+    Args:
+        source_path: Database file to copy
+        dest_path: Snapshot file to write (overwritten if it exists)
+        pages: Number of pages copied per step
+        pause: Seconds to sleep between steps so writers can get the lock
+    """
+    def throttle(status, remaining, total):
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=pages, progress=throttle)
+    finally:
+        dest.close()
+        source.close()
+
+def integrity_check(path: str) -> str:
+    """Run PRAGMA integrity_check on a snapshot; returns 'ok' or the first problem."""
+    if path.endswith('.gz'):
+        with tempfile.TemporaryDirectory() as tmp:
+            plain = os.path.join(tmp, 'snapshot.sqlite')
+            with gzip.open(path, 'rb') as src, open(plain, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            return integrity_check(plain)
+
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+
+def compress_file(path: str) -> str:
+    """Gzip a snapshot in place and return the new path."""
+    gz_path = path + '.gz'
+    with open(path, 'rb') as src, gzip.open(gz_path, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.remove(path)
+    return gz_path
+
+def backup_database(db_name: str, source_path: str, dest_dir: str, timestamp: str,
+                    compress: bool = False, pages: int = 256, pause: float = 0.01) -> BackupResult:
+    """Snapshot one database into dest_dir, verify it and optionally compress it."""
+    dest_path = os.path.join(dest_dir, f'{db_name}_db_{timestamp}.sqlite')
+    start = time.perf_counter()
+    online_backup(source_path, dest_path, pages=pages, pause=pause)
+    seconds = time.perf_counter() - start
+    size_bytes = os.path.getsize(dest_path)
+
+    integrity = integrity_check(dest_path)
+    if integrity != 'ok':
+        os.rename(dest_path, dest_path + '.corrupt')
+        raise RuntimeError(f"Snapshot of {db_name} failed integrity check: {integrity}")
+
+    if compress:
+        dest_path = compress_file(dest_path)
+    return BackupResult(db_name, dest_path, size_bytes, seconds, integrity, compress)
+
+def backup_all(manager: DatabaseManager, dest_dir: str, databases: Optional[List[str]] = None,
+               compress: bool = False, pages: int = 256, pause: float = 0.01,
+               timestamp: Optional[str] = None) -> List[BackupResult]:
+    """Snapshot every configured database (or the selected ones) with one shared timestamp."""
+    os.makedirs(dest_dir, exist_ok=True)
+    timestamp = timestamp or datetime.now().strftime(TIMESTAMP_FORMAT)
+    results = []
+    for db_name, config in manager.databases.items():
+        if databases and db_name not in databases:
+            continue
+        if not Path(config.path).exists():
+            print(f"Skipping {db_name}: '{config.path}' not found")
+            continue
+        results.append(backup_database(db_name, config.path, dest_dir, timestamp,
+                                       compress=compress, pages=pages, pause=pause))
+    return results
+
+def list_snapshots(dest_dir: str) -> Dict[str, List[tuple]]:
+    """Group snapshot files in dest_dir by database, newest first: {db_name: [(datetime, path)]}."""
+    snapshots: Dict[str, List[tuple]] = {}
+    for entry in os.listdir(dest_dir):
+        match = SNAPSHOT_RE.match(entry)
+        if not match:
+            continue
+        taken = datetime.strptime(match.group('stamp'), TIMESTAMP_FORMAT)
+        snapshots.setdefault(match.group('db_name'), []).append((taken, os.path.join(dest_dir, entry)))
+    for entries in snapshots.values():
+        entries.sort(reverse=True)
+    return snapshots
+
+def prune_snapshots(dest_dir: str, keep_last: int = 10, keep_daily: int = 0,
+                    now: Optional[datetime] = None) -> List[str]:
+    """
+    Apply the retention policy and delete snapshots that fall outside it.
+
+    The newest keep_last snapshots of each database are always kept. On top of
+    that, the newest snapshot of each of the last keep_daily days is kept, so
+    older history thins out to one copy per day instead of disappearing.
+
+    Returns:
+        Paths of the deleted snapshots
+    """
+    now = now or datetime.now()
+    removed = []
+    for entries in list_snapshots(dest_dir).values():
+        keep = {path for _, path in entries[:keep_last]}
+        seen_days = set()
+        for taken, path in entries:
+            day = taken.date()
+            if now - taken <= timedelta(days=keep_daily) and day not in seen_days:
+                seen_days.add(day)
+                keep.add(path)
+        for _, path in entries:
+            if path not in keep:
+                os.remove(path)
+                removed.append(path)
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Online SQLite backup tool')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    parser.add_argument('--dest', required=True, help='Directory to write snapshots to')
+    parser.add_argument('--databases', nargs='+', help='Databases to back up (default: all)')
+    parser.add_argument('--compress', action='store_true', help='Gzip snapshots after verification')
+    parser.add_argument('--pages', type=int, default=256, help='Pages copied per backup step')
+    parser.add_argument('--pause', type=float, default=0.01, help='Seconds to sleep between steps')
+    parser.add_argument('--timestamp', help='Timestamp used in snapshot names (default: now)')
+    parser.add_argument('--keep-last', type=int, help='Prune to the newest N snapshots per database')
+    parser.add_argument('--keep-daily', type=int, default=0,
+                        help='Also keep one snapshot per day for this many days')
+    parser.add_argument('--verify', help='Only run an integrity check on an existing snapshot')
+    parser.add_argument('--manifest', help='Write the paths of the new snapshots to this file, one per line')
+
+    args = parser.parse_args()
+
+    if args.verify:
+        result = integrity_check(os.path.join(args.dest, args.verify))
+        print(f"{args.verify}: {result}")
+        sys.exit(0 if result == 'ok' else 1)
+
+    manager = DatabaseManager(data_dir=args.data_dir, initialize=False)
+    try:
+        results = backup_all(manager, args.dest, args.databases, compress=args.compress,
+                             pages=args.pages, pause=args.pause, timestamp=args.timestamp)
+    except (sqlite3.Error, RuntimeError) as e:
+        print(f"Backup failed: {e}")
+        sys.exit(1)
+
+    for result in results:
+        print(result.summary())
+    if args.manifest:
+        with open(args.manifest, 'w', encoding='utf-8') as f:
+            f.writelines(f'{result.path}\n' for result in results)
+
+    if args.keep_last is not None:
+        for path in prune_snapshots(args.dest, args.keep_last, args.keep_daily):
+            print(f"Pruned {Path(path).name}")
+
+if __name__ == "__main__":
+    run_main(main)
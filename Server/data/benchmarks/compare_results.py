@@ -0,0 +1,81 @@
+"""
+python benchmarks/compare_results.py results.json baseline.json
+python benchmarks/compare_results.py results.json baseline.json --threshold 0.25
+
+Compares a run of run_benchmarks.py against a stored baseline and flags every
+workload whose throughput dropped (or whose p99 latency grew) by more than the
+threshold. Exits with status 1 when a regression is found.
+"""
+
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+# metric -> True when bigger is better
+METRICS = {
+    'opsPerSec': True,
+    'rowsPerSec': True,
+    'p99Ms': False,
+}
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Return one entry per (scale, workload, metric) present in both reports."""
+    rows = []
+    for scale, workloads in current['scales'].items():
+        base_workloads = baseline['scales'].get(scale)
+        if not base_workloads:
+            continue
+        for workload, values in workloads.items():
+            base_values = base_workloads.get(workload)
+            if not isinstance(values, dict) or not isinstance(base_values, dict):
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if metric not in values or not base_values.get(metric):
+                    continue
+                change = (values[metric] - base_values[metric]) / base_values[metric]
+                regressed = change < -threshold if higher_is_better else change > threshold
+                rows.append({
+                    'scale': scale,
+                    'workload': workload,
+                    'metric': metric,
+                    'baseline': base_values[metric],
+                    'current': values[metric],
+                    'change': change,
+                    'regression': regressed,
+                })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag benchmark regressions against a baseline')
+    parser.add_argument('results', help='JSON output of run_benchmarks.py')
+    parser.add_argument('baseline', help='Baseline JSON output of run_benchmarks.py')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative change treated as a regression (default: 0.15)')
+    parser.add_argument('--json', action='store_true', help='Print the comparison as JSON')
+
+    args = parser.parse_args()
+
+    current = json.loads(Path(args.results).read_text())
+    baseline = json.loads(Path(args.baseline).read_text())
+    rows = compare(current, baseline, args.threshold)
+    regressions = [row for row in rows if row['regression']]
+
+    if args.json:
+        print(json.dumps({'threshold': args.threshold, 'comparisons': rows}, indent=2))
+    else:
+        print(f"{'Scale':<6} | {'Workload':<32} | {'Metric':<10} | {'Baseline':>12} | {'Current':>12} | {'Change':>8}")
+        print("-" * 96)
+        for row in rows:
+            flag = '  REGRESSION' if row['regression'] else ''
+            print(f"{row['scale']:<6} | {row['workload']:<32} | {row['metric']:<10} | "
+                  f"{row['baseline']:>12} | {row['current']:>12} | {row['change']:>+7.1%}{flag}")
+        print("-" * 96)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+python benchmarks/run_benchmarks.py --scales 10k 100k --output results.json
+python benchmarks/run_benchmarks.py --scales 10k --output baseline.json
+python benchmarks/compare_results.py results.json baseline.json
+
+Data layer benchmark suite. For each scale a fresh set of databases is built
+in a temporary directory from the synthetic generators
+(database_manager.generate_random_user, random_well_data below) and the DatabaseManager interfaces are timed on insert, point lookup, scan,
+update, token verify and aggregate workloads. Results are written as JSON.
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import string
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database_manager import DatabaseManager, generate_random_user  # noqa: E402
+from profiler import run_main  # noqa: E402
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+POINT_OPS = 5_000      # lookups/updates/verifies timed per workload
+ROW_INSERT_OPS = 1_000  # single-row create_* calls (one commit each) timed per scale
+
+def parse_scale(text: str) -> int:
+    text = text.lower()
+    if text in SCALES:
+        return SCALES[text]
+    return int(text)
+
+def benchmark_user(i: int) -> Dict[str, Any]:
+    """generate_random_user with index-based email/username so large scales don't collide."""
+    user = generate_random_user()
+    user['email'] = f"user_{i}@example.com"
+    user['username'] = f"user_{i}"
+    return user
+
+def random_well_data(i: int) -> Dict[str, Any]:
+    """
+    Input for create_well, shaped like wells_util.generate_random_well_data
+    (not imported: wells_util opens the databases in the working directory).
+    """
+    name = ''.join(random.choices(string.ascii_letters, k=8)).capitalize()
+    return {
+        'espId': f"ESP-{random.randint(1000, 9999)}-{''.join(random.choices(string.ascii_uppercase, k=2))}",
+        'wellName': f"{name} Well {i + 1}",
+        'wellOwner': f"{name} Water Co.",
+        'latitude': round(random.uniform(-90, 90), 6),
+        'longitude': round(random.uniform(-180, 180), 6),
+        'wellWaterType': random.choice(['Clean', 'Mineral', 'Spring', 'Artesian', 'Borehole']),
+        'wellCapacity': round(random.uniform(100.0, 1000.0), 2),
+        'wellWaterLevel': round(random.uniform(10.0, 100.0), 2),
+        'wellWaterConsumption': round(random.uniform(5.0, 100.0), 2),
+        'wellStatus': random.choice(['Active', 'Inactive', 'Maintenance', 'Unknown']),
+        'waterQuality': {
+            'ph': round(random.uniform(6.0, 8.5), 2),
+            'turbidity': round(random.uniform(0.1, 5.0), 2),
+            'tds': random.randint(50, 500)
+        },
+        'extraData': {
+            'description': f"Well installed in {random.randint(2010, 2023)}",
+            'contact': f"{random.randint(100, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}",
+            'notes': "Automatically generated test data"
+        }
+    }
+
+def benchmark_well_row(i: int, owner_ids: List[str]) -> Dict[str, Any]:
+    """A wells table row built from random_well_data, ready for bulk_insert."""
+    data = random_well_data(i)
+    return {
+        'name': data['wellName'],
+        'owner': data['wellOwner'],
+        'location': {'latitude': data['latitude'], 'longitude': data['longitude']},
+        'latitude': data['latitude'],
+        'longitude': data['longitude'],
+        'status': data['wellStatus'],
+        'espId': f"ESP-{i:07d}",
+        'wellWaterType': data['wellWaterType'],
+        'wellCapacity': data['wellCapacity'],
+        'wellWaterLevel': data['wellWaterLevel'],
+        'wellWaterConsumption': data['wellWaterConsumption'],
+        'waterQuality': data['waterQuality'],
+        'extraData': data['extraData'],
+        'last_update': datetime.now().isoformat(),
+        'ownerId': random.choice(owner_ids),
+    }
+
+def summarize(latencies: List[float], total_seconds: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        'ops': len(ordered),
+        'seconds': round(total_seconds, 4),
+        'opsPerSec': round(len(ordered) / total_seconds, 1) if total_seconds else 0.0,
+        'p50Ms': round(pct(0.50), 4),
+        'p95Ms': round(pct(0.95), 4),
+        'p99Ms': round(pct(0.99), 4),
+        'meanMs': round(statistics.fmean(ordered) * 1000, 4),
+    }
+
+def time_ops(func: Callable[[Any], Any], args: List[Any]) -> Dict[str, Any]:
+    """Call func once per arg, timing each call."""
+    latencies = []
+    start = time.perf_counter()
+    for arg in args:
+        t0 = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies, time.perf_counter() - start)
+
+def time_once(func: Callable[[], int]) -> Dict[str, Any]:
+    """Time one bulk call that returns the number of rows it handled."""
+    start = time.perf_counter()
+    rows = func()
+    seconds = time.perf_counter() - start
+    return {'rows': rows, 'seconds': round(seconds, 4), 'rowsPerSec': round(rows / seconds, 1) if seconds else 0.0}
+
+def run_scale(rows: int, seed: int) -> Dict[str, Any]:
+    random.seed(seed)
+    results: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(data_dir=tmp)
+        users = manager.users()
+        wells = manager.wells()
+        tokens = manager.deviceTokens()
+
+        # insert: bulk path for the fixture itself, single-row create_* on a sample
+        user_rows = [benchmark_user(i) for i in range(rows)]
+        user_ids = [u['userId'] for u in user_rows]
+        results['insert_users_bulk'] = time_once(lambda: users.bulk_insert('users', user_rows))
+        del user_rows
+        results['insert_wells_bulk'] = time_once(
+            lambda: wells.bulk_insert('wells', (benchmark_well_row(i, user_ids) for i in range(rows))))
+        token_rows = [{
+            'tokenId': str(uuid.uuid4()),
+            'userId': user_id,
+            'token': f"token-{i}",
+            'deviceType': random.choice(['android', 'ios']),
+            'lastUsed': datetime.now().isoformat(),
+            'isActive': random.random() < 0.9,
+        } for i, user_id in enumerate(user_ids)]
+        results['insert_tokens_bulk'] = time_once(lambda: tokens.bulk_insert('device_tokens', token_rows))
+
+        sample = [benchmark_user(rows + i) for i in range(ROW_INSERT_OPS)]
+        results['insert_user_single'] = time_ops(users.create_user, sample)
+        results['insert_well_single'] = time_ops(
+            wells.create_well, [random_well_data(i) for i in range(ROW_INSERT_OPS)])
+
+        # point lookup
+        lookup_ids = random.choices(user_ids, k=POINT_OPS)
+        results['lookup_user_by_id'] = time_ops(users.get_user, lookup_ids)
+        lookup_emails = [f"user_{random.randrange(rows)}@example.com" for _ in range(POINT_OPS)]
+        results['lookup_user_by_email'] = time_ops(users.get_user_by_email, lookup_emails)
+        results['lookup_well_by_id'] = time_ops(wells.get_well, [random.randint(1, rows) for _ in range(POINT_OPS)])
+        results['lookup_well_by_esp_id'] = time_ops(
+            wells.get_well_by_esp_id, [f"ESP-{random.randrange(rows):07d}" for _ in range(POINT_OPS)])
+
+        # scan
+        results['scan_users'] = time_once(lambda: len(users.get_all_users()))
+        results['scan_wells'] = time_once(lambda: len(wells.get_all_wells()))
+
+        # update
+        results['update_user'] = time_ops(
+            lambda user_id: users.update_user(user_id, {'lastActive': datetime.now().isoformat()}),
+            random.choices(user_ids, k=POINT_OPS))
+        results['update_well'] = time_ops(
+            lambda well_id: wells.update_well(well_id, {'wellWaterLevel': random.uniform(10, 100)}),
+            [random.randint(1, rows) for _ in range(POINT_OPS)])
+
+        # token verify
+        verify_indices = [random.randrange(rows) for _ in range(POINT_OPS)]
+        results['verify_token'] = time_ops(
+            lambda i: tokens.verify_token(user_ids[i], f"token-{i}"), verify_indices)
+
+        # aggregate
+        results['aggregate_wells_by_status'] = time_once(lambda: len(wells._execute('''
+            SELECT status, COUNT(*), AVG(wellWaterLevel), SUM(wellCapacity)
+            FROM wells GROUP BY status
+        ''').fetchall()))
+        results['aggregate_users_by_role'] = time_once(lambda: len(users._execute('''
+            SELECT role, COUNT(*), MAX(lastActive) FROM users GROUP BY role
+        ''').fetchall()))
+        results['aggregate_active_tokens_by_type'] = time_once(lambda: len(tokens._execute('''
+            SELECT deviceType, COUNT(*) FROM device_tokens WHERE isActive = 1 GROUP BY deviceType
+        ''').fetchall()))
+
+        for database in (users, wells, tokens):
+            database.conn.close()
+        results['fileSizesMB'] = {
+            name: round(os.path.getsize(config.path) / (1024 * 1024), 2)
+            for name, config in manager.databases.items()
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Data layer benchmark suite')
+    parser.add_argument('--scales', nargs='+', default=['10k'],
+                        help='Row counts to benchmark: 10k, 100k, 1m or a plain number')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout)')
+
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+        },
+        'scales': {},
+    }
+    for scale in args.scales:
+        rows = parse_scale(scale)
+        print(f"Running scale {scale} ({rows} rows)...", file=sys.stderr)
+        report['scales'][scale] = run_scale(rows, args.seed)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    run_main(main)
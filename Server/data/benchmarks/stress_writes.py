@@ -0,0 +1,182 @@
+"""
+python benchmarks/stress_writes.py --processes 8 --ops 500
+python benchmarks/stress_writes.py --processes 8 --ops 500 --max-total-wait 2 --output stress.json
+
+Concurrency stress test for the write paths. Several processes hammer the
+users, wells and deviceTokens databases at once (creates, updates, readings,
+token inserts and a shared counter every process increments), each through its
+own DatabaseManager with the given RetryPolicy. Afterwards every write a process
+reported as successful is checked against the files; the run fails (exit 1) if
+any write is missing or any operation gave up. Throughput, per-operation latency
+percentiles and lock-wait metrics are reported as JSON.
+"""
+
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database_manager import DatabaseManager  # noqa: E402
+from retry_policy import RetryPolicy  # noqa: E402
+from run_benchmarks import benchmark_user, summarize  # noqa: E402
+from profiler import run_main  # noqa: E402
+
+OPERATIONS = ['create_user', 'update_user', 'create_well', 'add_reading', 'add_token', 'increment_counter']
+
+def run_worker(process: int, data_dir: str, ops: int, policy_args: Dict[str, float]) -> Dict[str, Any]:
+    """One writer process: ops rounds of every operation; returns what it wrote and how long it took."""
+    policy = RetryPolicy(**policy_args)
+    manager = DatabaseManager(data_dir=data_dir, retry_policy=policy)
+    users, wells, tokens = manager.users(), manager.wells(), manager.deviceTokens()
+    latencies: Dict[str, List[float]] = {op: [] for op in OPERATIONS}
+    written = {'users': {}, 'wells': [], 'readings': 0, 'tokens': [], 'increments': 0}
+    failures: Dict[str, int] = {}
+
+    def timed(op: str, func) -> bool:
+        start = time.perf_counter()
+        try:
+            ok = bool(func())
+        except Exception:
+            ok = False
+        latencies[op].append(time.perf_counter() - start)
+        if not ok:
+            failures[op] = failures.get(op, 0) + 1
+        return ok
+
+    def increment() -> bool:
+        with wells.write_transaction():
+            return wells._execute('UPDATE wells SET wellCapacity = wellCapacity + 1 WHERE espId = ?',
+                                  ('STRESS-COUNTER',)).rowcount == 1
+
+    started = time.perf_counter()
+    for i in range(ops):
+        user = benchmark_user(process * 1_000_000 + i)
+        if timed('create_user', lambda: users.create_user(user)):
+            written['users'][user['userId']] = None
+        own = list(written['users'])
+        if own:
+            target = own[i % len(own)]
+            phone = f"{process}-{i}"
+            if timed('update_user', lambda: users.update_user(target, {'phoneNumber': phone})):
+                written['users'][target] = phone
+        esp_id = f"STRESS-{process}-{i}"
+        if timed('create_well', lambda: wells.create_well({'espId': esp_id, 'latitude': 0.0, 'longitude': 0.0})):
+            written['wells'].append(esp_id)
+        if timed('add_reading', lambda: wells.add_reading(0, {'waterLevel': process * 1_000_000 + i})):
+            written['readings'] += 1
+        token = f"stress-{process}-{i}"
+        if timed('add_token', lambda: tokens.add_token(user['userId'], token)):
+            written['tokens'].append(token)
+        if timed('increment_counter', increment):
+            written['increments'] += 1
+    seconds = time.perf_counter() - started
+
+    for database in (users, wells, tokens):
+        database.conn.close()
+    return {'latencies': latencies, 'written': written, 'failures': failures,
+            'seconds': seconds, 'lockStats': policy.stats.to_dict()}
+
+def verify(manager: DatabaseManager, results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Count writes reported as successful that are not in the databases."""
+    lost = {'users': 0, 'userUpdates': 0, 'wells': 0, 'readings': 0, 'tokens': 0, 'increments': 0}
+    users, wells, tokens = manager.users(), manager.wells(), manager.deviceTokens()
+    token_rows = {row['token'] for row in tokens._execute('SELECT token FROM device_tokens').fetchall()}
+    for result in results:
+        written = result['written']
+        for user_id, phone in written['users'].items():
+            row = users.get_user(user_id)
+            if row is None:
+                lost['users'] += 1
+            elif phone is not None and row['phoneNumber'] != phone:
+                lost['userUpdates'] += 1
+        lost['wells'] += sum(1 for esp_id in written['wells'] if wells.get_well_by_esp_id(esp_id) is None)
+        lost['tokens'] += sum(1 for token in written['tokens'] if token not in token_rows)
+    expected_readings = sum(r['written']['readings'] for r in results)
+    stored_readings = wells._execute('SELECT COUNT(*) FROM well_readings WHERE wellId = 0').fetchone()[0]
+    lost['readings'] = expected_readings - stored_readings
+    expected_increments = sum(r['written']['increments'] for r in results)
+    counter = wells.get_well_by_esp_id('STRESS-COUNTER')['wellCapacity']
+    lost['increments'] = expected_increments - int(counter)
+    for database in (users, wells, tokens):
+        database.conn.close()
+    return lost
+
+def merge_lock_stats(stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = {'operationsWaited': 0, 'retries': 0, 'gaveUp': 0, 'waitSeconds': 0.0, 'maxWaitSeconds': 0.0,
+              'buckets': {}}
+    for entry in stats:
+        for key in ('operationsWaited', 'retries', 'gaveUp', 'waitSeconds'):
+            merged[key] += entry[key]
+        merged['maxWaitSeconds'] = max(merged['maxWaitSeconds'], entry['maxWaitSeconds'])
+        for bound, count in entry['buckets'].items():
+            merged['buckets'][bound] = merged['buckets'].get(bound, 0) + count
+    merged['waitSeconds'] = round(merged['waitSeconds'], 6)
+    return merged
+
+def main():
+    parser = argparse.ArgumentParser(description='Multiprocess write stress test with lost-write check')
+    parser.add_argument('--processes', type=int, default=4, help='Concurrent writer processes')
+    parser.add_argument('--ops', type=int, default=200, help='Rounds of operations per process')
+    parser.add_argument('--busy-timeout', type=float, default=RetryPolicy.busy_timeout)
+    parser.add_argument('--base-delay', type=float, default=RetryPolicy.base_delay)
+    parser.add_argument('--max-delay', type=float, default=RetryPolicy.max_delay)
+    parser.add_argument('--max-total-wait', type=float, default=RetryPolicy.max_total_wait)
+    parser.add_argument('--output', help='Write the JSON report to this file (default: stdout)')
+
+    args = parser.parse_args()
+    policy_args = {'busy_timeout': args.busy_timeout, 'base_delay': args.base_delay,
+                   'max_delay': args.max_delay, 'max_total_wait': args.max_total_wait}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(data_dir=tmp)
+        setup = manager.wells()
+        setup.create_well({'espId': 'STRESS-COUNTER', 'wellCapacity': 0, 'latitude': 0.0, 'longitude': 0.0})
+        setup.conn.close()
+
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = [pool.submit(run_worker, p, tmp, args.ops, policy_args) for p in range(args.processes)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        lost = verify(manager, results)
+
+    total_ops = sum(len(r['latencies'][op]) for r in results for op in OPERATIONS)
+    failures: Dict[str, int] = {}
+    for result in results:
+        for op, count in result['failures'].items():
+            failures[op] = failures.get(op, 0) + count
+    report = {
+        'processes': args.processes,
+        'opsPerProcess': args.ops,
+        'retryPolicy': policy_args,
+        'seconds': round(elapsed, 4),
+        'opsPerSec': round(total_ops / elapsed, 1),
+        'operations': {
+            op: summarize([t for r in results for t in r['latencies'][op]], elapsed)
+            for op in OPERATIONS
+        },
+        'lockWaits': merge_lock_stats([r['lockStats'] for r in results]),
+        'failures': failures,
+        'lostWrites': lost,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    ok = not failures and not any(lost.values())
+    print(f"{'OK' if ok else 'FAILED'}: {total_ops} operations, {sum(failures.values())} failed, "
+          f"{sum(lost.values())} lost writes", file=sys.stderr)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    run_main(main)
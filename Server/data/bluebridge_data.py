@@ -0,0 +1,277 @@
+"""
+python bluebridge_data.py users delete --where role=test --dry-run
+python bluebridge_data.py wells update --status Inactive --where "lastUpdated<2024-01-01"
+python bluebridge_data.py tokens purge --inactive --unused-days 90 --json
+python bluebridge_data.py users list --where role=admin --order-by=-lastActive --limit 20 --columns userId email
+
+Non-interactive counterpart to users_util, wells_util and deviceToken_util for
+maintenance over many rows. Every update, delete or purge is a single set-based
+statement (one transaction), --dry-run only counts the rows it would touch, and
+--json prints a machine-readable result instead of text.
+
+--where takes KEY OP VALUE with OP one of = != < <= > >= ~ (LIKE); KEY is a
+column or a JSON key such as waterNeeds.type. VALUE null matches NULL,
+true/false are booleans, numbers are numbers, anything else is text. Repeated
+--where conditions are AND-ed. update and delete refuse to run without --where
+unless --all is given.
+
+wells commands run on every wells shard (see well_shards.py) and add up the
+counts; list merges the shards' rows in --order-by order (id by default).
+An update or delete is one transaction per shard.
+"""
+
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from database_manager import DatabaseManager, BaseDatabase, Query, WellDatabase, WellRouter
+from profiler import run_main
+
+TABLES = {
+    'users': DatabaseManager.users,
+    'wells': DatabaseManager.wells,
+    'tokens': DatabaseManager.deviceTokens,
+}
+CONDITION = re.compile(r'^\s*([A-Za-z0-9_.\[\]]+)\s*(!=|>=|<=|=|<|>|~)\s*(.*)$')
+OPERATORS = {'=': '', '!=': '__ne', '<': '__lt', '<=': '__lte', '>': '__gt', '>=': '__gte', '~': '__like'}
+
+def parse_value(text: str) -> Any:
+    """Turn a command-line value into None, a bool, a number or text."""
+    lowered = text.lower()
+    if lowered == 'null':
+        return None
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    # Only values that round-trip exactly become numbers, so '007' stays text
+    for kind in (int, float):
+        try:
+            value = kind(text)
+        except ValueError:
+            continue
+        if str(value) == text:
+            return value
+    return text
+
+def parse_condition(text: str) -> Tuple[str, Any]:
+    """'lastUpdated<2024-01-01' -> ('lastUpdated__lt', '2024-01-01')"""
+    match = CONDITION.match(text)
+    if not match:
+        raise ValueError(f"Cannot parse condition: {text!r} (expected KEY OP VALUE)")
+    key, op, value = match.groups()
+    return key + OPERATORS[op], parse_value(value)
+
+def parse_assignment(database: BaseDatabase, text: str) -> Tuple[str, Any]:
+    """'status=Inactive' -> ('status', 'Inactive'); JSON fields keep their text for canonical_json."""
+    column, sep, value = text.partition('=')
+    if not sep or not column:
+        raise ValueError(f"Cannot parse assignment: {text!r} (expected COLUMN=VALUE)")
+    column = column.strip()
+    return column, value if column in database.JSON_FIELDS else parse_value(value)
+
+def build_query(database: BaseDatabase, conditions: List[str]) -> Query:
+    return database.query().where(**dict(parse_condition(c) for c in conditions))
+
+def require_filter(args: argparse.Namespace):
+    if not args.where and not args.all:
+        raise ValueError(f"{args.command} without --where touches every row; pass --all to confirm")
+
+def run_list(database: BaseDatabase, args: argparse.Namespace) -> Dict[str, Any]:
+    query = build_query(database, args.where)
+    if args.order_by:
+        query = query.order_by(*args.order_by.split(','))
+    if args.columns:
+        query = query.select(*args.columns)
+    rows = query.limit(args.limit).all()
+    return {'rows': rows, 'count': len(rows)}
+
+def run_count(database: BaseDatabase, args: argparse.Namespace) -> Dict[str, Any]:
+    return {'matched': build_query(database, args.where).count()}
+
+def run_update(database: BaseDatabase, args: argparse.Namespace) -> Dict[str, Any]:
+    require_filter(args)
+    values = dict(parse_assignment(database, a) for a in args.set)
+    if getattr(args, 'status', None) is not None:
+        values['status'] = args.status
+    if not values:
+        raise ValueError('update needs at least one --set COLUMN=VALUE')
+    query = build_query(database, args.where)
+    result: Dict[str, Any] = {'set': values}
+    if args.dry_run:
+        result['matched'] = query.count()
+    else:
+        result['updated'] = query.update(**values)
+    return result
+
+def run_delete(database: BaseDatabase, args: argparse.Namespace) -> Dict[str, Any]:
+    require_filter(args)
+    query = build_query(database, args.where)
+    if args.dry_run:
+        return {'matched': query.count()}
+    return {'deleted': query.delete()}
+
+def run_purge(manager: DatabaseManager, args: argparse.Namespace) -> Dict[str, Any]:
+    unused_before = None
+    if args.unused_days is not None:
+        unused_before = (datetime.now() - timedelta(days=args.unused_days)).isoformat()
+    attached = manager.attached()
+    try:
+        count = attached.purge_tokens(inactive=args.inactive, unused_before=unused_before,
+                                      orphaned=args.orphaned, dry_run=args.dry_run)
+    finally:
+        attached.conn.close()
+    return {'matched' if args.dry_run else 'deleted': count}
+
+COMMANDS = {'list': run_list, 'count': run_count, 'update': run_update, 'delete': run_delete}
+COUNTS = ('matched', 'updated', 'deleted')
+
+def sqlite_order(value: Any) -> tuple:
+    """Sort key ordering mixed values like SQLite: NULL, numbers, text, blobs."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value) if isinstance(value, str) else (3, value)
+
+def list_wells(router: WellRouter, args: argparse.Namespace) -> Dict[str, Any]:
+    """list over every shard: each returns its first --limit rows with their sort keys, merged here."""
+    keys = args.order_by.split(',') if args.order_by else ['id']
+
+    def fetch(wells_db: WellDatabase) -> List[Tuple[tuple, Dict[str, Any]]]:
+        query = build_query(wells_db, args.where).order_by(*keys).limit(args.limit)
+        if args.columns:
+            query = query.select(*args.columns)
+        sort_columns = ', '.join(f'{query._expression(key.lstrip("-"))} AS sortKey{i}' for i, key in enumerate(keys))
+        columns = ', '.join(args.columns) if args.columns else '*'
+        rows = []
+        for row in wells_db._execute(*query.sql(f'{columns}, {sort_columns}')):
+            values = wells_db._row_to_dict(row)
+            rows.append((tuple(values.pop(f'sortKey{i}') for i in range(len(keys))), values))
+        return rows
+
+    rows = [row for shard_rows in router.map(fetch).values() for row in shard_rows]
+    for i in reversed(range(len(keys))):
+        rows.sort(key=lambda row: sqlite_order(row[0][i]), reverse=keys[i].startswith('-'))
+    rows = [values for _, values in rows[:args.limit]]
+    return {'rows': rows, 'count': len(rows)}
+
+def run_wells(manager: DatabaseManager, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run a wells command on every shard and add up the counts."""
+    with manager.well_router() as router:
+        if args.command == 'list':
+            return list_wells(router, args)
+        results = router.map(lambda wells_db: COMMANDS[args.command](wells_db, args))
+    combined: Dict[str, Any] = {}
+    for result in results.values():
+        for key, value in result.items():
+            combined[key] = combined.get(key, 0) + value if key in COUNTS else value
+    return combined
+
+def format_cell(value: Any) -> str:
+    if value is None:
+        return ''
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+def print_text(args: argparse.Namespace, result: Dict[str, Any]):
+    label = f"{args.table} {args.command}"
+    if args.command == 'list':
+        rows = result['rows']
+        if not rows:
+            print(f"{label}: no matching rows")
+            return
+        columns = list(rows[0])
+        print('\t'.join(columns))
+        for row in rows:
+            print('\t'.join(format_cell(row[c]) for c in columns))
+        print(f"{label}: {len(rows)} row(s)")
+    elif 'matched' in result:
+        prefix = 'would affect ' if args.command != 'count' else ''
+        print(f"{label}: {prefix}{result['matched']} row(s) ({result['seconds']:.3f}s)")
+    else:
+        action = 'updated' if 'updated' in result else 'deleted'
+        print(f"{label}: {action} {result[action]} row(s) ({result['seconds']:.3f}s)")
+
+def add_common(parser: argparse.ArgumentParser, where: bool = True, dry_run: bool = False):
+    if where:
+        parser.add_argument('--where', action='append', default=[], metavar='COND',
+                            help='Filter such as role=test or lastUpdated<2024-01-01 (repeatable)')
+    if dry_run:
+        parser.add_argument('--dry-run', action='store_true', help='Only count the matching rows')
+        parser.add_argument('--all', action='store_true', help='Allow running without --where')
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Set-based maintenance commands for the BlueBridge databases')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    tables = parser.add_subparsers(dest='table', required=True)
+    for table in TABLES:
+        table_parser = tables.add_parser(table, help=f'Commands on {table}')
+        commands = table_parser.add_subparsers(dest='command', required=True)
+
+        list_parser = commands.add_parser('list', help='Print matching rows')
+        add_common(list_parser)
+        list_parser.add_argument('--order-by', metavar='KEY[,KEY]',
+                                 help="Sort keys, '-key' for descending (write --order-by=-key)")
+        list_parser.add_argument('--columns', nargs='+', help='Only print these columns')
+        list_parser.add_argument('--limit', type=int, default=100, help='Maximum rows to print')
+
+        add_common(commands.add_parser('count', help='Count matching rows'))
+
+        update_parser = commands.add_parser('update', help='Set columns on every matching row')
+        add_common(update_parser, dry_run=True)
+        update_parser.add_argument('--set', action='append', default=[], metavar='COLUMN=VALUE',
+                                   help='Column to set (repeatable)')
+        if table == 'wells':
+            update_parser.add_argument('--status', help='Shorthand for --set status=STATUS')
+
+        add_common(commands.add_parser('delete', help='Delete every matching row'), dry_run=True)
+
+        if table == 'tokens':
+            purge_parser = commands.add_parser('purge', help='Delete inactive, stale or orphaned tokens')
+            add_common(purge_parser, where=False)
+            purge_parser.add_argument('--dry-run', action='store_true', help='Only count the matching tokens')
+            purge_parser.add_argument('--inactive', action='store_true', help='Tokens with isActive = 0')
+            purge_parser.add_argument('--unused-days', type=float, help='Tokens not used for this many days')
+            purge_parser.add_argument('--orphaned', action='store_true', help='Tokens whose user no longer exists')
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == 'purge' and not (args.inactive or args.orphaned or args.unused_days is not None):
+        parser.error('purge needs at least one of --inactive, --unused-days, --orphaned')
+
+    manager = DatabaseManager(data_dir=args.data_dir)
+    start = time.perf_counter()
+    try:
+        if args.command == 'purge':
+            result = run_purge(manager, args)
+        elif args.table == 'wells':
+            result = run_wells(manager, args)
+        else:
+            database = TABLES[args.table](manager)
+            try:
+                result = COMMANDS[args.command](database, args)
+            finally:
+                database.conn.close()
+    except ValueError as e:
+        parser.error(str(e))
+    except sqlite3.Error as e:
+        print(f"{args.table} {args.command} failed: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    result = {'table': args.table, 'command': args.command, 'where': getattr(args, 'where', []),
+              'dryRun': getattr(args, 'dry_run', False), **result,
+              'seconds': round(time.perf_counter() - start, 4)}
+    if args.json:
+        print(json.dumps(result, indent=2, default=str))
+    else:
+        print_text(args, result)
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,165 @@
+"""
+Transparent compression for large text columns.
+
+    python compress_columns.py enable wells.access_info --codec zlib
+    manager.wells().get_well(1)['access_info']   # plain text again
+
+Compressed columns are recorded in each database (compressed_columns table)
+and loaded into DatabaseConfig.compressed_columns, so every DatabaseManager
+writes and reads them the same way. A compressed value is stored as a BLOB:
+
+    b'BBZ' | codec (1 byte) | dictionary id (4 bytes, 0 = none) | compressed UTF-8 text
+
+BaseDatabase compresses on write; the connection's row factory decompresses
+any such BLOB on read, whatever the query. Plain TEXT is left alone, so a
+column may hold both while it is converted, and values written by clients that
+do not compress still read back. The reverse does not hold: the Node server
+reads the tables directly and would see the BLOBs, so the columns it reads
+(NODE_READ_FIELDS on each table interface) are never compressed. Values shorter than MIN_SIZE bytes, or that do
+not shrink, stay plain text.
+
+The codec is zlib, or zstd when the zstandard package is installed. Both can
+use a dictionary trained on sample values (zlib as a preset dictionary of the
+most frequent JSON fragments), which is what makes small JSON documents
+compress at all.
+"""
+
+
+import hashlib
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'BBZ'
+HEADER = struct.Struct('>3sBI')
+CODEC_IDS = {'zlib': 1, 'zstd': 2}
+CODEC_NAMES = {value: name for name, value in CODEC_IDS.items()}
+MIN_SIZE = 64
+ZLIB_DICTIONARY_LIMIT = 32768  # deflate only looks back 32 KiB
+
+# Keys with their colon, quoted strings and numbers: the repeated parts of JSON documents
+_FRAGMENT_RE = re.compile(rb'"(?:[^"\\]|\\.){1,64}"\s*:\s*|"(?:[^"\\]|\\.){1,64}"|-?\d+(?:\.\d+)?')
+
+def available_codecs() -> List[str]:
+    return ['zlib', 'zstd'] if zstandard else ['zlib']
+
+def default_codec() -> str:
+    return 'zstd' if zstandard else 'zlib'
+
+def dictionary_id(dictionary: bytes) -> int:
+    """Content-derived id, so dictionaries from different database files never clash on an attached connection."""
+    return int.from_bytes(hashlib.sha256(dictionary).digest()[:4], 'big') or 1
+
+def train_dictionary(samples: Iterable[str], codec: str, size: int = 16384) -> Optional[bytes]:
+    """Build a dictionary from sample values; None when there is too little to learn from."""
+    encoded = [s.encode('utf-8') for s in samples if s]
+    if len(encoded) < 10:
+        return None
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd needs the zstandard package')
+        return zstandard.train_dictionary(size, encoded).as_bytes()
+    # Fragments seen in several values, worth (length x extra occurrences); deflate
+    # finds matches near the end of the dictionary cheapest, so the best go last
+    counts = Counter()
+    for sample in encoded:
+        counts.update(set(_FRAGMENT_RE.findall(sample)))
+    ranked = sorted(((len(f) * (n - 1), f) for f, n in counts.items() if n > 1), reverse=True)
+    chosen, total = [], 0
+    for _, fragment in ranked:
+        if total + len(fragment) > min(size, ZLIB_DICTIONARY_LIMIT):
+            continue
+        chosen.append(fragment)
+        total += len(fragment)
+    return b''.join(reversed(chosen)) or None
+
+class ColumnCodec:
+    """Compresses the configured columns of one database and decompresses any compressed value."""
+
+    def __init__(self, columns: Dict[str, Dict[str, Tuple[str, int]]],
+                 dictionaries: Dict[int, bytes], level: Optional[int] = None):
+        """
+        Args:
+            columns: table -> {column: (codec name, dictionary id or 0)}
+            dictionaries: dictionary id -> dictionary bytes (every dictionary still referenced by stored values)
+            level: Compression level (default: the codec's own default)
+        """
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.level = level
+        self._local = threading.local()  # zstd (de)compressors are not thread-safe
+
+    def compressed(self, table: str, column: str) -> bool:
+        return column in self.columns.get(table, {})
+
+    def encode(self, table: str, column: str, value: Any) -> Any:
+        """Compress value if column is compressed and it pays off; anything else is returned unchanged."""
+        setting = self.columns.get(table, {}).get(column)
+        if setting is None or not isinstance(value, str) or len(value) < MIN_SIZE:
+            return value
+        codec, dict_id = setting
+        raw = value.encode('utf-8')
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError(f"{table}.{column} is zstd-compressed; writing it needs the zstandard package")
+            payload = self._zstd('compressor', dict_id).compress(raw)
+        else:
+            level = self.level if self.level is not None else zlib.Z_DEFAULT_COMPRESSION
+            compressor = zlib.compressobj(level, zdict=self.dictionaries[dict_id]) if dict_id else zlib.compressobj(level)
+            payload = compressor.compress(raw) + compressor.flush()
+        if len(payload) + HEADER.size >= len(raw):
+            return value
+        return HEADER.pack(MAGIC, CODEC_IDS[codec], dict_id) + payload
+
+    def encode_row(self, table: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of values with the table's compressed columns encoded."""
+        table_columns = self.columns.get(table)
+        if not table_columns or table_columns.keys().isdisjoint(values):
+            return values
+        return {column: self.encode(table, column, value) for column, value in values.items()}
+
+    def decode(self, value: Any) -> Any:
+        """Decompress a value written by encode; anything else is returned unchanged."""
+        if type(value) is not bytes or not value.startswith(MAGIC):
+            return value
+        _, codec_id, dict_id = HEADER.unpack_from(value)
+        payload = value[HEADER.size:]
+        codec = CODEC_NAMES.get(codec_id)
+        if dict_id and dict_id not in self.dictionaries:
+            raise ValueError(f"Compressed value needs missing dictionary {dict_id}")
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError('Reading zstd-compressed values needs the zstandard package')
+            raw = self._zstd('decompressor', dict_id).decompress(payload)
+        elif codec == 'zlib':
+            decompressor = zlib.decompressobj(zdict=self.dictionaries[dict_id]) if dict_id else zlib.decompressobj()
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        else:
+            raise ValueError(f"Unknown compression codec id {codec_id}")
+        return raw.decode('utf-8')
+
+    def row_factory(self, cursor, row: tuple):
+        """sqlite3 row factory: a sqlite3.Row with compressed values already decoded."""
+        if bytes in map(type, row):
+            row = tuple(self.decode(value) for value in row)
+        return sqlite3.Row(cursor, row)
+
+    def _zstd(self, kind: str, dict_id: int):
+        cache = self._local.__dict__.setdefault(kind, {})
+        if dict_id not in cache:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionaries[dict_id]) if dict_id else None
+            if kind == 'compressor':
+                cache[dict_id] = zstandard.ZstdCompressor(level=self.level if self.level is not None else 3,
+                                                          dict_data=dict_data)
+            else:
+                cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return cache[dict_id]
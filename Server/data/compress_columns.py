@@ -0,0 +1,258 @@
+"""
+python compress_columns.py report
+python compress_columns.py report --tables wells --sample 2000
+python compress_columns.py enable wells.access_info --codec zlib --batch-size 1000 --vacuum
+python compress_columns.py disable wells.access_info
+
+Turns on transparent compression for a column (see column_codec.py) and
+converts the rows already stored. report estimates, for every column that may
+be compressed, the bytes a codec would save and the CPU time it would add,
+from a random sample: compression ratio, microseconds per value to compress
+and decompress, and the decompression time added to a full scan of the column.
+Columns already compressed show their actual stored size.
+
+enable trains a dictionary on --sample values (unless --no-dictionary),
+records the setting in the database (in every wells shard for wells) and then
+rewrites existing rows in rowid batches, one transaction per batch, reporting bytes before/after and the CPU
+seconds spent. Running enable again retrains and re-encodes. disable stores
+the values as plain text again. Rewritten rows appear as updates in the
+change_log. Freed pages only return to the filesystem after VACUUM (--vacuum).
+For wells, report sizes and samples cover all shards together.
+"""
+
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List
+
+from column_codec import MIN_SIZE, ColumnCodec, available_codecs, default_codec, dictionary_id, train_dictionary
+from database_manager import BaseDatabase, DatabaseManager, TABLE_INTERFACES
+from profiler import run_main
+
+def _databases(manager: DatabaseManager, table: str) -> List[BaseDatabase]:
+    """An interface per database holding table (every shard for wells)."""
+    return [BaseDatabase(manager._get_connection(db_name), manager.stats, manager.retry_policy,
+                         manager.codecs.get(db_name))
+            for db_name in manager._databases_of(table)]
+
+def _close(databases: List[BaseDatabase]):
+    for database in databases:
+        database.conn.close()
+
+def sample_values(database: BaseDatabase, table: str, column: str, size: int) -> List[str]:
+    """Random non-empty values of a column (decompressed)."""
+    cursor = database._execute(f'''
+        SELECT {column} FROM {table} WHERE {column} IS NOT NULL AND {column} != '' ORDER BY random() LIMIT ?
+    ''', (size,))
+    return [row[0] for row in cursor if isinstance(row[0], str)]
+
+def sample_table(databases: List[BaseDatabase], table: str, column: str, size: int) -> List[str]:
+    """sample_values over several databases, each sampled in proportion to its values."""
+    counts = [database._execute(f'SELECT COUNT({column}) FROM {table}').fetchone()[0] for database in databases]
+    total = sum(counts)
+    values = []
+    for database, count in zip(databases, counts):
+        if count:
+            values.extend(sample_values(database, table, column, -(-size * count // total)))
+    random.shuffle(values)
+    return values[:size]
+
+def stored_size(databases: List[BaseDatabase], table: str, column: str) -> Dict[str, int]:
+    """Values, compressed values, stored bytes and average text value bytes of a column, over every database."""
+    totals = [0, 0, 0, 0, 0]
+    for database in databases:
+        row = database._execute(f'''
+            SELECT COUNT({column}), COUNT(CASE WHEN typeof({column}) = 'blob' THEN 1 END),
+                   COALESCE(SUM(length(CAST({column} AS BLOB))), 0),
+                   COUNT(CASE WHEN typeof({column}) = 'text' THEN 1 END),
+                   COALESCE(SUM(CASE WHEN typeof({column}) = 'text' THEN length(CAST({column} AS BLOB)) END), 0)
+            FROM {table}
+        ''').fetchone()
+        totals = [total + value for total, value in zip(totals, row)]
+    values, compressed, stored_bytes, texts, text_bytes = totals
+    return {'values': values, 'compressed': compressed, 'bytes': stored_bytes,
+            'averageTextBytes': round(text_bytes / texts, 1) if texts else 0}
+
+def estimate(values: List[str], codec: str, use_dictionary: bool, dictionary_size: int) -> Dict[str, Any]:
+    """Compress a sample with codec; half trains the dictionary, the other half is measured."""
+    random.shuffle(values)
+    training, measured = (values[:len(values) // 2], values[len(values) // 2:]) if use_dictionary else ([], values)
+    dictionary = train_dictionary(training, codec, dictionary_size) if training else None
+    dict_id = dictionary_id(dictionary) if dictionary else 0
+    column_codec = ColumnCodec({'t': {'c': (codec, dict_id)}}, {dict_id: dictionary} if dictionary else {})
+    raw_bytes = sum(len(value.encode('utf-8')) for value in measured)
+    start = time.process_time()
+    encoded = [column_codec.encode('t', 'c', value) for value in measured]
+    encode_seconds = time.process_time() - start
+    start = time.process_time()
+    for value in encoded:
+        column_codec.decode(value)
+    decode_seconds = time.process_time() - start
+    stored_bytes = sum(len(value) if isinstance(value, bytes) else len(value.encode('utf-8')) for value in encoded)
+    count = max(len(measured), 1)
+    return {
+        'codec': codec,
+        'dictionaryBytes': len(dictionary) if dictionary else 0,
+        'sampleValues': len(measured),
+        'ratio': round(stored_bytes / raw_bytes, 3) if raw_bytes else 1.0,
+        'encodeMicroseconds': round(encode_seconds / count * 1e6, 2),
+        'decodeMicroseconds': round(decode_seconds / count * 1e6, 2),
+    }
+
+def report(manager: DatabaseManager, tables: List[str], sample: int, dictionary_size: int) -> List[Dict[str, Any]]:
+    """
+    Per compressible column holding text worth compressing (or already
+    compressed): current size, and per codec the projected saving and added CPU.
+    """
+    rows = []
+    for table in tables:
+        configured = manager.databases[manager._database_of(table)].compressed_columns.get(table, {})
+        databases = _databases(manager, table)
+        try:
+            for column in manager.compressible_columns(table):
+                size = stored_size(databases, table, column)
+                if not size['compressed'] and size['averageTextBytes'] < MIN_SIZE:
+                    continue
+                entry = dict(size, table=table, column=column, codec=configured.get(column), estimates=[])
+                values = sample_table(databases, table, column, sample)
+                if values:
+                    average = sum(len(v.encode('utf-8')) for v in values) / len(values)
+                    for codec in available_codecs():
+                        for use_dictionary in (False, True):
+                            result = estimate(list(values), codec, use_dictionary, dictionary_size)
+                            if use_dictionary and not result['dictionaryBytes']:
+                                continue  # nothing repeats often enough to train on
+                            projected = average * size['values'] * result['ratio']
+                            result['projectedBytes'] = round(projected)
+                            result['projectedSavedBytes'] = round(average * size['values'] - projected)
+                            result['fullScanDecodeSeconds'] = round(result['decodeMicroseconds'] * size['values'] / 1e6, 4)
+                            entry['estimates'].append(result)
+                rows.append(entry)
+        finally:
+            _close(databases)
+    return rows
+
+def _convert_database(database: BaseDatabase, table: str, column: str, batch_size: int, totals: Dict[str, Any]):
+    last_rowid = -1
+    while True:
+        batch = database._execute(f'''
+            SELECT rowid, {column}, typeof({column}), length(CAST({column} AS BLOB)) FROM {table}
+            WHERE rowid > ? AND {column} IS NOT NULL ORDER BY rowid LIMIT ?
+        ''', (last_rowid, batch_size)).fetchall()
+        if not batch:
+            break
+        last_rowid = batch[-1][0]
+        updates = []
+        cpu_start = time.process_time()
+        for rowid, value, stored_type, stored_bytes in batch:
+            new = database._compress(table, {column: value})[column]
+            totals['bytesBefore'] += stored_bytes
+            totals['bytesAfter'] += len(new) if isinstance(new, bytes) else len(new.encode('utf-8'))
+            # Text that stays text is already in its final form
+            if isinstance(new, bytes) or stored_type == 'blob':
+                updates.append((new, rowid))
+        totals['encodeCpuSeconds'] += time.process_time() - cpu_start
+        if updates:
+            with database.write_transaction():
+                database.conn.executemany(f'UPDATE {table} SET {column} = ? WHERE rowid = ?', updates)
+            totals['rowsRewritten'] += len(updates)
+
+def convert(manager: DatabaseManager, table: str, column: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """Rewrite every stored value of table.column in its configured form (compressed, or plain text)."""
+    totals: Dict[str, Any] = {'rowsRewritten': 0, 'bytesBefore': 0, 'bytesAfter': 0, 'encodeCpuSeconds': 0.0}
+    start = time.perf_counter()
+    databases = _databases(manager, table)
+    try:
+        for database in databases:
+            _convert_database(database, table, column, batch_size, totals)
+    finally:
+        _close(databases)
+    return {'rowsRewritten': totals['rowsRewritten'], 'bytesBefore': totals['bytesBefore'],
+            'bytesAfter': totals['bytesAfter'], 'savedBytes': totals['bytesBefore'] - totals['bytesAfter'],
+            'encodeCpuSeconds': round(totals['encodeCpuSeconds'], 4), 'seconds': round(time.perf_counter() - start, 4)}
+
+def enable(manager: DatabaseManager, table: str, column: str, codec: str, use_dictionary: bool = True,
+           dictionary_size: int = 16384, sample: int = 2000, batch_size: int = 1000) -> Dict[str, Any]:
+    """Train a dictionary, record the setting and convert the existing rows."""
+    dictionary = None
+    if use_dictionary:
+        databases = _databases(manager, table)
+        try:
+            dictionary = train_dictionary(sample_table(databases, table, column, sample), codec, dictionary_size)
+        finally:
+            _close(databases)
+    manager.set_column_compression(table, column, codec, dictionary, dictionary_id(dictionary) if dictionary else 0)
+    result = convert(manager, table, column, batch_size)
+    result['dictionaryBytes'] = len(dictionary) if dictionary else 0
+    # Dictionaries of an earlier enable are no longer referenced once every row is re-encoded
+    result['droppedDictionaries'] = sum(manager.drop_unused_dictionaries(db_name) for db_name in manager._databases_of(table))
+    return result
+
+def disable(manager: DatabaseManager, table: str, column: str, batch_size: int = 1000) -> Dict[str, Any]:
+    """Stop compressing and store the existing values as plain text again."""
+    manager.set_column_compression(table, column, None)
+    result = convert(manager, table, column, batch_size)
+    result['droppedDictionaries'] = sum(manager.drop_unused_dictionaries(db_name) for db_name in manager._databases_of(table))
+    return result
+
+def vacuum(manager: DatabaseManager, table: str):
+    databases = _databases(manager, table)
+    try:
+        for database in databases:
+            database._execute('VACUUM')
+    finally:
+        _close(databases)
+
+def print_report(rows: List[Dict[str, Any]]):
+    for entry in rows:
+        state = f"compressed with {entry['codec']}" if entry['codec'] else 'plain text'
+        print(f"\n{entry['table']}.{entry['column']}: {entry['values']} value(s), {entry['bytes'] / 1024:.1f} KiB stored, "
+              f"{entry['compressed']} compressed ({state})")
+        for result in entry['estimates']:
+            label = f"{result['codec']}{' + dictionary' if result['dictionaryBytes'] else ''}"
+            print(f"  {label:<20} ratio {result['ratio']:<6} saves ~{result['projectedSavedBytes'] / 1024:.1f} KiB, "
+                  f"{result['encodeMicroseconds']}us/{result['decodeMicroseconds']}us per write/read, "
+                  f"+{result['fullScanDecodeSeconds']}s per full scan")
+
+def main():
+    parser = argparse.ArgumentParser(description='Compress large text columns and report the trade-off')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    report_parser = commands.add_parser('report', help='Estimate bytes saved against CPU time per column')
+    report_parser.add_argument('--tables', nargs='+', choices=list(TABLE_INTERFACES), default=list(TABLE_INTERFACES))
+    report_parser.add_argument('--sample', type=int, default=2000, help='Values sampled per column')
+    report_parser.add_argument('--dictionary-size', type=int, default=16384, help='Dictionary size in bytes')
+    for name, help_text in (('enable', 'Compress a column and convert its rows'),
+                            ('disable', 'Store a column as plain text again')):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('column', help='TABLE.COLUMN, e.g. wells.access_info')
+        command.add_argument('--batch-size', type=int, default=1000, help='Rows rewritten per transaction')
+        command.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to shrink the file')
+        if name == 'enable':
+            command.add_argument('--codec', choices=available_codecs(), default=default_codec())
+            command.add_argument('--no-dictionary', action='store_true', help='Compress without a trained dictionary')
+            command.add_argument('--dictionary-size', type=int, default=16384, help='Dictionary size in bytes')
+            command.add_argument('--sample', type=int, default=2000, help='Values the dictionary is trained on')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    if args.command == 'report':
+        print_report(report(manager, args.tables, args.sample, args.dictionary_size))
+        return
+
+    table, _, column = args.column.partition('.')
+    try:
+        if args.command == 'enable':
+            result = enable(manager, table, column, args.codec, not args.no_dictionary, args.dictionary_size,
+                            args.sample, args.batch_size)
+        else:
+            result = disable(manager, table, column, args.batch_size)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.vacuum:
+        vacuum(manager, table)
+    print(', '.join(f'{key}={value}' for key, value in result.items()))
+
+if __name__ == "__main__":
+    run_main(main)
@@ -1,23 +1,179 @@
 import sqlite3
 import json
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Union
-from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Union, Iterable, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import uuid
 import re
 import random
+import math
+import threading
+import time
+import zlib
+
+from column_codec import ColumnCodec, available_codecs
+from query_stats import QueryStats, InstrumentedCursor, process_stats
+from retry_policy import RetryPolicy, is_busy
 
 @dataclass
 class DatabaseConfig:
     path: str
     schema: Dict[str, str]  # table_name -> create_table_sql
+    search_tables: List[str] = field(default_factory=list)  # FTS5 tables rebuilt when first created
+    tracked_tables: Dict[str, str] = field(default_factory=dict)  # table_name -> key column logged in change_log
+    json_columns: Dict[str, List['JsonColumn']] = field(default_factory=dict)  # table_name -> generated columns
+    # table_name -> {column: codec}; loaded from the database's compressed_columns table, see column_codec.py
+    compressed_columns: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+@dataclass
+class JsonColumn:
+    """A virtual generated column exposing one path of a JSON text column, optionally indexed."""
+    name: str
+    source: str  # JSON text column
+    path: str  # JSON path inside source, e.g. '$.type'
+    type: str = 'TEXT'
+    indexed: bool = True
+    fallback: Optional[str] = None  # second JSON column read when source has no value
+
+    @property
+    def key(self) -> str:
+        """Filter key accepted by the getters, e.g. 'waterNeeds.type'."""
+        return self.source + self.path[1:]
+
+    def expression(self) -> str:
+        # json_extract raises on malformed JSON, which would break every write to the row
+        extract = "CASE WHEN json_valid({0}) THEN json_extract({0}, '{1}') END"
+        sql = extract.format(self.source, self.path)
+        if self.fallback:
+            sql = f"COALESCE({sql}, {extract.format(self.fallback, self.path)})"
+        return sql
+
+def fts_schema(fts_table: str, content_table: str, columns: List[str]) -> Dict[str, str]:
+    """Build an external-content FTS5 table over content_table plus the triggers keeping it in sync."""
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    insert_sql = f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.rowid, {new_values});"
+    delete_sql = f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.rowid, {old_values});"
+    return {
+        fts_table: f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                {cols},
+                content='{content_table}',
+                content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''',
+        f'{fts_table}_insert': f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_insert AFTER INSERT ON {content_table} BEGIN
+                {insert_sql}
+            END
+        ''',
+        f'{fts_table}_delete': f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_delete AFTER DELETE ON {content_table} BEGIN
+                {delete_sql}
+            END
+        ''',
+        f'{fts_table}_update': f'''
+            CREATE TRIGGER IF NOT EXISTS {fts_table}_update AFTER UPDATE OF {cols} ON {content_table} BEGIN
+                {delete_sql}
+                {insert_sql}
+            END
+        ''',
+    }
+
+def compression_schema() -> Dict[str, str]:
+    """Build the tables recording which columns are compressed and with which dictionary."""
+    return {
+        'compressed_columns': '''
+            CREATE TABLE IF NOT EXISTS compressed_columns (
+                tableName TEXT NOT NULL,
+                columnName TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                dictionaryId INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (tableName, columnName)
+            ) WITHOUT ROWID
+        ''',
+        'compression_dictionaries': '''
+            CREATE TABLE IF NOT EXISTS compression_dictionaries (
+                dictionaryId INTEGER PRIMARY KEY,
+                codec TEXT NOT NULL,
+                dictionary BLOB NOT NULL,
+                createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''',
+    }
+
+def change_log_schema(tracked_tables: Dict[str, str]) -> Dict[str, str]:
+    """Build the change_log table plus the triggers recording every insert/update/delete on tracked_tables."""
+    schema = {
+        'change_log': '''
+            CREATE TABLE IF NOT EXISTS change_log (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                tableName TEXT NOT NULL,
+                rowKey NOT NULL,
+                operation TEXT NOT NULL,
+                changedAt TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+            )
+        ''',
+        'change_log_key_idx': '''
+            CREATE INDEX IF NOT EXISTS change_log_key_idx ON change_log (tableName, rowKey)
+        ''',
+        'change_log_state': '''
+            CREATE TABLE IF NOT EXISTS change_log_state (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''',
+    }
+    for table, key in tracked_tables.items():
+        log = f"INSERT INTO change_log (tableName, rowKey, operation) VALUES ('{table}'"
+        log_select = f"INSERT INTO change_log (tableName, rowKey, operation) SELECT '{table}'"
+        schema[f'{table}_changes_insert'] = f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_insert AFTER INSERT ON {table} BEGIN
+                {log}, new.{key}, 'insert');
+            END
+        '''
+        schema[f'{table}_changes_update'] = f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_update AFTER UPDATE ON {table} BEGIN
+                {log_select}, old.{key}, 'delete' WHERE old.{key} IS NOT new.{key};
+                {log}, new.{key}, 'update');
+            END
+        '''
+        schema[f'{table}_changes_delete'] = f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_changes_delete AFTER DELETE ON {table} BEGIN
+                {log}, old.{key}, 'delete');
+            END
+        '''
+    return schema
 
 class DatabaseManager:
-    def __init__(self):
+    # The wells database is the default shard; extra shards are listed in its well_shards table
+    DEFAULT_WELL_SHARD = 'wells'
+    # Tables only the default shard holds: the shard map and the map cluster pyramid
+    WELLS_DEFAULT_ONLY = {'well_shards', 'well_regions', 'well_cluster_members', 'well_cluster_members_cell_idx',
+                          'well_clusters'}
+
+    def __init__(self, data_dir: Optional[str] = None, retry_policy: Optional[RetryPolicy] = None,
+                 initialize: bool = True):
+        """
+        Args:
+            data_dir: Directory holding the .sqlite files (default: current directory)
+            retry_policy: How to retry on a locked database (default: RetryPolicy())
+            initialize: Create missing tables, indexes and triggers. False only reads the
+                configuration (the wells shard map included) and writes nothing, e.g. for backups
+        """
+        self.stats: Optional[QueryStats] = None
+        self.replica: Optional['ReadReplica'] = None
+        self.retry_policy: Optional[RetryPolicy] = retry_policy or RetryPolicy()
+        self.data_dir = data_dir
         self.databases = {
             'users': DatabaseConfig(
-                path='users.sqlite',
+                path=self._path('users.sqlite'),
                 schema={
                     'users': '''
                         CREATE TABLE IF NOT EXISTS users (
@@ -41,11 +197,32 @@ class DatabaseManager:
                             createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                             updatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                         )
-                    '''
-                }
+                    ''',
+                    'users_role_idx': 'CREATE INDEX IF NOT EXISTS users_role_idx ON users (role)',
+                    'users_last_active_idx': 'CREATE INDEX IF NOT EXISTS users_last_active_idx ON users (lastActive)',
+                    # Filled by nearest_wells.py; wellId refers to wells.sqlite
+                    'user_nearest_wells': '''
+                        CREATE TABLE IF NOT EXISTS user_nearest_wells (
+                            userId TEXT NOT NULL,
+                            rank INTEGER NOT NULL,
+                            wellId INTEGER NOT NULL,
+                            distanceKm REAL NOT NULL,
+                            PRIMARY KEY (userId, rank)
+                        ) WITHOUT ROWID
+                    ''',
+                    'user_nearest_wells_well_idx': '''
+                        CREATE INDEX IF NOT EXISTS user_nearest_wells_well_idx ON user_nearest_wells (wellId)
+                    ''',
+                    **fts_schema('users_fts', 'users', UserDatabase.SEARCH_FIELDS),
+                    **compression_schema(),
+                    **change_log_schema({'users': 'userId'})
+                },
+                search_tables=['users_fts'],
+                tracked_tables={'users': 'userId'},
+                json_columns={'users': UserDatabase.JSON_COLUMNS}
             ),
             'wells': DatabaseConfig(
-                path='wells.sqlite',
+                path=self._path('wells.sqlite'),
                 schema={
                     'wells': '''
                         CREATE TABLE IF NOT EXISTS wells (
@@ -77,11 +254,83 @@ class DatabaseManager:
                             lastUpdated TIMESTAMP,
                             ownerId INTEGER
                         )
-                    '''
-                }
+                    ''',
+                    'well_readings': '''
+                        CREATE TABLE IF NOT EXISTS well_readings (
+                            id INTEGER PRIMARY KEY,
+                            wellId INTEGER NOT NULL,
+                            recordedAt TIMESTAMP NOT NULL,
+                            waterLevel REAL,
+                            waterConsumption REAL,
+                            ph REAL,
+                            turbidity REAL,
+                            tds REAL
+                        )
+                    ''',
+                    'well_readings_well_idx': '''
+                        CREATE INDEX IF NOT EXISTS well_readings_well_idx ON well_readings (wellId, recordedAt)
+                    ''',
+                    'wells_status_idx': 'CREATE INDEX IF NOT EXISTS wells_status_idx ON wells (status)',
+                    'wells_owner_idx': 'CREATE INDEX IF NOT EXISTS wells_owner_idx ON wells (ownerId)',
+                    'wells_last_update_idx': 'CREATE INDEX IF NOT EXISTS wells_last_update_idx ON wells (last_update)',
+                    # Map cluster pyramid filled by well_clusters.py, see WellDatabase.clusters
+                    'well_cluster_members': '''
+                        CREATE TABLE IF NOT EXISTS well_cluster_members (
+                            wellId INTEGER PRIMARY KEY,
+                            cellX INTEGER NOT NULL,
+                            cellY INTEGER NOT NULL,
+                            latitude REAL NOT NULL,
+                            longitude REAL NOT NULL,
+                            status TEXT NOT NULL
+                        )
+                    ''',
+                    'well_cluster_members_cell_idx': '''
+                        CREATE INDEX IF NOT EXISTS well_cluster_members_cell_idx ON well_cluster_members (cellX, cellY)
+                    ''',
+                    'well_clusters': '''
+                        CREATE TABLE IF NOT EXISTS well_clusters (
+                            zoom INTEGER NOT NULL,
+                            cellX INTEGER NOT NULL,
+                            cellY INTEGER NOT NULL,
+                            status TEXT NOT NULL,
+                            count INTEGER NOT NULL,
+                            sumLatitude REAL NOT NULL,
+                            sumLongitude REAL NOT NULL,
+                            wellId INTEGER NOT NULL,
+                            PRIMARY KEY (zoom, cellX, cellY, status)
+                        ) WITHOUT ROWID
+                    ''',
+                    # Shard map read by DatabaseManager and WellRouter, see well_shards.py
+                    'well_shards': '''
+                        CREATE TABLE IF NOT EXISTS well_shards (
+                            name TEXT PRIMARY KEY,
+                            filename TEXT NOT NULL,
+                            createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    ''',
+                    'well_regions': '''
+                        CREATE TABLE IF NOT EXISTS well_regions (
+                            region TEXT PRIMARY KEY,
+                            shard TEXT NOT NULL,
+                            kind TEXT NOT NULL CHECK (kind IN ('bbox', 'hash')),
+                            minLatitude REAL,
+                            minLongitude REAL,
+                            maxLatitude REAL,
+                            maxLongitude REAL,
+                            hashBucket INTEGER,
+                            hashBuckets INTEGER
+                        )
+                    ''',
+                    **fts_schema('wells_fts', 'wells', WellDatabase.SEARCH_FIELDS),
+                    **compression_schema(),
+                    **change_log_schema({'wells': 'id'})
+                },
+                search_tables=['wells_fts'],
+                tracked_tables={'wells': 'id'},
+                json_columns={'wells': WellDatabase.JSON_COLUMNS}
             ),
             'deviceTokens': DatabaseConfig(
-                path='deviceTokens.sqlite',
+                path=self._path('deviceTokens.sqlite'),
                 schema={
                     'device_tokens': '''
                         CREATE TABLE IF NOT EXISTS device_tokens (
@@ -93,60 +342,877 @@ class DatabaseManager:
                             isActive BOOLEAN DEFAULT 1,
                             FOREIGN KEY (userId) REFERENCES users(userId)
                         )
-                    '''
+                    ''',
+                    'device_tokens_user_idx': '''
+                        CREATE INDEX IF NOT EXISTS device_tokens_user_idx ON device_tokens (userId, isActive)
+                    ''',
+                    **compression_schema(),
+                    **change_log_schema({'device_tokens': 'tokenId'})
+                },
+                tracked_tables={'device_tokens': 'tokenId'}
+            ),
+            # Columnar blocks of old well_readings moved out by readings_archive.py
+            'readingsArchive': DatabaseConfig(
+                path=self._path('readingsArchive.sqlite'),
+                schema={
+                    'reading_blocks': '''
+                        CREATE TABLE IF NOT EXISTS reading_blocks (
+                            blockId INTEGER PRIMARY KEY,
+                            wellId INTEGER NOT NULL,
+                            startTime INTEGER NOT NULL,
+                            endTime INTEGER NOT NULL,
+                            count INTEGER NOT NULL,
+                            data BLOB NOT NULL,
+                            archivedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    ''',
+                    'reading_blocks_well_idx': '''
+                        CREATE INDEX IF NOT EXISTS reading_blocks_well_idx ON reading_blocks (wellId, startTime)
+                    ''',
                 }
             )
         }
-        self._initialize_databases()
+        self.codecs: Dict[str, ColumnCodec] = {}
+        self.initialize = initialize
+        if initialize:
+            self._initialize_databases()
+            for db_name in self.databases:
+                self._load_compression(db_name)
+        self._load_well_shards()
+
+    def _path(self, filename: str) -> str:
+        """Resolve a database file name against data_dir."""
+        return str(Path(self.data_dir) / filename) if self.data_dir else filename
 
     def _initialize_databases(self):
         """Initialize all databases and create tables if they don't exist."""
         for db_name, config in self.databases.items():
+            self._initialize_with_retry(db_name, config)
+
+    def _initialize_with_retry(self, db_name: str, config: DatabaseConfig):
+        try:
+            if self.retry_policy:
+                # Every statement is IF NOT EXISTS, so a locked attempt can simply be repeated
+                self.retry_policy.run(lambda: self._initialize_database(db_name, config))
+            else:
+                self._initialize_database(db_name, config)
+        except sqlite3.Error as e:
+            print(f"Error initializing database {db_name}: {str(e)}")
+
+    def _initialize_database(self, db_name: str, config: DatabaseConfig):
+        with closing(self._get_connection(db_name)) as conn, conn:
+            cursor = conn.cursor()
+            existing = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master")}
+            for table_name, schema in config.schema.items():
+                cursor.execute(schema)
+            for table_name, json_columns in config.json_columns.items():
+                self._add_json_columns(cursor, table_name, json_columns)
+            # Index rows that predate a newly created search table
+            for fts_table in config.search_tables:
+                if fts_table not in existing:
+                    cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+    def _load_compression(self, db_name: str):
+        """Read a database's compressed columns and dictionaries into its config and codec."""
+        config = self.databases[db_name]
+        if 'compressed_columns' not in config.schema:
+            return
+        conn = sqlite3.connect(config.path, timeout=self._busy_timeout())
+        try:
+            settings = conn.execute('SELECT tableName, columnName, codec, dictionaryId FROM compressed_columns').fetchall()
+            dictionaries = dict(conn.execute('SELECT dictionaryId, dictionary FROM compression_dictionaries').fetchall())
+        except sqlite3.Error as e:
+            print(f"Error loading compression settings for {db_name}: {str(e)}")
+            return
+        finally:
+            conn.close()
+        columns: Dict[str, Dict[str, tuple]] = {}
+        config.compressed_columns = {}
+        for table, column, codec, dict_id in settings:
+            columns.setdefault(table, {})[column] = (codec, dict_id)
+            config.compressed_columns.setdefault(table, {})[column] = codec
+        if columns or dictionaries:
+            self.codecs[db_name] = ColumnCodec(columns, dictionaries)
+        else:
+            self.codecs.pop(db_name, None)
+
+    def compressible_columns(self, table: str) -> List[str]:
+        """
+        Columns of table that may be compressed: everything except the key, the
+        columns SQL has to read as text (generated JSON columns, full-text
+        search, json_extract in the data tools) and the columns the Node server
+        reads (NODE_READ_FIELDS).
+        """
+        interface = TABLE_INTERFACES.get(table)
+        if interface is None:
+            raise ValueError(f"Unknown table: {table}")
+        excluded = {interface.KEY_COLUMN, *getattr(interface, 'SEARCH_FIELDS', []), *interface.SQL_READ_FIELDS,
+                    *interface.NODE_READ_FIELDS}
+        for column in interface.JSON_COLUMNS:
+            excluded.update((column.source, column.fallback))
+        with closing(self._get_connection(self._database_of(table))) as conn:
+            columns = BaseDatabase(conn).table_columns(table)
+        return [column for column in columns if column not in excluded]
+
+    def set_column_compression(self, table: str, column: str, codec: Optional[str],
+                               dictionary: Optional[bytes] = None, dictionary_id: int = 0):
+        """
+        Record that new values of table.column are compressed with codec (None
+        stops compressing), in every database holding the table (each wells
+        shard). Existing rows are not touched; compress_columns.py converts them.
+        """
+        if codec is not None:
+            if codec not in available_codecs():
+                raise ValueError(f"Compression codec {codec} is not available (have: {', '.join(available_codecs())})")
+            if column in getattr(TABLE_INTERFACES.get(table), 'NODE_READ_FIELDS', []):
+                raise ValueError(f"{table}.{column} cannot be compressed: the Node server reads it")
+            if column not in self.compressible_columns(table):
+                raise ValueError(f"{table}.{column} cannot be compressed: SQL reads it as text (or it does not exist)")
+        for db_name in self._databases_of(table):
+            with closing(self._get_connection(db_name)) as conn:
+                database = BaseDatabase(conn, self.stats, self.retry_policy)
+                with database.write_transaction():
+                    if dictionary is not None:
+                        conn.execute('''
+                            INSERT OR IGNORE INTO compression_dictionaries (dictionaryId, codec, dictionary)
+                            VALUES (?, ?, ?)
+                        ''', (dictionary_id, codec, dictionary))
+                    if codec is None:
+                        conn.execute('DELETE FROM compressed_columns WHERE tableName = ? AND columnName = ?',
+                                     (table, column))
+                    else:
+                        conn.execute('''
+                            INSERT OR REPLACE INTO compressed_columns (tableName, columnName, codec, dictionaryId)
+                            VALUES (?, ?, ?, ?)
+                        ''', (table, column, codec, dictionary_id))
+            self._load_compression(db_name)
+
+    def drop_unused_dictionaries(self, db_name: str) -> int:
+        """Delete the dictionaries no column uses any more; only safe once no stored value needs them."""
+        with closing(self._get_connection(db_name)) as conn:
+            dropped = BaseDatabase(conn, self.stats, self.retry_policy)._execute_write('''
+                DELETE FROM compression_dictionaries
+                WHERE dictionaryId NOT IN (SELECT dictionaryId FROM compressed_columns)
+            ''').rowcount
+        self._load_compression(db_name)
+        return dropped
+
+    def _load_well_shards(self):
+        """Register the extra wells shards recorded in the default shard."""
+        path = self.databases[self.DEFAULT_WELL_SHARD].path
+        if not self.initialize and not Path(path).exists():
+            return
+        connect = self._get_connection if self.initialize else (
+            lambda db_name: sqlite3.connect(f'file:{path}?mode=ro', uri=True))
+        with closing(connect(self.DEFAULT_WELL_SHARD)) as conn:
             try:
-                with self._get_connection(db_name) as conn:
-                    cursor = conn.cursor()
-                    for table_name, schema in config.schema.items():
-                        cursor.execute(schema)
-                    conn.commit()
+                shards = conn.execute('SELECT name, filename FROM well_shards ORDER BY rowid').fetchall()
             except sqlite3.Error as e:
-                print(f"Error initializing database {db_name}: {str(e)}")
+                print(f"Error loading well shards: {str(e)}")
+                return
+        for name, filename in shards:
+            self._register_well_shard(name, filename)
+
+    def _register_well_shard(self, name: str, filename: str):
+        """Add a shard as its own database with the wells schema (tables and change_log included)."""
+        default = self.databases[self.DEFAULT_WELL_SHARD]
+        config = DatabaseConfig(
+            path=self._path(filename),
+            schema={k: v for k, v in default.schema.items() if k not in self.WELLS_DEFAULT_ONLY},
+            search_tables=list(default.search_tables),
+            tracked_tables=dict(default.tracked_tables),
+            json_columns=default.json_columns
+        )
+        self.databases[name] = config
+        if self.initialize:
+            self._initialize_with_retry(name, config)
+            self._load_compression(name)
+
+    def well_shards(self) -> List[str]:
+        """Database names of every wells shard, the default shard first."""
+        return [self.DEFAULT_WELL_SHARD] + [db_name for db_name in self.databases if db_name.startswith('wells_')]
+
+    def add_well_shard(self, name: str) -> str:
+        """
+        Create a wells shard in wells_<name>.sqlite and record it in the shard
+        map. It receives wells once a region routes to it (see well_shards.py).
+
+        Returns:
+            The shard's database name, wells_<name>
+        """
+        if not re.fullmatch(r'[A-Za-z0-9]+', name):
+            raise ValueError(f"Shard names are letters and digits only: {name!r}")
+        db_name = f'wells_{name}'
+        if db_name in self.databases:
+            raise ValueError(f"Shard {db_name} already exists")
+        with closing(self._get_connection(self.DEFAULT_WELL_SHARD)) as conn:
+            BaseDatabase(conn, self.stats, self.retry_policy)._execute_write(
+                'INSERT INTO well_shards (name, filename) VALUES (?, ?)', (db_name, f'{db_name}.sqlite'))
+        self._register_well_shard(db_name, f'{db_name}.sqlite')
+        self._copy_compression(self.DEFAULT_WELL_SHARD, db_name)
+        return db_name
+
+    def _copy_compression(self, source: str, dest: str):
+        """Compress the same columns in dest as in source, with the same dictionaries."""
+        with closing(self._get_connection(source)) as conn:
+            settings = conn.execute('SELECT tableName, columnName, codec, dictionaryId FROM compressed_columns').fetchall()
+            dictionaries = conn.execute('SELECT dictionaryId, codec, dictionary FROM compression_dictionaries').fetchall()
+        if not settings and not dictionaries:
+            return
+        with closing(self._get_connection(dest)) as conn:
+            with BaseDatabase(conn, self.stats, self.retry_policy).write_transaction():
+                conn.executemany('INSERT OR IGNORE INTO compression_dictionaries (dictionaryId, codec, dictionary) '
+                                 'VALUES (?, ?, ?)', [tuple(row) for row in dictionaries])
+                conn.executemany('INSERT OR REPLACE INTO compressed_columns (tableName, columnName, codec, dictionaryId) '
+                                 'VALUES (?, ?, ?, ?)', [tuple(row) for row in settings])
+        self._load_compression(dest)
+
+    def well_regions(self) -> List[Dict[str, Any]]:
+        """The routing rules of the shard map, see WellRouter.shard_for."""
+        with closing(self._get_connection(self.DEFAULT_WELL_SHARD)) as conn:
+            return [dict(row) for row in conn.execute('SELECT * FROM well_regions ORDER BY region')]
+
+    def set_well_region(self, region: str, shard: str, bbox: Optional[Tuple[float, float, float, float]] = None,
+                        bucket: Optional[Tuple[int, int]] = None):
+        """
+        Route a region to a shard. Wells already stored stay where they are until
+        well_shards.py place (or move-region) moves them.
+
+        Args:
+            region: Region name
+            shard: Database name of the shard (see well_shards())
+            bbox: (min latitude, min longitude, max latitude, max longitude); min
+                longitude greater than max longitude crosses the antimeridian
+            bucket: (bucket, buckets) - wells whose crc32(espId) % buckets == bucket
+        """
+        if shard not in self.well_shards():
+            raise ValueError(f"Unknown well shard: {shard}")
+        if (bbox is None) == (bucket is None):
+            raise ValueError('A region is either a bbox or a hash bucket')
+        if bucket is not None and not 0 <= bucket[0] < bucket[1]:
+            raise ValueError(f"Hash bucket must be in 0..{bucket[1] - 1}")
+        if bbox is not None and not (-90 <= bbox[0] <= bbox[2] <= 90 and all(-180 <= lon <= 180 for lon in bbox[1::2])):
+            raise ValueError(f"Invalid bbox: {bbox}")
+        with closing(self._get_connection(self.DEFAULT_WELL_SHARD)) as conn:
+            BaseDatabase(conn, self.stats, self.retry_policy)._execute_write('''
+                INSERT OR REPLACE INTO well_regions (region, shard, kind, minLatitude, minLongitude, maxLatitude,
+                                                     maxLongitude, hashBucket, hashBuckets)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (region, shard, 'bbox' if bbox else 'hash', *(bbox or (None,) * 4), *(bucket or (None, None))))
+
+    def remove_well_region(self, region: str) -> bool:
+        """Drop a routing rule; its wells route to the default shard from then on."""
+        with closing(self._get_connection(self.DEFAULT_WELL_SHARD)) as conn:
+            return BaseDatabase(conn, self.stats, self.retry_policy)._execute_write(
+                'DELETE FROM well_regions WHERE region = ?', (region,)).rowcount > 0
+
+    def well_router(self, max_workers: Optional[int] = None) -> 'WellRouter':
+        """Get the sharded wells interface: point operations go to one shard, scans run on all in parallel."""
+        return WellRouter(self, max_workers)
+
+    def _database_of(self, table: str) -> str:
+        for db_name, config in self.databases.items():
+            if table in config.schema:
+                return db_name
+        raise ValueError(f"Unknown table: {table}")
+
+    def _databases_of(self, table: str) -> List[str]:
+        """Every database holding table: each wells shard for the sharded wells tables."""
+        db_name = self._database_of(table)
+        if db_name != self.DEFAULT_WELL_SHARD:
+            return [db_name]
+        return [shard for shard in self.well_shards() if table in self.databases[shard].schema]
+
+    @staticmethod
+    def _add_json_columns(cursor: sqlite3.Cursor, table_name: str, json_columns: List[JsonColumn]):
+        """Add missing generated JSON columns (ALTER TABLE only allows VIRTUAL ones) and their indexes."""
+        existing = {row[0] for row in cursor.execute('SELECT name FROM pragma_table_xinfo(?)', (table_name,))}
+        for column in json_columns:
+            if column.name not in existing:
+                cursor.execute(f'''
+                    ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type}
+                    GENERATED ALWAYS AS ({column.expression()}) VIRTUAL
+                ''')
+            if column.indexed:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {table_name}_{column.name}_idx '
+                               f'ON {table_name} ({column.name})')
 
     def _get_connection(self, db_name: str) -> sqlite3.Connection:
         """Get a connection to the specified database."""
         if db_name not in self.databases:
             raise ValueError(f"Unknown database: {db_name}")
-        conn = sqlite3.connect(self.databases[db_name].path)
-        conn.row_factory = sqlite3.Row  # Enable dictionary-like access
+        conn = sqlite3.connect(self.databases[db_name].path, timeout=self._busy_timeout())
+        # Rows removed by INSERT OR REPLACE must fire the delete triggers (search index, change_log)
+        conn.execute('PRAGMA recursive_triggers = ON')
+        codec = self.codecs.get(db_name)
+        # Enable dictionary-like access (decompressing compressed columns on the way)
+        conn.row_factory = codec.row_factory if codec else sqlite3.Row
+        if self.stats:
+            self.stats.attach(conn)
         return conn
 
+    def enable_instrumentation(self, slow_threshold: float = 0.1, slow_log_size: int = 100,
+                               trace: bool = False, progress_interval: int = 0) -> QueryStats:
+        """Record latency, row counts and slow queries for every interface created from now on."""
+        self.stats = QueryStats(slow_threshold, slow_log_size, trace, progress_interval)
+        return self.stats
+
+    def disable_instrumentation(self):
+        """Stop recording for interfaces created from now on."""
+        self.stats = None
+
+    def set_retry_policy(self, policy: Optional[RetryPolicy]) -> Optional[RetryPolicy]:
+        """Use policy for interfaces created from now on; None restores plain sqlite3 behaviour (5s busy timeout, no retries)."""
+        self.retry_policy = policy
+        return policy
+
+    def _busy_timeout(self) -> float:
+        return self.retry_policy.busy_timeout if self.retry_policy else 5.0
+
     def users(self) -> 'UserDatabase':
         """Get the users database interface."""
-        return UserDatabase(self._get_connection('users'))
+        return UserDatabase(self._get_connection('users'), self.stats, self.retry_policy, self.codecs.get('users'))
 
-    def wells(self) -> 'WellDatabase':
-        """Get the wells database interface."""
-        return WellDatabase(self._get_connection('wells'))
+    def wells(self, shard: str = DEFAULT_WELL_SHARD) -> 'WellDatabase':
+        """Get the wells database interface of one shard (well_router() spans them all)."""
+        if shard not in self.well_shards():
+            raise ValueError(f"Unknown well shard: {shard}")
+        return WellDatabase(self._get_connection(shard), self.stats, self.retry_policy, self.codecs.get(shard))
 
     def deviceTokens(self) -> 'DeviceTokenDatabase':
         """Get the device tokens database interface."""
-        return DeviceTokenDatabase(self._get_connection('deviceTokens'))
+        return DeviceTokenDatabase(self._get_connection('deviceTokens'), self.stats, self.retry_policy,
+                                   self.codecs.get('deviceTokens'))
+
+    def current_versions(self) -> Dict[str, int]:
+        """Get the latest change_log version of each database, as a starting cursor for changes_since."""
+        versions = {}
+        for db_name, config in self.databases.items():
+            if config.tracked_tables:
+                with closing(self._get_connection(db_name)) as conn:
+                    versions[db_name] = BaseDatabase(conn, self.stats, self.retry_policy).change_log_version()
+        return versions
+
+    def changes_since(self, version: Union[int, Dict[str, int]] = 0, tables: Optional[List[str]] = None,
+                      limit: int = 1000) -> Dict[str, Any]:
+        """
+        Get what changed in the tracked tables since a cursor, one entry per changed row.
+
+        Versions are per database file, so the cursor is a {db_name: version} dict
+        (a plain int applies to every database). Several changes to the same row
+        within the window are collapsed into its latest operation, and inserted or
+        updated rows carry their current contents. Every wells shard is a database
+        of its own; a well moved between shards is never reported as deleted.
+
+        Args:
+            version: Cursor returned by a previous call (or current_versions()); 0 for everything logged
+            tables: Tables to include (default: all tracked tables)
+            limit: Maximum change_log entries read per database
+
+        Returns:
+            {'changes': [...], 'versions': next cursor, 'hasMore': bool,
+             'resyncRequired': databases whose log was compacted past the cursor}
+        """
+        known = {t for config in self.databases.values() for t in config.tracked_tables}
+        unknown = set(tables or []) - known
+        if unknown:
+            raise ValueError(f"Untracked tables: {sorted(unknown)}")
+
+        result = {'changes': [], 'versions': {}, 'hasMore': False, 'resyncRequired': []}
+        for db_name, config in self.databases.items():
+            db_tables = [t for t in config.tracked_tables if tables is None or t in tables]
+            since = version.get(db_name, 0) if isinstance(version, dict) else version
+            if not db_tables:
+                if isinstance(version, dict) and db_name in version:
+                    result['versions'][db_name] = since  # carry the cursor through untouched
+                continue
+            with closing(self._get_connection(db_name)) as conn:
+                database = BaseDatabase(conn, self.stats, self.retry_policy)
+                if since < database.change_log_state('compactedThrough'):
+                    result['resyncRequired'].append(db_name)
+                entries, next_version, has_more = database.change_log_entries(since, db_tables, limit)
+                # Rows are parsed the same way as the matching get_* methods
+                rows = database.load_changed_rows(entries, config.tracked_tables,
+                                                  {'users': UserDatabase.JSON_FIELDS})
+            for entry in entries:
+                entry['database'] = db_name
+                entry['row'] = rows.get((entry['table'], entry['key']))
+            result['changes'].extend(entries)
+            result['versions'][db_name] = next_version
+            result['hasMore'] = result['hasMore'] or has_more
+        self._resolve_moved_rows(result['changes'])
+        return result
+
+    def _resolve_moved_rows(self, changes: List[Dict[str, Any]]):
+        """
+        A well moved between shards is deleted from one file and inserted into
+        another; give such deletes the row's current contents (as an update) so
+        that consumers do not drop a well that merely moved.
+        """
+        gone: Dict[str, List[Dict[str, Any]]] = {}
+        for change in changes:
+            if change['row'] is None:
+                gone.setdefault(change['table'], []).append(change)
+        for table, entries in gone.items():
+            holders = {db_name: config.tracked_tables[table] for db_name, config in self.databases.items()
+                       if table in config.tracked_tables}
+            if len(holders) < 2:
+                continue
+            lookups = [{'table': table, 'key': entry['key'], 'operation': 'update'} for entry in entries]
+            for db_name, key_column in holders.items():
+                with closing(self._get_connection(db_name)) as conn:
+                    rows = BaseDatabase(conn, self.stats, self.retry_policy).load_changed_rows(
+                        lookups, {table: key_column}, {'users': UserDatabase.JSON_FIELDS})
+                for entry in entries:
+                    row = rows.get((table, entry['key']))
+                    if row is not None:
+                        entry['row'], entry['operation'] = row, 'update'
+
+    def compact_change_log(self, max_age_days: float = 30) -> Dict[str, Dict[str, int]]:
+        """
+        Shrink every change_log: drop entries superseded by a later change to the
+        same row, then drop entries older than max_age_days. Clients whose cursor
+        falls before the dropped range get resyncRequired from changes_since.
+        """
+        report = {}
+        for db_name, config in self.databases.items():
+            if config.tracked_tables:
+                with closing(self._get_connection(db_name)) as conn:
+                    report[db_name] = BaseDatabase(conn, self.stats, self.retry_policy).compact_change_log(max_age_days)
+        return report
+
+    def _get_attached_connection(self) -> sqlite3.Connection:
+        """Get one connection with every database attached under its own name."""
+        conn = sqlite3.connect(':memory:', timeout=self._busy_timeout())
+        conn.execute('PRAGMA recursive_triggers = ON')
+        conn.row_factory = self._attached_row_factory()
+        for db_name, config in self.databases.items():
+            conn.execute(f'ATTACH DATABASE ? AS {db_name}', (config.path,))
+        if self.stats:
+            self.stats.attach(conn)
+        return conn
+
+    def _attached_row_factory(self):
+        if not self.codecs:
+            return sqlite3.Row
+        # Dictionary ids are content hashes, so one codec decodes the values of every file
+        dictionaries = {k: v for codec in self.codecs.values() for k, v in codec.dictionaries.items()}
+        return ColumnCodec({}, dictionaries).row_factory
+
+    def attached(self) -> 'AttachedDatabase':
+        """Get the cross-database interface (users, wells and tokens joined in SQL)."""
+        return AttachedDatabase(self._get_attached_connection(), self.stats, self.retry_policy)
+
+    def enable_read_replica(self, databases: Optional[List[str]] = None,
+                            refresh_interval: Optional[float] = 60.0) -> 'ReadReplica':
+        """
+        Copy databases into memory and serve read-only analytics from there (see ReadReplica).
+
+        Args:
+            databases: Databases to copy (default: all)
+            refresh_interval: Seconds after which the copy is refreshed from change_log
+                when an interface is next handed out (None: only on replica.refresh())
+        """
+        self.disable_read_replica()
+        self.replica = ReadReplica(self, databases, refresh_interval)
+        return self.replica
+
+    def disable_read_replica(self):
+        """Drop the in-memory copies."""
+        if self.replica:
+            self.replica.close()
+        self.replica = None
 
 class BaseDatabase:
     """Base class for database operations with common functionality."""
 
-    def __init__(self, conn: sqlite3.Connection):
+    CONFLICT_ACTIONS = {'abort': 'INSERT', 'ignore': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}
+
+    # Set by subclasses that manage a single table
+    TABLE: Optional[str] = None
+    KEY_COLUMN: Optional[str] = None
+    UPDATED_COLUMN: Optional[str] = None  # timestamp column touched by set-based updates
+    JSON_FIELDS: List[str] = []
+    JSON_COLUMNS: List[JsonColumn] = []
+    SQL_READ_FIELDS: List[str] = []  # text columns the data tools read inside SQL (never compressed)
+    # Columns of the Node server's Sequelize model (Server/models); it reads them directly, so never compressed
+    NODE_READ_FIELDS: List[str] = []
+
+    def __init__(self, conn: sqlite3.Connection, stats: Optional[QueryStats] = None,
+                 retry_policy: Optional[RetryPolicy] = None, codec: Optional[ColumnCodec] = None):
         self.conn = conn
+        self.stats = stats
+        self.retry_policy = retry_policy
+        self.codec = codec  # compresses this database's compressed columns on write
 
     def _execute(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
-        """Execute a query with error handling."""
+        """
+        Execute a query with error handling (and timing, when instrumentation is enabled).
+        Outside a transaction a locked database is retried per retry_policy.
+        """
+        if not self.conn.in_transaction:
+            return self._with_retry(lambda: self._execute_once(query, params))
+        return self._execute_once(query, params)
+
+    def _execute_once(self, query: str, params: tuple) -> sqlite3.Cursor:
+        stats = self.stats or process_stats()
+        if stats:
+            return self._execute_instrumented(query, params, stats)
         try:
             cursor = self.conn.cursor()
             cursor.execute(query, params)
             return cursor
         except sqlite3.Error as e:
-            print(f"Database error: {str(e)}")
+            if not (self.retry_policy and is_busy(e)):
+                print(f"Database error: {str(e)}")
+            raise
+
+    def _with_retry(self, operation):
+        """Run operation under retry_policy, rolling back any transaction a locked attempt left open."""
+        if self.retry_policy is None:
+            return operation()
+        in_transaction = self.conn.in_transaction
+
+        def on_busy():
+            if self.conn.in_transaction and not in_transaction:
+                self.conn.rollback()
+
+        try:
+            return self.retry_policy.run(operation, on_busy)
+        except sqlite3.Error as e:
+            if is_busy(e):
+                print(f"Database error: {str(e)} (gave up after {self.retry_policy.max_total_wait}s)")
             raise
 
+    @contextmanager
+    def write_transaction(self):
+        """
+        Run the enclosed writes in one BEGIN IMMEDIATE transaction. The write
+        lock is taken up front (and BEGIN/COMMIT retried per retry_policy), so
+        no statement inside can fail halfway with 'database is locked'. Nested
+        use joins the outer transaction.
+        """
+        if self.conn.in_transaction:
+            yield
+            return
+        self._with_retry(lambda: self.conn.execute('BEGIN IMMEDIATE'))
+        try:
+            yield
+            self._with_retry(self.conn.commit)
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _execute_write(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Execute one write statement in its own write_transaction."""
+        with self.write_transaction():
+            return self._execute(query, params)
+
+    def _compress(self, table: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Values to write to table, with its compressed columns compressed (unchanged without a codec)."""
+        return self.codec.encode_row(table, values) if self.codec else values
+
+    def _check_uncompressed(self, field: str):
+        """SQL JSON functions cannot read a compressed column."""
+        if self.codec and self.codec.compressed(self.TABLE, field):
+            raise ValueError(f"{self.TABLE}.{field} is compressed; SQL JSON functions cannot read it")
+
+    def _execute_instrumented(self, query: str, params: tuple, stats: QueryStats) -> InstrumentedCursor:
+        """Execute a query and report it to stats once its rows are consumed."""
+        stats.begin(query)
+        start = time.perf_counter()
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+        except sqlite3.Error as e:
+            stats.record_error(query)
+            if not (self.retry_policy and is_busy(e)):
+                print(f"Database error: {str(e)}")
+            raise
+        return InstrumentedCursor(cursor, stats, query, params, time.perf_counter() - start)
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Turn free text into an FTS5 query matching every word as a prefix."""
+        terms = re.findall(r'[^\W_]+', text)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def _search(self, fts_table: str, content_table: str, text: str, limit: int) -> List[sqlite3.Row]:
+        """Run a ranked full-text search and return the matching content rows."""
+        match = self._fts_query(text)
+        if not match:
+            return []
+        columns = ', '.join(f'c.{column}' for column in self.table_columns(content_table))
+        cursor = self._execute(f'''
+            SELECT {columns}, f.rank AS searchRank
+            FROM {fts_table} f
+            JOIN {content_table} c ON c.rowid = f.rowid
+            WHERE {fts_table} MATCH ?
+            ORDER BY f.rank
+            LIMIT ?
+        ''', (match, limit))
+        return cursor.fetchall()
+
+    def _select_columns(self) -> str:
+        """Column list for reading whole rows: SELECT * would also return the generated JSON columns."""
+        return ', '.join(self.table_columns(self.TABLE))
+
+    def _without_generated(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """values minus the generated JSON columns, so a row read elsewhere can be written back."""
+        generated = {column.name for column in self.JSON_COLUMNS}
+        return {key: value for key, value in values.items() if key not in generated}
+
+    def table_columns(self, table: str, include_generated: bool = False) -> List[str]:
+        """Get the column names of a table, in schema order (stored columns only by default)."""
+        pragma = 'pragma_table_xinfo' if include_generated else 'pragma_table_info'
+        cursor = self._execute(f'SELECT name FROM {pragma}(?)', (table,))
+        columns = [row[0] for row in cursor.fetchall()]
+        if not columns:
+            raise ValueError(f"Unknown table: {table}")
+        return columns
+
+    def bulk_insert(self, table: str, rows: Iterable[Dict[str, Any]], on_conflict: str = 'abort',
+                    batch_size: int = 1000) -> int:
+        """
+        Insert many rows in a single transaction using executemany.
+
+        Args:
+            table: Table to insert into
+            rows: Row dicts; dict/list values are stored as JSON text
+            on_conflict: 'abort' (roll back everything), 'ignore' (skip duplicates) or 'replace'
+            batch_size: Rows handed to executemany at a time
+
+        Returns:
+            Number of rows written
+        """
+        if on_conflict not in self.CONFLICT_ACTIONS:
+            raise ValueError(f"Unknown conflict action: {on_conflict}")
+        known_columns = set(self.table_columns(table))
+        verb = self.CONFLICT_ACTIONS[on_conflict]
+        written = 0
+
+        def flush(columns: tuple, batch: List[tuple]):
+            nonlocal written
+            unknown = set(columns) - known_columns
+            if unknown:
+                raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+            placeholders = ', '.join('?' for _ in columns)
+            cursor = self.conn.executemany(
+                f'{verb} INTO {table} ({", ".join(columns)}) VALUES ({placeholders})', batch)
+            written += cursor.rowcount
+
+        try:
+            with self.write_transaction():
+                columns, batch = None, []
+                for row in rows:
+                    row_columns = tuple(row.keys())
+                    if row_columns != columns or len(batch) >= batch_size:
+                        if batch:
+                            flush(columns, batch)
+                        columns, batch = row_columns, []
+                    values = {k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in row.items()}
+                    batch.append(tuple(self._compress(table, values).values()))
+                if batch:
+                    flush(columns, batch)
+        except sqlite3.Error as e:
+            print(f"Bulk insert into {table} failed: {str(e)}")
+            raise
+        return written
+
+    def change_log_version(self) -> int:
+        """Get the highest version ever written to change_log (0 if none)."""
+        row = self._execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+    def change_log_state(self, name: str) -> int:
+        row = self._execute('SELECT value FROM change_log_state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def change_log_entries(self, since: int, tables: List[str], limit: int) -> tuple:
+        """
+        Read the next limit change_log entries after since and collapse them to one per row.
+
+        Returns:
+            (entries, next_version, has_more)
+        """
+        placeholders = ', '.join('?' for _ in tables)
+        window_end = self._execute(f'''
+            SELECT MAX(version) FROM (
+                SELECT version FROM change_log
+                WHERE version > ? AND tableName IN ({placeholders})
+                ORDER BY version
+                LIMIT ?
+            )
+        ''', (since, *tables, limit)).fetchone()[0]
+        if window_end is None:
+            return [], since, False
+
+        # Bare columns next to MAX() come from the row holding the maximum, i.e. the latest operation
+        cursor = self._execute(f'''
+            SELECT MAX(version) AS version, tableName AS "table", rowKey AS "key", operation, changedAt
+            FROM change_log
+            WHERE version > ? AND version <= ? AND tableName IN ({placeholders})
+            GROUP BY tableName, rowKey
+            ORDER BY version
+        ''', (since, window_end, *tables))
+        entries = [dict(row) for row in cursor.fetchall()]
+        has_more = self._execute(
+            f'SELECT 1 FROM change_log WHERE version > ? AND tableName IN ({placeholders}) LIMIT 1',
+            (window_end, *tables)).fetchone() is not None
+        return entries, window_end, has_more
+
+    def load_changed_rows(self, entries: List[Dict[str, Any]], key_columns: Dict[str, str],
+                          json_fields: Dict[str, List[str]], batch_size: int = 500) -> Dict[tuple, Dict[str, Any]]:
+        """Fetch the current contents of changed rows in batches: {(table, key): row}."""
+        rows = {}
+        for table, key_column in key_columns.items():
+            keys = [e['key'] for e in entries if e['table'] == table and e['operation'] != 'delete']
+            for i in range(0, len(keys), batch_size):
+                batch = keys[i:i + batch_size]
+                cursor = self._execute(
+                    f"SELECT * FROM {table} WHERE {key_column} IN ({', '.join('?' for _ in batch)})", tuple(batch))
+                for row in cursor.fetchall():
+                    rows[(table, row[key_column])] = self._parse_json_fields(row, json_fields.get(table, []))
+        return rows
+
+    def compact_change_log(self, max_age_days: float) -> Dict[str, int]:
+        """Drop superseded and expired change_log entries; returns counts of deleted entries."""
+        try:
+            with self.write_transaction():
+                superseded = self._execute('''
+                    DELETE FROM change_log
+                    WHERE version < (SELECT MAX(c.version) FROM change_log c
+                                     WHERE c.tableName = change_log.tableName AND c.rowKey = change_log.rowKey)
+                ''').rowcount
+                cutoff = self._execute(
+                    "SELECT MAX(version) FROM change_log WHERE changedAt < strftime('%Y-%m-%dT%H:%M:%f', 'now', ?)",
+                    (f'-{max_age_days} days',)).fetchone()[0]
+                expired = 0
+                if cutoff is not None:
+                    expired = self._execute('DELETE FROM change_log WHERE version <= ?', (cutoff,)).rowcount
+                    self._execute('''
+                        INSERT INTO change_log_state (name, value) VALUES ('compactedThrough', ?)
+                        ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)
+                    ''', (cutoff,))
+            return {'superseded': superseded, 'expired': expired}
+        except sqlite3.Error as e:
+            print(f"Change log compaction failed: {str(e)}")
+            raise
+
+    def _filter_expression(self, key: str, columns: set) -> str:
+        """
+        Resolve a filter key to SQL: a column name, a declared JSON column key such as
+        'waterNeeds.type' (served by its generated column and index), or any other
+        'jsonField.path' (evaluated with json_extract, not indexed).
+        """
+        if key in columns:
+            return key
+        for column in self.JSON_COLUMNS:
+            if column.key == key:
+                return column.name
+        source, _, path = key.partition('.')
+        if path and source in self.JSON_FIELDS and re.fullmatch(r'[A-Za-z0-9_.\[\]]+', path):
+            self._check_uncompressed(source)
+            return JsonColumn(key, source, f'$.{path}').expression()
+        raise ValueError(f"Unknown filter for {self.TABLE}: {key}")
+
+    def _where_clause(self, where: Dict[str, Any]) -> tuple:
+        """Build an AND-ed equality WHERE clause from {column or JSON path: value}; None matches NULL."""
+        if not where:
+            return '1', ()
+        columns = set(self.table_columns(self.TABLE, include_generated=True))
+        conditions, params = [], []
+        for key, value in where.items():
+            expression = self._filter_expression(key, columns)
+            if value is None:
+                conditions.append(f'{expression} IS NULL')
+            else:
+                conditions.append(f'{expression} = ?')
+                params.append(int(value) if isinstance(value, bool) else value)
+        return ' AND '.join(conditions), tuple(params)
+
+    def _json_update(self, field: str, expression: str, params: tuple, where: Dict[str, Any],
+                     json_type: str) -> int:
+        """Rewrite a JSON column in place with a JSON1 expression for every row matching where."""
+        if self.TABLE is None:
+            raise TypeError(f"{type(self).__name__} is not bound to a table")
+        if field not in self.table_columns(self.TABLE):
+            raise ValueError(f"Unknown column for {self.TABLE}: {field}")
+        self._check_uncompressed(field)
+        where_sql, where_params = self._where_clause(where)
+        set_sql = f'{field} = {expression}'
+        if self.UPDATED_COLUMN:
+            set_sql += f', {self.UPDATED_COLUMN} = ?'
+            params += (datetime.now().isoformat(),)
+        # Only rows already holding the right JSON type (or NULL, which starts empty) are touched
+        query = f'''
+            UPDATE {self.TABLE} SET {set_sql}
+            WHERE {where_sql} AND ({field} IS NULL OR (json_valid({field}) AND json_type({field}) = '{json_type}'))
+        '''
+        try:
+            return self._execute_write(query, params + where_params).rowcount
+        except sqlite3.Error as e:
+            print(f"JSON update of {self.TABLE}.{field} failed: {str(e)}")
+            raise
+
+    @staticmethod
+    def _json_path(path: str) -> str:
+        """Accept '$.a.b' as-is, or turn a plain 'a.b' key into a quoted JSON path."""
+        if path.startswith('$'):
+            return path
+        return '$' + ''.join(f'."{part}"' for part in path.split('.'))
+
+    def json_remove_indices(self, field: str, indices: List[int], where: Dict[str, Any]) -> int:
+        """
+        Remove list items from a JSON array column in one UPDATE.
+
+        Args:
+            field: JSON array column
+            indices: Positions to remove; negative values count from the end (-1 is the last item)
+            where: {column: value} equality filter; {} applies to every row
+
+        Returns:
+            Number of rows updated
+        """
+        # json_remove applies paths left to right, so remove from the end backwards to keep
+        # the remaining positions stable: end-relative first (most negative first), then descending
+        negative = sorted({i for i in indices if i < 0})
+        positive = sorted({i for i in indices if i >= 0}, reverse=True)
+        paths = [f'$[#{i}]' for i in negative] + [f'$[{i}]' for i in positive]
+        if not paths:
+            return 0
+        expression = f"json_remove({field}, {', '.join('?' for _ in paths)})"
+        return self._json_update(field, expression, tuple(paths), where, 'array')
+
+    def json_append(self, field: str, value: Any, where: Dict[str, Any]) -> int:
+        """Append a value to a JSON array column in one UPDATE; NULL columns become a one-item array."""
+        expression = f"json_insert(COALESCE({field}, '[]'), '$[#]', json(?))"
+        return self._json_update(field, expression, (json.dumps(value),), where, 'array')
+
+    def json_set(self, field: str, path: str, value: Any, where: Dict[str, Any]) -> int:
+        """Set a key (plain 'a.b' or a '$...' JSON path) in a JSON object column in one UPDATE."""
+        expression = f"json_set(COALESCE({field}, '{{}}'), ?, json(?))"
+        return self._json_update(field, expression, (self._json_path(path), json.dumps(value)), where, 'object')
+
+    @staticmethod
+    def _canonical_json(field: str, value: Any) -> Optional[str]:
+        """
+        Serialize a JSON field for writing. Python values are dumped; strings must
+        already be plain JSON. Text that decodes to another string (encoded twice)
+        or does not decode at all is rejected, so readers never have to repair it.
+        """
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            return json.dumps(value)
+        try:
+            decoded = json.loads(value)
+        except json.JSONDecodeError:
+            raise ValueError(f"Field '{field}' is not valid JSON")
+        if isinstance(decoded, str):
+            raise ValueError(f"Field '{field}' is JSON-encoded more than once")
+        return json.dumps(decoded)
+
     def _parse_json_fields(self, row: dict, json_fields: List[str]) -> dict:
         """Parse JSON fields in a row."""
         result = dict(row)
@@ -158,28 +1224,248 @@ class BaseDatabase:
                     result[field] = None
         return result
 
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a row the way this table's getters do (plain dict unless overridden)."""
+        return dict(row)
+
+    def query(self) -> 'Query':
+        """Start a composable query over this interface's table."""
+        return Query(self)
+
+class Query:
+    """
+    Composable, parameterized SELECT over one table:
+
+        wells.query().where(status='Active', ownerId=5).order_by('-last_update').limit(50).all()
+
+    where() and order_by() keys must be columns of the table (or declared JSON
+    column keys such as 'waterNeeds.type', see BaseDatabase._filter_expression);
+    values are always bound as parameters. A where() key may end in an operator:
+    __ne, __lt, __lte, __gt, __gte, __like, __in (a list) or __isnull (a bool).
+    None compares as IS NULL / IS NOT NULL. Every call returns a new Query.
+
+    update() and delete() run the same filter as one UPDATE / DELETE statement:
+
+        wells.query().where(lastUpdated__lt='2024-01-01').update(status='Inactive')
+    """
+
+    OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=', 'like': 'LIKE'}
+
+    def __init__(self, database: BaseDatabase):
+        if database.TABLE is None:
+            raise TypeError(f"{type(database).__name__} is not bound to a table")
+        self._database = database
+        self._columns: Optional[set] = None
+        self._conditions: Tuple[Tuple[str, tuple], ...] = ()
+        self._order: Tuple[str, ...] = ()
+        self._select: Optional[Tuple[str, ...]] = None
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+
+    def _copy(self, **changes) -> 'Query':
+        query = Query.__new__(Query)
+        query.__dict__.update(self.__dict__, **{f'_{k}': v for k, v in changes.items()})
+        return query
+
+    def _known_columns(self) -> set:
+        if self._columns is None:
+            self._columns = set(self._database.table_columns(self._database.TABLE, include_generated=True))
+        return self._columns
+
+    def _expression(self, key: str) -> str:
+        return self._database._filter_expression(key, self._known_columns())
+
+    def _condition(self, key: str, value: Any) -> Tuple[str, tuple]:
+        name, _, op = key.rpartition('__')
+        if not name or (op not in self.OPERATORS and op not in ('in', 'isnull')):
+            name, op = key, 'eq'
+        expression = self._expression(name)
+        if isinstance(value, bool):
+            value = int(value)
+        if op == 'isnull':
+            return f"{expression} IS {'' if value else 'NOT '}NULL", ()
+        if op == 'in':
+            values = tuple(int(v) if isinstance(v, bool) else v for v in value)
+            if not values:
+                return '0', ()
+            return f"{expression} IN ({', '.join('?' for _ in values)})", values
+        if value is None and op in ('eq', 'ne'):
+            return f"{expression} IS {'NOT ' if op == 'ne' else ''}NULL", ()
+        return f'{expression} {self.OPERATORS[op]} ?', (value,)
+
+    def where(self, **conditions: Any) -> 'Query':
+        """AND the given conditions onto the query."""
+        added = tuple(self._condition(key, value) for key, value in conditions.items())
+        return self._copy(conditions=self._conditions + added)
+
+    def order_by(self, *keys: str) -> 'Query':
+        """Sort by the given keys, '-key' for descending; replaces any previous order."""
+        order = tuple(f'{self._expression(key.lstrip("-"))} {"DESC" if key.startswith("-") else "ASC"}'
+                      for key in keys)
+        return self._copy(order=order)
+
+    def select(self, *columns: str) -> 'Query':
+        """Only fetch the given columns."""
+        unknown = set(columns) - self._known_columns()
+        if unknown:
+            raise ValueError(f"Unknown columns for {self._database.TABLE}: {sorted(unknown)}")
+        return self._copy(select=columns)
+
+    def limit(self, count: int, offset: Optional[int] = None) -> 'Query':
+        return self._copy(limit=int(count), offset=None if offset is None else int(offset))
+
+    def _where_sql(self) -> Tuple[str, tuple]:
+        if not self._conditions:
+            return '1', ()
+        return (' AND '.join(sql for sql, _ in self._conditions),
+                tuple(p for _, params in self._conditions for p in params))
+
+    def sql(self, select: Optional[str] = None) -> Tuple[str, tuple]:
+        """The SELECT statement and parameters this query runs."""
+        where_sql, params = self._where_sql()
+        columns = select or (', '.join(self._select) if self._select else '*')
+        sql = f'SELECT {columns} FROM {self._database.TABLE} WHERE {where_sql}'
+        if self._order:
+            sql += ' ORDER BY ' + ', '.join(self._order)
+        if self._limit is not None:
+            sql += ' LIMIT ?'
+            params += (self._limit,)
+            if self._offset is not None:
+                sql += ' OFFSET ?'
+                params += (self._offset,)
+        return sql, params
+
+    def __iter__(self):
+        cursor = self._database._execute(*self.sql())
+        for row in cursor:
+            yield self._database._row_to_dict(row)
+
+    def all(self) -> List[Dict[str, Any]]:
+        cursor = self._database._execute(*self.sql())
+        return [self._database._row_to_dict(row) for row in cursor.fetchall()]
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        rows = self.limit(1, self._offset).all()
+        return rows[0] if rows else None
+
+    def count(self) -> int:
+        """Number of matching rows (respecting limit), counted in SQL."""
+        if self._limit is None:
+            sql, params = self._copy(order=()).sql('COUNT(*)')
+        else:
+            inner, params = self.sql('1')
+            sql = f'SELECT COUNT(*) FROM ({inner})'
+        return self._database._execute(sql, params).fetchone()[0]
+
+    def exists(self) -> bool:
+        """Whether any row matches; SQLite stops at the first one."""
+        inner, params = self._copy(order=(), limit=None, offset=None).sql('1')
+        return bool(self._database._execute(f'SELECT EXISTS ({inner})', params).fetchone()[0])
+
+    def _check_set_based(self, action: str):
+        if self._order or self._limit is not None:
+            raise ValueError(f"{action} applies to every matching row; drop order_by()/limit()")
+
+    def update(self, **values: Any) -> int:
+        """
+        Set columns on every matching row in one UPDATE.
+
+        JSON fields are stored as canonical JSON and the table's UPDATED_COLUMN
+        is set to now unless given.
+
+        Returns:
+            Number of rows updated
+        """
+        self._check_set_based('update()')
+        database = self._database
+        if not values:
+            raise ValueError('update() needs at least one column')
+        unknown = set(values) - set(database.table_columns(database.TABLE))
+        if unknown:
+            raise ValueError(f"Unknown columns for {database.TABLE}: {sorted(unknown)}")
+        prepared = {}
+        for column, value in values.items():
+            if column in database.JSON_FIELDS:
+                value = database._canonical_json(column, value)
+            prepared[column] = int(value) if isinstance(value, bool) else value
+        if database.UPDATED_COLUMN and database.UPDATED_COLUMN not in prepared:
+            prepared[database.UPDATED_COLUMN] = datetime.now().isoformat()
+        prepared = database._compress(database.TABLE, prepared)
+        where_sql, where_params = self._where_sql()
+        set_sql = ', '.join(f'{column} = ?' for column in prepared)
+        query = f'UPDATE {database.TABLE} SET {set_sql} WHERE {where_sql}'
+        try:
+            return database._execute_write(query, tuple(prepared.values()) + where_params).rowcount
+        except sqlite3.Error as e:
+            print(f"Update of {database.TABLE} failed: {str(e)}")
+            raise
+
+    def delete(self) -> int:
+        """Delete every matching row in one DELETE; returns the number of rows deleted."""
+        self._check_set_based('delete()')
+        where_sql, params = self._where_sql()
+        try:
+            return self._database._execute_write(
+                f'DELETE FROM {self._database.TABLE} WHERE {where_sql}', params).rowcount
+        except sqlite3.Error as e:
+            print(f"Delete from {self._database.TABLE} failed: {str(e)}")
+            raise
+
 class UserDatabase(BaseDatabase):
     """Handles all user-related database operations."""
 
+    TABLE = 'users'
+    KEY_COLUMN = 'userId'
+    UPDATED_COLUMN = 'updatedAt'
     JSON_FIELDS = ['location', 'waterNeeds', 'notificationPreferences']
+    JSON_COLUMNS = [
+        JsonColumn('waterNeedsType', 'waterNeeds', '$.type'),
+        JsonColumn('notifyWeatherAlerts', 'notificationPreferences', '$.weatherAlerts', 'INTEGER'),
+    ]
+    SEARCH_FIELDS = ['email', 'firstName', 'lastName', 'username']
+    SQL_READ_FIELDS = ['location']  # json_extract in nearest_wells.py and alert_targeting.py
+    NODE_READ_FIELDS = ['userId', 'email', 'password', 'firstName', 'lastName', 'role', 'location', 'waterNeeds',
+                        'notificationPreferences', 'themePreference', 'isActive', 'isWellOwner',
+                        'createdAt', 'updatedAt']
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return self._parse_json_fields(row, self.JSON_FIELDS)
 
     def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get a user by ID with parsed JSON fields."""
-        cursor = self._execute('SELECT * FROM users WHERE userId = ?', (user_id,))
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM users WHERE userId = ?', (user_id,))
         row = cursor.fetchone()
         return self._parse_json_fields(row, self.JSON_FIELDS) if row else None
 
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get a user by email with parsed JSON fields."""
-        cursor = self._execute('SELECT * FROM users WHERE email = ?', (email.lower().strip(),))
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM users WHERE email = ?', (email.lower().strip(),))
         row = cursor.fetchone()
         return self._parse_json_fields(row, self.JSON_FIELDS) if row else None
 
-    def get_all_users(self) -> List[Dict[str, Any]]:
-        """Get all users with parsed JSON fields."""
-        cursor = self._execute('SELECT * FROM users')
+    def get_all_users(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Get all users with parsed JSON fields, optionally filtered in SQL.
+
+        filters maps columns or JSON paths to required values, e.g.
+        {'role': 'admin', 'waterNeeds.type': 'irrigation', 'notificationPreferences.weatherAlerts': True}
+        """
+        where_sql, params = self._where_clause(filters or {})
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM users WHERE {where_sql}', params)
         return [self._parse_json_fields(row, self.JSON_FIELDS) for row in cursor.fetchall()]
 
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Search users by name, username or email, best matches first."""
+        rows = self._search('users_fts', 'users', text, limit)
+        return [self._parse_json_fields(row, self.JSON_FIELDS) for row in rows]
+
+    def nearest_wells(self, user_id: str) -> List[Dict[str, Any]]:
+        """Get a user's precomputed closest active wells (see nearest_wells.py), closest first."""
+        cursor = self._execute('''
+            SELECT wellId, rank, distanceKm FROM user_nearest_wells WHERE userId = ? ORDER BY rank
+        ''', (user_id,))
+        return [dict(row) for row in cursor.fetchall()]
+
     def create_user(self, user_data: Dict[str, Any]) -> bool:
         """Create a new user with proper JSON serialization."""
         # Ensure required fields are present
@@ -187,12 +1473,11 @@ class UserDatabase(BaseDatabase):
         if not all(field in user_data for field in required_fields):
             raise ValueError("Missing required user fields")
 
-        # Prepare data with JSON serialization
-        prepared_data = user_data.copy()
+        # Prepare data with JSON serialization (rejects non-canonical JSON text)
+        prepared_data = self._without_generated(user_data)
         for field in self.JSON_FIELDS:
-            if field in prepared_data and prepared_data[field] is not None:
-                if not isinstance(prepared_data[field], str):
-                    prepared_data[field] = json.dumps(prepared_data[field])
+            if field in prepared_data:
+                prepared_data[field] = self._canonical_json(field, prepared_data[field])
 
         # Generate timestamps if not provided
         if 'createdAt' not in prepared_data:
@@ -201,13 +1486,13 @@ class UserDatabase(BaseDatabase):
             prepared_data['updatedAt'] = datetime.now().isoformat()
 
         # Execute insert
+        prepared_data = self._compress('users', prepared_data)
         columns = ', '.join(prepared_data.keys())
         placeholders = ', '.join(['?' for _ in prepared_data])
         query = f'INSERT INTO users ({columns}) VALUES ({placeholders})'
 
         try:
-            self._execute(query, tuple(prepared_data.values()))
-            self.conn.commit()
+            self._execute_write(query, tuple(prepared_data.values()))
             return True
         except sqlite3.IntegrityError as e:
             print(f"User creation failed (possible duplicate): {str(e)}")
@@ -215,18 +1500,18 @@ class UserDatabase(BaseDatabase):
 
     def update_user(self, user_id: str, updates: Dict[str, Any]) -> bool:
         """Update a user's information with proper JSON serialization."""
-        if not updates:
+        prepared_updates = self._without_generated(updates)
+        if not prepared_updates:
             return False
 
-        # Prepare updates with JSON serialization
-        prepared_updates = updates.copy()
+        # Prepare updates with JSON serialization (rejects non-canonical JSON text)
         for field in self.JSON_FIELDS:
-            if field in prepared_updates and prepared_updates[field] is not None:
-                if not isinstance(prepared_updates[field], str):
-                    prepared_updates[field] = json.dumps(prepared_updates[field])
+            if field in prepared_updates:
+                prepared_updates[field] = self._canonical_json(field, prepared_updates[field])
 
         # Add updated timestamp
         prepared_updates['updatedAt'] = datetime.now().isoformat()
+        prepared_updates = self._compress('users', prepared_updates)
 
         # Build and execute update query
         set_clause = ', '.join([f'{k} = ?' for k in prepared_updates.keys()])
@@ -234,8 +1519,7 @@ class UserDatabase(BaseDatabase):
         params = list(prepared_updates.values()) + [user_id]
 
         try:
-            cursor = self._execute(query, tuple(params))
-            self.conn.commit()
+            cursor = self._execute_write(query, tuple(params))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"User update failed: {str(e)}")
@@ -244,144 +1528,223 @@ class UserDatabase(BaseDatabase):
     def delete_user(self, user_id: str) -> bool:
         """Delete a user by ID."""
         try:
-            cursor = self._execute('DELETE FROM users WHERE userId = ?', (user_id,))
-            self.conn.commit()
+            cursor = self._execute_write('DELETE FROM users WHERE userId = ?', (user_id,))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"User deletion failed: {str(e)}")
             return False
 
+class WellValidationError(ValueError):
+    """Raised by create_well when the input does not pass WellSchema; errors maps input field -> message."""
+
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        super().__init__('Invalid well fields: ' + '; '.join(f'{k}: {v}' for k, v in errors.items()))
+
+class WellSchema:
+    """
+    Maps a well input dict (app field names or column names) to a wells row,
+    coercing and validating every field in one pass. Built once per process;
+    normalize() never touches the database.
+    """
+
+    # input field -> (column, kind)
+    FIELDS = {
+        'wellName': ('name', 'text'),
+        'wellOwner': ('owner', 'text'),
+        'wellLocation': ('location', 'json'),
+        'wellWaterLevel': ('water_level', 'real'),
+        'wellStatus': ('status', 'text'),
+        'waterQuality': ('water_quality', 'json'),
+        'wellWaterType': ('wellWaterType', 'text'),
+        'wellCapacity': ('wellCapacity', 'real'),
+        'wellWaterConsumption': ('wellWaterConsumption', 'real'),
+        'extraData': ('extraData', 'json'),
+        'lastUpdated': ('last_update', 'timestamp'),
+        'ownerId': ('ownerId', 'any'),
+        'espId': ('espId', 'text'),
+        'description': ('description', 'text'),
+        'latitude': ('latitude', 'latitude'),
+        'longitude': ('longitude', 'longitude'),
+        'contact_info': ('contact_info', 'text'),
+        'access_info': ('access_info', 'text'),
+        'notes': ('notes', 'text'),
+    }
+
+    def __init__(self):
+        coercers = {
+            'text': self._text,
+            'real': self._real,
+            'json': BaseDatabase._canonical_json,
+            'timestamp': self._timestamp,
+            'latitude': lambda field, value: self._coordinate(field, value, 90),
+            'longitude': lambda field, value: self._coordinate(field, value, 180),
+            'any': lambda field, value: value,
+        }
+        self._fields = {name: (column, coercers[kind]) for name, (column, kind) in self.FIELDS.items()}
+
+    @staticmethod
+    def _text(field: str, value: Any) -> str:
+        if isinstance(value, (dict, list)):
+            raise ValueError("expected text")
+        return value if isinstance(value, str) else str(value)
+
+    @staticmethod
+    def _real(field: str, value: Any) -> float:
+        if isinstance(value, bool):
+            raise ValueError("expected a number")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"expected a number, got {value!r}")
+
+    @staticmethod
+    def _timestamp(field: str, value: Any) -> str:
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if not isinstance(value, str):
+            raise ValueError("expected an ISO timestamp")
+        return value
+
+    @classmethod
+    def _coordinate(cls, field: str, value: Any, bound: int) -> float:
+        value = cls._real(field, value)
+        if not -bound <= value <= bound:
+            raise ValueError(f"must be between -{bound} and {bound}")
+        return value
+
+    def normalize(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Returns:
+            (row, errors) - row is column -> value ready to insert, errors is
+            input field -> message (empty when the input is valid)
+        """
+        row: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for name, value in data.items():
+            spec = self._fields.get(name)
+            if spec is None or value is None:
+                continue
+            column, coerce = spec
+            try:
+                row[column] = coerce(name, value)
+            except ValueError as e:
+                errors[name] = str(e)
+
+        if 'name' not in row:
+            row['name'] = f"Well {row['espId']}" if 'espId' in row else "Unnamed Well"
+
+        if 'latitude' not in row and 'location' in row and 'latitude' not in errors:
+            location = json.loads(row['location'])
+            if isinstance(location, dict):
+                for axis, bound in (('latitude', 90), ('longitude', 180)):
+                    if axis not in row and location.get(axis) is not None:
+                        try:
+                            row[axis] = self._coordinate(axis, location[axis], bound)
+                        except ValueError as e:
+                            errors['wellLocation'] = f"{axis} {e}"
+        row.setdefault('latitude', 0.0)
+        row.setdefault('longitude', 0.0)
+        if 'location' not in row:
+            row['location'] = json.dumps({'latitude': row['latitude'], 'longitude': row['longitude']})
+        if 'last_update' not in row:
+            row['last_update'] = datetime.now().isoformat()
+        return row, errors
+
 class WellDatabase(BaseDatabase):
     """Handles all well-related database operations."""
 
+    TABLE = 'wells'
+    KEY_COLUMN = 'id'
+    UPDATED_COLUMN = 'lastUpdated'
+    JSON_FIELDS = ['location', 'wellLocation', 'water_quality', 'waterQuality', 'extraData']
+    # create_well stores waterQuality in water_quality; the Node server writes waterQuality
+    JSON_COLUMNS = [
+        JsonColumn('waterQualityPh', 'waterQuality', '$.ph', 'REAL', fallback='water_quality'),
+    ]
+    SEARCH_FIELDS = ['name', 'wellName', 'description', 'notes', 'owner', 'wellOwner']
+    NODE_READ_FIELDS = ['id', 'espId', 'wellName', 'wellOwner', 'wellLocation', 'wellWaterType', 'wellCapacity',
+                        'wellWaterLevel', 'wellWaterConsumption', 'extraData', 'wellStatus', 'lastUpdated',
+                        'waterQuality', 'createdAt', 'updatedAt']
+    READING_FIELDS = ['waterLevel', 'waterConsumption', 'ph', 'turbidity', 'tds']
+    SCHEMA = WellSchema()
+    # Cluster cells are Web Mercator tiles split CLUSTER_CELL_BITS times per axis (4x4 cells per tile)
+    CLUSTER_MAX_ZOOM = 16
+    CLUSTER_CELL_BITS = 2
+    MERCATOR_MAX_LATITUDE = 85.05112878
+
     def get_well(self, well_id: int) -> Optional[Dict[str, Any]]:
         """Get a well by ID."""
-        cursor = self._execute('SELECT * FROM wells WHERE id = ?', (well_id,))
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM wells WHERE id = ?', (well_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
 
     def get_well_by_esp_id(self, esp_id: str) -> Optional[Dict[str, Any]]:
         """Get a well by ESP ID."""
-        cursor = self._execute('SELECT * FROM wells WHERE espId = ?', (esp_id,))
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM wells WHERE espId = ?', (esp_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
 
-    def get_all_wells(self) -> List[Dict[str, Any]]:
-        """Get all wells."""
-        cursor = self._execute('SELECT * FROM wells')
+    def get_all_wells(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Get all wells, optionally filtered in SQL by columns or JSON paths (e.g. {'waterQuality.ph': 7.0})."""
+        where_sql, params = self._where_clause(filters or {})
+        cursor = self._execute(f'SELECT {self._select_columns()} FROM wells WHERE {where_sql}', params)
         return [dict(row) for row in cursor.fetchall()]
 
-    def create_well(self, well_data: Dict[str, Any]) -> bool:
-        """Create a new well with flexible field mapping."""
-
-        # Define field mappings - map from input field names to database column names
-        field_mappings = {
-            'wellName': 'name',
-            'wellOwner': 'owner',
-            'wellLocation': 'location',
-            'wellWaterLevel': 'water_level',
-            'wellStatus': 'status',
-            'waterQuality': 'water_quality',
-            'wellWaterType': 'wellWaterType',
-            'wellCapacity': 'wellCapacity',
-            'wellWaterConsumption': 'wellWaterConsumption',
-            'extraData': 'extraData',
-            'lastUpdated': 'last_update',
-            'ownerId': 'ownerId'
-        }
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Search wells by name, description, notes or owner, best matches first."""
+        return [dict(row) for row in self._search('wells_fts', 'wells', text, limit)]
 
-        # Create a copy of the input data
-        prepared_data = {}
-
-        # Map fields from input to database schema
-        for input_field, db_field in field_mappings.items():
-            if input_field in well_data:
-                prepared_data[db_field] = well_data[input_field]
-
-        # Handle direct field mappings (where input field name = db field name)
-        direct_fields = ['espId', 'description', 'latitude', 'longitude', 'contact_info', 'access_info', 'notes']
-        for field in direct_fields:
-            if field in well_data:
-                prepared_data[field] = well_data[field]
-
-        # Handle required fields with fallbacks
-        # For 'name' field (required)
-        if 'name' not in prepared_data:
-            if 'wellName' in well_data:
-                prepared_data['name'] = well_data['wellName']
-            elif 'espId' in well_data:
-                prepared_data['name'] = f"Well {well_data['espId']}"
-            else:
-                prepared_data['name'] = "Unnamed Well"
+    def validate_well(self, well_data: Dict[str, Any]) -> Dict[str, str]:
+        """Check well input without writing it; returns input field -> error message."""
+        return self.SCHEMA.normalize(well_data)[1]
 
-        # For 'latitude' and 'longitude' (required)
-        if 'latitude' not in prepared_data:
-            if 'wellLocation' in well_data and isinstance(well_data['wellLocation'], str):
-                try:
-                    location_data = json.loads(well_data['wellLocation'])
-                    prepared_data['latitude'] = location_data.get('latitude', 0.0)
-                    prepared_data['longitude'] = location_data.get('longitude', 0.0)
-                except:
-                    prepared_data['latitude'] = 0.0
-                    prepared_data['longitude'] = 0.0
-            else:
-                prepared_data['latitude'] = well_data.get('latitude', 0.0)
-                prepared_data['longitude'] = well_data.get('longitude', 0.0)
-
-        if 'longitude' not in prepared_data:
-            prepared_data['longitude'] = well_data.get('longitude', 0.0)
-
-        # Handle location field (should be JSON string)
-        if 'location' not in prepared_data:
-            location_obj = {
-                'latitude': prepared_data.get('latitude', 0.0),
-                'longitude': prepared_data.get('longitude', 0.0)
-            }
-            prepared_data['location'] = json.dumps(location_obj)
-
-        # Ensure JSON fields are properly serialized
-        json_fields = ['water_quality', 'waterQuality', 'extraData', 'location']
-        for field in json_fields:
-            if field in prepared_data and prepared_data[field] is not None:
-                if not isinstance(prepared_data[field], str):
-                    prepared_data[field] = json.dumps(prepared_data[field])
+    def create_well(self, well_data: Dict[str, Any], well_id: Optional[int] = None) -> Union[int, bool]:
+        """
+        Create a new well from app field names (wellName, wellLocation, ...) or
+        column names with a single INSERT.
 
-        # Set default timestamp if not provided
-        if 'last_update' not in prepared_data:
-            prepared_data['last_update'] = datetime.now().isoformat()
+        Args:
+            well_data: Well fields
+            well_id: Explicit id (WellRouter allocates the ids of wells in other shards)
 
-        # Validate that we have the minimum required fields
-        required_fields = ['name', 'latitude', 'longitude']
-        missing_fields = [field for field in required_fields if field not in prepared_data or prepared_data[field] is None]
-        if missing_fields:
-            raise ValueError(f"Missing required well fields: {missing_fields}")
+        Returns:
+            The new well ID, or False if the insert failed
+
+        Raises:
+            WellValidationError: if any field fails validation (nothing is written)
+        """
+        prepared_data, errors = self.SCHEMA.normalize(well_data)
+        if errors:
+            raise WellValidationError(errors)
+        prepared_data = self._compress('wells', prepared_data)
+        if well_id is not None:
+            prepared_data['id'] = well_id
 
-        # Execute insert
         columns = ', '.join(prepared_data.keys())
         placeholders = ', '.join(['?' for _ in prepared_data])
         query = f'INSERT INTO wells ({columns}) VALUES ({placeholders})'
 
         try:
-            cursor = self._execute(query, tuple(prepared_data.values()))
-            self.conn.commit()
+            cursor = self._execute_write(query, tuple(prepared_data.values()))
             return cursor.lastrowid  # Return the ID of the created well
         except sqlite3.Error as e:
             print(f"Well creation failed: {str(e)}")
-            print(f"Prepared data: {prepared_data}")
             return False
 
     def update_well(self, well_id: int, updates: Dict[str, Any]) -> bool:
         """Update a well's information."""
+        updates = self._without_generated(updates)
         if not updates:
             return False
 
+        updates = self._compress('wells', updates)
         set_clause = ', '.join([f'{k} = ?' for k in updates.keys()])
         query = f'UPDATE wells SET {set_clause} WHERE id = ?'
         params = list(updates.values()) + [well_id]
 
         try:
-            cursor = self._execute(query, tuple(params))
-            self.conn.commit()
+            cursor = self._execute_write(query, tuple(params))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Well update failed: {str(e)}")
@@ -390,16 +1753,636 @@ class WellDatabase(BaseDatabase):
     def delete_well(self, well_id: int) -> bool:
         """Delete a well by ID."""
         try:
-            cursor = self._execute('DELETE FROM wells WHERE id = ?', (well_id,))
-            self.conn.commit()
+            cursor = self._execute_write('DELETE FROM wells WHERE id = ?', (well_id,))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Well deletion failed: {str(e)}")
             return False
 
+    def add_reading(self, well_id: int, reading: Dict[str, Any], recorded_at: Optional[str] = None) -> bool:
+        """Append one sensor reading (READING_FIELDS) to a well's history."""
+        values = [reading.get(field) for field in self.READING_FIELDS]
+        query = (f"INSERT INTO well_readings (wellId, recordedAt, {', '.join(self.READING_FIELDS)}) "
+                 f"VALUES (?, ?, {', '.join('?' for _ in self.READING_FIELDS)})")
+        try:
+            self._execute_write(query, (well_id, recorded_at or datetime.now().isoformat(), *values))
+            return True
+        except sqlite3.Error as e:
+            print(f"Reading insert failed: {str(e)}")
+            return False
+
+    def get_readings(self, well_id: int, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get a well's readings in time order, optionally limited to [since, until).
+        Only the live table is read; readings_archive.series also covers archived readings.
+        """
+        query = 'SELECT * FROM well_readings WHERE wellId = ?'
+        params: List[Any] = [well_id]
+        if since:
+            query += ' AND recordedAt >= ?'
+            params.append(since)
+        if until:
+            query += ' AND recordedAt < ?'
+            params.append(until)
+        cursor = self._execute(query + ' ORDER BY recordedAt', tuple(params))
+        return [dict(row) for row in cursor.fetchall()]
+
+    # Owner and contact columns a merged well takes from its duplicates when its own are empty
+    MERGE_FILL_COLUMNS = ['ownerId', 'owner', 'wellOwner', 'contact_info', 'access_info', 'description', 'notes']
+
+    def merge_wells(self, keep_id: int, duplicate_ids: List[int]) -> Dict[str, int]:
+        """
+        Fold duplicate wells into keep_id in one transaction: readings are re-pointed,
+        empty owner/contact columns are filled from the duplicates (lowest id first)
+        and the duplicates are deleted.
+
+        Returns:
+            {'readings': readings moved, 'filled': columns filled, 'deleted': wells deleted}
+        """
+        duplicate_ids = sorted(set(duplicate_ids) - {keep_id})
+        if not duplicate_ids:
+            raise ValueError('No duplicate wells to merge')
+        placeholders = ', '.join('?' for _ in duplicate_ids)
+        ids = tuple(duplicate_ids)
+        try:
+            with self.write_transaction():
+                found = self._execute(f'SELECT id FROM wells WHERE id IN (?, {placeholders})', (keep_id, *ids))
+                missing = {keep_id, *ids} - {row[0] for row in found}
+                if missing:
+                    raise ValueError(f"Unknown wells: {sorted(missing)}")
+                readings = self._execute(
+                    f'UPDATE well_readings SET wellId = ? WHERE wellId IN ({placeholders})', (keep_id, *ids)).rowcount
+                filled = 0
+                for column in self.MERGE_FILL_COLUMNS:
+                    filled += self._execute(f'''
+                        UPDATE wells SET {column} = (
+                            SELECT {column} FROM wells
+                            WHERE id IN ({placeholders}) AND {column} IS NOT NULL AND {column} != ''
+                            ORDER BY id LIMIT 1
+                        )
+                        WHERE id = ? AND ({column} IS NULL OR {column} = '') AND EXISTS (
+                            SELECT 1 FROM wells WHERE id IN ({placeholders}) AND {column} IS NOT NULL AND {column} != ''
+                        )
+                    ''', (*ids, keep_id, *ids)).rowcount
+                if filled and self.UPDATED_COLUMN:
+                    self._execute(f'UPDATE wells SET {self.UPDATED_COLUMN} = ? WHERE id = ?',
+                                  (datetime.now().isoformat(), keep_id))
+                deleted = self._execute(f'DELETE FROM wells WHERE id IN ({placeholders})', ids).rowcount
+        except sqlite3.Error as e:
+            print(f"Well merge failed: {str(e)}")
+            raise
+        return {'readings': readings, 'filled': filled, 'deleted': deleted}
+
+    @classmethod
+    def cluster_cell(cls, latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+        """Cluster cell (x, y) containing a point at a zoom level, in Web Mercator."""
+        cells = 1 << (zoom + cls.CLUSTER_CELL_BITS)
+        latitude = max(-cls.MERCATOR_MAX_LATITUDE, min(cls.MERCATOR_MAX_LATITUDE, latitude))
+        phi = math.radians(latitude)
+        x = (longitude + 180) / 360 * cells
+        y = (1 - math.log(math.tan(phi) + 1 / math.cos(phi)) / math.pi) / 2 * cells
+        return min(int(x), cells - 1), min(int(y), cells - 1)
+
+    def clusters(self, bbox: Tuple[float, float, float, float], zoom: int) -> List[Dict[str, Any]]:
+        """
+        Get the well clusters in a map view from the precomputed pyramid (see well_clusters.py).
+
+        Args:
+            bbox: (min latitude, min longitude, max latitude, max longitude); min longitude
+                greater than max longitude means the view crosses the antimeridian
+            zoom: Map zoom level; above CLUSTER_MAX_ZOOM the finest level is returned
+
+        Returns:
+            One dict per non-empty cell: count, centroid latitude/longitude, statusCounts
+            and wellId when the cell holds a single well
+        """
+        zoom = max(0, min(int(zoom), self.CLUSTER_MAX_ZOOM))
+        min_lat, min_lon, max_lat, max_lon = bbox
+        min_x, min_y = self.cluster_cell(max_lat, min_lon, zoom)  # y grows southwards
+        max_x, max_y = self.cluster_cell(min_lat, max_lon, zoom)
+        ranges = [(min_x, max_x)] if min_lon <= max_lon else [(min_x, (1 << (zoom + self.CLUSTER_CELL_BITS)) - 1),
+                                                               (0, max_x)]
+        clusters = []
+        for first_x, last_x in ranges:
+            cursor = self._execute('''
+                SELECT cellX, cellY, SUM(count) AS count,
+                       SUM(sumLatitude) / SUM(count) AS latitude,
+                       SUM(sumLongitude) / SUM(count) AS longitude,
+                       MIN(wellId) AS wellId,
+                       json_group_object(status, count) AS statusCounts
+                FROM well_clusters
+                WHERE zoom = ? AND cellX BETWEEN ? AND ? AND cellY BETWEEN ? AND ?
+                GROUP BY cellX, cellY
+            ''', (zoom, first_x, last_x, min_y, max_y))
+            for row in cursor.fetchall():
+                cluster = self._parse_json_fields(row, ['statusCounts'])
+                if cluster['count'] > 1:
+                    cluster['wellId'] = None
+                clusters.append(cluster)
+        return clusters
+
+class WellRouter:
+    """
+    Wells spread over several shards (see DatabaseManager.add_well_shard and
+    well_shards.py). Point operations go to the one shard holding the well;
+    scans and aggregates run on every shard in parallel, each task on its own
+    connection. The shard map is read when the router is created: call reload()
+    after changing it.
+
+    A new well goes to the smallest bbox region containing it, else to the hash
+    bucket of its espId, else to the default shard. Its id always comes from the
+    default shard's AUTOINCREMENT counter (the one the Node server's inserts
+    use), so ids stay unique across shards and a well keeps its id when it is
+    moved. Create wells in the other shards through the router only. espId
+    uniqueness is enforced per shard, so across shards it holds when espIds are
+    routed by hash alone.
+    """
+
+    LOCATION_CACHE_SIZE = 100000
+
+    def __init__(self, manager: DatabaseManager, max_workers: Optional[int] = None):
+        self.manager = manager
+        self.reload()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards))
+
+    def reload(self):
+        """Read the shard map again."""
+        self.shards = self.manager.well_shards()
+        self._locations: Dict[int, str] = {}  # well id -> shard last seen holding it
+        regions = self.manager.well_regions()
+        self.boxes = sorted((r for r in regions if r['kind'] == 'bbox'), key=self._box_area)
+        self.buckets = [r for r in regions if r['kind'] == 'hash']
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self) -> 'WellRouter':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _box_area(region: Dict[str, Any]) -> float:
+        width = region['maxLongitude'] - region['minLongitude']
+        return (region['maxLatitude'] - region['minLatitude']) * (width if width >= 0 else width + 360)
+
+    @staticmethod
+    def _in_box(region: Dict[str, Any], latitude: float, longitude: float) -> bool:
+        if not region['minLatitude'] <= latitude <= region['maxLatitude']:
+            return False
+        if region['minLongitude'] <= region['maxLongitude']:
+            return region['minLongitude'] <= longitude <= region['maxLongitude']
+        return longitude >= region['minLongitude'] or longitude <= region['maxLongitude']  # crosses the antimeridian
+
+    def route(self, latitude: float, longitude: float, esp_id: Optional[str]) -> str:
+        """Shard a well with these coordinates and espId belongs in."""
+        for region in self.boxes:
+            if self._in_box(region, latitude, longitude):
+                return region['shard']
+        if esp_id:
+            # crc32, not hash(): it has to agree between processes
+            digest = zlib.crc32(str(esp_id).encode('utf-8'))
+            for region in self.buckets:
+                if digest % region['hashBuckets'] == region['hashBucket']:
+                    return region['shard']
+        return DatabaseManager.DEFAULT_WELL_SHARD
+
+    def shard_for(self, well_data: Dict[str, Any]) -> str:
+        """Shard for well input as accepted by WellDatabase.create_well."""
+        row = WellDatabase.SCHEMA.normalize(well_data)[0]
+        return self.route(row['latitude'], row['longitude'], row.get('espId'))
+
+    def _run(self, shard: str, operation):
+        wells_db = self.manager.wells(shard)
+        try:
+            return operation(wells_db)
+        finally:
+            wells_db.conn.close()
+
+    def map(self, operation, shards: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Run operation(WellDatabase) on every shard (or the given ones) in parallel: {shard: result}."""
+        futures = {shard: self.pool.submit(self._run, shard, operation) for shard in shards or self.shards}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def locate(self, well_id: int) -> Optional[str]:
+        """Shard holding a well, asking every shard in parallel."""
+        def holds(wells_db: WellDatabase) -> bool:
+            return wells_db._execute('SELECT 1 FROM wells WHERE id = ?', (well_id,)).fetchone() is not None
+
+        shard = next((shard for shard, held in self.map(holds).items() if held), None)
+        if shard is not None:
+            if len(self._locations) >= self.LOCATION_CACHE_SIZE:
+                self._locations.clear()
+            self._locations[well_id] = shard
+        return shard
+
+    def _on_well(self, well_id: int, operation, missing: Any = None) -> Any:
+        """
+        Run operation on the shard holding well_id. An empty result is checked
+        against a fresh locate, which follows wells a rebalance moved meanwhile.
+        """
+        shard = self._locations.get(well_id) or self.locate(well_id)
+        for _ in range(len(self.shards)):
+            if shard is None:
+                break
+            result = self._run(shard, operation)
+            if result:
+                return result
+            moved_to = self.locate(well_id)
+            if moved_to == shard:
+                return result
+            shard = moved_to
+        return missing
+
+    def _allocate_id(self) -> int:
+        """Take the next well id from the default shard's counter."""
+        def next_id(wells_db: WellDatabase) -> int:
+            with wells_db.write_transaction():
+                wells_db._execute("""
+                    INSERT INTO sqlite_sequence (name, seq) SELECT 'wells', 0
+                    WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'wells')
+                """)
+                # AUTOINCREMENT itself never goes below the largest id present
+                wells_db._execute("""
+                    UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT COALESCE(MAX(id), 0) FROM wells)) + 1
+                    WHERE name = 'wells'
+                """)
+                return wells_db._execute("SELECT seq FROM sqlite_sequence WHERE name = 'wells'").fetchone()[0]
+
+        return self._run(DatabaseManager.DEFAULT_WELL_SHARD, next_id)
+
+    def reserve_ids(self, up_to: int):
+        """Make _allocate_id (and the Node server's inserts) hand out ids above up_to, e.g. after an import."""
+        def reserve(wells_db: WellDatabase):
+            with wells_db.write_transaction():
+                wells_db._execute("""
+                    INSERT INTO sqlite_sequence (name, seq) SELECT 'wells', 0
+                    WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'wells')
+                """)
+                wells_db._execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'wells'", (up_to,))
+
+        self._run(DatabaseManager.DEFAULT_WELL_SHARD, reserve)
+
+    def create_well(self, well_data: Dict[str, Any]) -> Union[int, bool]:
+        """Create a well in the shard its region routes to; see WellDatabase.create_well."""
+        shard = self.shard_for(well_data)
+        well_id = None if shard == DatabaseManager.DEFAULT_WELL_SHARD else self._allocate_id()
+        created = self._run(shard, lambda wells_db: wells_db.create_well(well_data, well_id))
+        if created:
+            self._locations[created] = shard
+        return created
+
+    def get_well(self, well_id: int) -> Optional[Dict[str, Any]]:
+        return self._on_well(well_id, lambda wells_db: wells_db.get_well(well_id))
+
+    def get_well_by_esp_id(self, esp_id: str) -> Optional[Dict[str, Any]]:
+        """Only the espId's hash shard is read when no bbox region could hold the well, else every shard."""
+        if not self.boxes:
+            well = self._run(self.route(0.0, 0.0, esp_id), lambda wells_db: wells_db.get_well_by_esp_id(esp_id))
+            if well:
+                return well
+        found = self.map(lambda wells_db: wells_db.get_well_by_esp_id(esp_id))
+        return next((well for well in found.values() if well), None)
+
+    def update_well(self, well_id: int, updates: Dict[str, Any]) -> bool:
+        """Update a well where it is; a well moved out of its region stays put until well_shards.py place."""
+        return self._on_well(well_id, lambda wells_db: wells_db.update_well(well_id, updates), False)
+
+    def delete_well(self, well_id: int) -> bool:
+        return self._on_well(well_id, lambda wells_db: wells_db.delete_well(well_id), False)
+
+    def json_remove_indices(self, well_id: int, field: str, indices: List[int]) -> int:
+        """Remove list items from one well's JSON array column; see BaseDatabase.json_remove_indices."""
+        return self._on_well(well_id, lambda wells_db: wells_db.json_remove_indices(field, indices, {'id': well_id}), 0)
+
+    def add_reading(self, well_id: int, reading: Dict[str, Any], recorded_at: Optional[str] = None) -> bool:
+        """Append a reading in the well's shard; False for unknown wells."""
+        def insert(wells_db: WellDatabase) -> bool:
+            # Checked inside the write transaction, so the well cannot be moved away before the insert
+            with wells_db.write_transaction():
+                if wells_db._execute('SELECT 1 FROM wells WHERE id = ?', (well_id,)).fetchone() is None:
+                    return False
+                return wells_db.add_reading(well_id, reading, recorded_at)
+
+        return self._on_well(well_id, insert, False)
+
+    def get_readings(self, well_id: int, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self._on_well(well_id, lambda wells_db: wells_db.get_readings(well_id, since, until), [])
+
+    def get_all_wells(self, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Wells of every shard, ordered by id; filters as in WellDatabase.get_all_wells."""
+        found = self.map(lambda wells_db: wells_db.get_all_wells(filters))
+        return sorted((well for wells in found.values() for well in wells), key=lambda well: well['id'])
+
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Best limit matches over all shards, by full-text rank."""
+        found = self.map(lambda wells_db: wells_db.search(text, limit))
+        return sorted((well for wells in found.values() for well in wells), key=lambda well: well['searchRank'])[:limit]
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        def count_shard(wells_db: WellDatabase) -> int:
+            where_sql, params = wells_db._where_clause(filters or {})
+            return wells_db._execute(f'SELECT COUNT(*) FROM wells WHERE {where_sql}', params).fetchone()[0]
+
+        return sum(self.map(count_shard).values())
+
+    def count_by(self, key: str, filters: Optional[Dict[str, Any]] = None) -> Dict[Any, int]:
+        """Number of wells per value of a column or JSON path (e.g. 'status'), over all shards."""
+        def count_shard(wells_db: WellDatabase) -> List[tuple]:
+            columns = set(wells_db.table_columns('wells', include_generated=True))
+            expression = wells_db._filter_expression(key, columns)
+            where_sql, params = wells_db._where_clause(filters or {})
+            return wells_db._execute(
+                f'SELECT {expression}, COUNT(*) FROM wells WHERE {where_sql} GROUP BY 1', params).fetchall()
+
+        counts: Dict[Any, int] = {}
+        for rows in self.map(count_shard).values():
+            for value, count in rows:
+                counts[value] = counts.get(value, 0) + count
+        return counts
+
+class ReadReplica:
+    """
+    In-memory copies of the databases for read-only analytics, see
+    DatabaseManager.enable_read_replica. Every database is copied with the
+    backup API into a shared-cache :memory: database. The interfaces handed out
+    here open query_only connections to that copy, so analytic queries never
+    touch (or lock) the primary files.
+
+    refresh() attaches each primary read-only and, one short transaction per
+    batch, upserts the rows of its tracked tables that changed in change_log
+    since the last refresh and deletes the ones gone from the primary, so a row
+    that still exists never disappears from the copy while it is updated.
+    APPENDED_TABLES get the rows added since (and are copied again whole when
+    rows were also deleted). Everything else - well merges re-pointing readings
+    in place, the nearest-well and cluster tables - stays as of the last
+    reload(), which copies the whole file again and also runs when change_log
+    was compacted past the replica's cursor. Readers do not block a refresh and
+    may see one half applied: some rows of the batch already updated, others
+    not yet.
+    """
+
+    # Tables outside change_log that grow by appending: table -> INTEGER PRIMARY KEY
+    APPENDED_TABLES = {'well_readings': 'id', 'reading_blocks': 'blockId'}
+
+    def __init__(self, manager: DatabaseManager, databases: Optional[List[str]] = None,
+                 refresh_interval: Optional[float] = None, batch_size: int = 5000):
+        """
+        Args:
+            manager: Manager whose databases are copied
+            databases: Databases to copy (default: all, wells shards included)
+            refresh_interval: Seconds after which handing out an interface refreshes first (None: only refresh())
+            batch_size: change_log entries applied per transaction
+        """
+        unknown = set(databases or []) - set(manager.databases)
+        if unknown:
+            raise ValueError(f"Unknown databases: {sorted(unknown)}")
+        self.manager = manager
+        self.databases = list(databases or manager.databases)
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.versions: Dict[str, int] = {}  # change_log version each copy is current to
+        self.refreshed_at = time.monotonic()
+        self._copies: Dict[str, sqlite3.Connection] = {}  # keeps each memory database alive and writes its refreshes
+        self._uris: Dict[str, str] = {}
+        self._generation = 0
+        self._lock = threading.RLock()
+        self.reload()
+
+    def _source(self, db_name: str) -> str:
+        return Path(self.manager.databases[db_name].path).resolve().as_uri() + '?mode=ro'
+
+    def reload(self, db_name: Optional[str] = None):
+        """Copy a database (default: every one) again; open readers keep the previous copy until they close."""
+        with self._lock:
+            for name in [db_name] if db_name else self.databases:
+                self._generation += 1
+                uri = f'file:replica-{id(self)}-{self._generation}-{name}?mode=memory&cache=shared'
+                copy = sqlite3.connect(uri, uri=True, timeout=self.manager._busy_timeout(), check_same_thread=False)
+                source = sqlite3.connect(self._source(name), uri=True, timeout=self.manager._busy_timeout())
+                try:
+                    source.backup(copy)  # a single step: one read transaction on the primary
+                except sqlite3.Error as e:
+                    print(f"Error copying {name} into the read replica: {str(e)}")
+                    copy.close()
+                    raise
+                finally:
+                    source.close()
+                config = self.manager.databases[name]
+                if config.tracked_tables:
+                    self.versions[name] = BaseDatabase(copy).change_log_version()
+                # Changes are applied from the primary's change_log; the copy does not log them again
+                for table in config.tracked_tables:
+                    for operation in ('insert', 'update', 'delete'):
+                        copy.execute(f'DROP TRIGGER IF EXISTS {table}_changes_{operation}')
+                copy.execute('PRAGMA recursive_triggers = ON')  # rows dropped by REPLACE leave the search index too
+                copy.execute('CREATE TEMP TABLE changed_keys (tableName TEXT NOT NULL, rowKey NOT NULL)')
+                copy.execute('ATTACH DATABASE ? AS source', (self._source(name),))
+                previous = self._copies.get(name)
+                self._copies[name], self._uris[name] = copy, uri
+                if previous:
+                    previous.close()
+            self.refreshed_at = time.monotonic()
+
+    def refresh(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Apply what changed on the primaries since the last refresh.
+
+        Returns:
+            Per database: {'changes': rows replaced or deleted, 'appended': rows added,
+            'recopied': tables copied whole, 'reloaded': whether the whole file was copied}
+        """
+        report = {}
+        with self._lock:
+            for name in self.databases:
+                try:
+                    report[name] = self._refresh_database(name)
+                except sqlite3.Error as e:
+                    print(f"Error refreshing the read replica of {name}: {str(e)}")
+                    raise
+            self.refreshed_at = time.monotonic()
+        return report
+
+    def _refresh_database(self, name: str) -> Dict[str, Any]:
+        copy = self._copies[name]
+        config = self.manager.databases[name]
+        report: Dict[str, Any] = {'changes': 0, 'appended': 0, 'recopied': [], 'reloaded': False}
+        if config.tracked_tables:
+            compacted = copy.execute(
+                "SELECT value FROM source.change_log_state WHERE name = 'compactedThrough'").fetchone()
+            if compacted and self.versions[name] < compacted[0]:
+                self.reload(name)
+                report['reloaded'] = True
+                return report
+            while self._apply_changes(name, copy, config, report):
+                pass
+        for table, key in self.APPENDED_TABLES.items():
+            if table in config.schema:
+                self._append(copy, table, key, report)
+        return report
+
+    @staticmethod
+    def _stored_columns(copy: sqlite3.Connection, table: str) -> str:
+        return ', '.join(row[0] for row in copy.execute('SELECT name FROM main.pragma_table_info(?)', (table,)))
+
+    @staticmethod
+    def _unique_columns(copy: sqlite3.Connection, table: str, key: str) -> List[List[str]]:
+        """Column lists of table's UNIQUE indexes other than the key's."""
+        unique = []
+        for index in copy.execute('SELECT name FROM main.pragma_index_list(?) WHERE "unique"', (table,)).fetchall():
+            columns = [row[0] for row in copy.execute('SELECT name FROM main.pragma_index_info(?)', (index[0],))]
+            if columns != [key] and None not in columns:
+                unique.append(columns)
+        return unique
+
+    def _apply_changes(self, name: str, copy: sqlite3.Connection, config: DatabaseConfig,
+                       report: Dict[str, Any]) -> bool:
+        """Upsert or delete the rows of the next batch of change_log entries; False when there was none."""
+        since = self.versions[name]
+        copy.execute('BEGIN')  # one read snapshot of the primary for the whole batch
+        try:
+            window_end = copy.execute('''
+                SELECT MAX(version) FROM (SELECT version FROM source.change_log WHERE version > ? ORDER BY version LIMIT ?)
+            ''', (since, self.batch_size)).fetchone()[0]
+            if window_end is None:
+                copy.rollback()
+                return False
+            copy.execute('DELETE FROM temp.changed_keys')
+            copy.execute('''
+                INSERT INTO temp.changed_keys SELECT DISTINCT tableName, rowKey FROM source.change_log
+                WHERE version > ? AND version <= ?
+            ''', (since, window_end))
+            for table, key in config.tracked_tables.items():
+                columns = self._stored_columns(copy, table)
+                keys = 'SELECT rowKey FROM temp.changed_keys WHERE tableName = ?'
+                copy.execute(f'''
+                    DELETE FROM main.{table} WHERE {key} IN ({keys})
+                    AND {key} NOT IN (SELECT {key} FROM source.{table} WHERE {key} IN ({keys}))
+                ''', (table, table))
+                # A row whose UNIQUE value another row took on the primary is out of date here anyway;
+                # it goes (and comes back with the batch holding its own change) so the upsert cannot fail
+                for unique in self._unique_columns(copy, table, key):
+                    matches = ' AND '.join(f's.{column} = m.{column}' for column in unique)
+                    copy.execute(f'''
+                        DELETE FROM main.{table} WHERE rowid IN (
+                            SELECT m.rowid FROM source.{table} s JOIN main.{table} m ON {matches}
+                            WHERE s.{key} IN ({keys}) AND s.{key} IS NOT m.{key})
+                    ''', (table,))
+                updates = ', '.join(f'{column} = excluded.{column}' for column in columns.split(', ') if column != key)
+                copy.execute(f'''
+                    INSERT INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table} WHERE {key} IN ({keys})
+                    ON CONFLICT ({key}) DO UPDATE SET {updates}
+                ''', (table,))
+            report['changes'] += copy.execute('SELECT COUNT(*) FROM temp.changed_keys').fetchone()[0]
+            copy.commit()
+        except BaseException:
+            copy.rollback()
+            raise
+        self.versions[name] = window_end
+        return True
+
+    def _append(self, copy: sqlite3.Connection, table: str, key: str, report: Dict[str, Any]):
+        """Copy the rows added to an appended table; copy it whole when the row counts still differ."""
+        columns = self._stored_columns(copy, table)
+        copy.execute('BEGIN')
+        try:
+            last = copy.execute(f'SELECT MAX({key}) FROM main.{table}').fetchone()[0]
+            report['appended'] += copy.execute(f'''
+                INSERT INTO main.{table} ({columns}) SELECT {columns} FROM source.{table} WHERE {key} > ?
+            ''', (last if last is not None else -2 ** 63,)).rowcount
+            counts = copy.execute(f'SELECT (SELECT COUNT(*) FROM main.{table}), (SELECT COUNT(*) FROM source.{table})').fetchone()
+            if counts[0] != counts[1]:
+                copy.execute(f'DELETE FROM main.{table}')
+                copy.execute(f'INSERT INTO main.{table} ({columns}) SELECT {columns} FROM source.{table}')
+                report['recopied'].append(table)
+            copy.commit()
+        except BaseException:
+            copy.rollback()
+            raise
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Per database: the copy's change_log version, the primary's, and how many versions it is behind."""
+        status = {}
+        with self._lock:
+            for name in self.databases:
+                entry: Dict[str, Any] = {'uri': self._uris[name]}
+                if name in self.versions:
+                    row = self._copies[name].execute(
+                        "SELECT seq FROM source.sqlite_sequence WHERE name = 'change_log'").fetchone()
+                    primary = row[0] if row else 0
+                    entry.update(version=self.versions[name], primaryVersion=primary,
+                                 behind=primary - self.versions[name])
+                status[name] = entry
+        return dict(status, secondsSinceRefresh=round(time.monotonic() - self.refreshed_at, 3))
+
+    def _connect(self, db_name: str) -> sqlite3.Connection:
+        if db_name not in self._uris:
+            raise ValueError(f"Database {db_name} is not replicated")
+        if self.refresh_interval is not None and time.monotonic() - self.refreshed_at >= self.refresh_interval:
+            self.refresh()
+        conn = sqlite3.connect(self._uris[db_name], uri=True)
+        self._configure_reader(conn)
+        codec = self.manager.codecs.get(db_name)
+        conn.row_factory = codec.row_factory if codec else sqlite3.Row
+        return conn
+
+    def _configure_reader(self, conn: sqlite3.Connection):
+        conn.execute('PRAGMA query_only = ON')
+        # Without table read locks, readers never hold up a refresh
+        conn.execute('PRAGMA read_uncommitted = ON')
+        if self.manager.stats:
+            self.manager.stats.attach(conn)
+
+    def users(self) -> 'UserDatabase':
+        """Read-only users interface on the in-memory copy."""
+        return UserDatabase(self._connect('users'), self.manager.stats, None, self.manager.codecs.get('users'))
+
+    def wells(self, shard: str = DatabaseManager.DEFAULT_WELL_SHARD) -> 'WellDatabase':
+        """Read-only wells interface on the in-memory copy of a shard."""
+        return WellDatabase(self._connect(shard), self.manager.stats, None, self.manager.codecs.get(shard))
+
+    def deviceTokens(self) -> 'DeviceTokenDatabase':
+        """Read-only device tokens interface on the in-memory copy."""
+        return DeviceTokenDatabase(self._connect('deviceTokens'), self.manager.stats, None,
+                                   self.manager.codecs.get('deviceTokens'))
+
+    def attached(self) -> 'AttachedDatabase':
+        """Read-only cross-database interface with every copy attached under its database name."""
+        if self.refresh_interval is not None and time.monotonic() - self.refreshed_at >= self.refresh_interval:
+            self.refresh()
+        conn = sqlite3.connect('file::memory:', uri=True)
+        for name in self.databases:
+            conn.execute(f'ATTACH DATABASE ? AS {name}', (self._uris[name],))
+        self._configure_reader(conn)
+        conn.row_factory = self.manager._attached_row_factory()
+        return AttachedDatabase(conn, self.manager.stats, None)
+
+    def close(self):
+        with self._lock:
+            for copy in self._copies.values():
+                copy.close()
+            self._copies.clear()
+            self._uris.clear()
+
+    def __enter__(self) -> 'ReadReplica':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 class DeviceTokenDatabase(BaseDatabase):
     """Handles all device token-related database operations."""
 
+    TABLE = 'device_tokens'
+    KEY_COLUMN = 'tokenId'
+    NODE_READ_FIELDS = ['tokenId', 'userId', 'token', 'deviceType', 'lastUsed', 'isActive', 'createdAt', 'updatedAt']
+
+    def get_all_tokens(self) -> List[Dict[str, Any]]:
+        """Get all device tokens."""
+        return self.query().all()
+
     def get_tokens_by_user(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all device tokens for a user."""
         cursor = self._execute('SELECT * FROM device_tokens WHERE userId = ?', (user_id,))
@@ -421,8 +2404,7 @@ class DeviceTokenDatabase(BaseDatabase):
         query = f'INSERT INTO device_tokens ({columns}) VALUES ({placeholders})'
 
         try:
-            self._execute(query, tuple(token_data.values()))
-            self.conn.commit()
+            self._execute_write(query, tuple(token_data.values()))
             return True
         except sqlite3.Error as e:
             print(f"Token addition failed: {str(e)}")
@@ -438,8 +2420,7 @@ class DeviceTokenDatabase(BaseDatabase):
         params = list(updates.values()) + [token_id]
 
         try:
-            cursor = self._execute(query, tuple(params))
-            self.conn.commit()
+            cursor = self._execute_write(query, tuple(params))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Token update failed: {str(e)}")
@@ -448,8 +2429,7 @@ class DeviceTokenDatabase(BaseDatabase):
     def delete_token(self, token_id: str) -> bool:
         """Delete a device token by ID."""
         try:
-            cursor = self._execute('DELETE FROM device_tokens WHERE tokenId = ?', (token_id,))
-            self.conn.commit()
+            cursor = self._execute_write('DELETE FROM device_tokens WHERE tokenId = ?', (token_id,))
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             print(f"Token deletion failed: {str(e)}")
@@ -466,18 +2446,138 @@ class DeviceTokenDatabase(BaseDatabase):
 
             if cursor.fetchone():
                 # Update last used timestamp
-                self._execute('''
+                self._execute_write('''
                     UPDATE device_tokens 
                     SET lastUsed = ?
                     WHERE userId = ? AND token = ?
                 ''', (datetime.now().isoformat(), user_id, token))
-                self.conn.commit()
                 return True
             return False
         except sqlite3.Error as e:
             print(f"Token verification failed: {str(e)}")
             return False
 
+class AttachedDatabase(BaseDatabase):
+    """Runs joined queries across the users, wells and deviceTokens databases.
+
+    The three files are attached to one connection, so tables are addressed as
+    users.users, wells.wells and deviceTokens.device_tokens. SQLite cannot
+    enforce foreign keys across attached files; use orphaned_tokens() to check
+    the device_tokens -> users link instead.
+    """
+
+    OWNER_COLUMNS = '''
+        u.email AS ownerEmail,
+        u.firstName AS ownerFirstName,
+        u.lastName AS ownerLastName,
+        u.phoneNumber AS ownerPhoneNumber
+    '''
+
+    def wells_with_owner(self, owner_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get wells with their owner's details, optionally for a single owner."""
+        query = f'''
+            SELECT w.*, {self.OWNER_COLUMNS}
+            FROM wells.wells w
+            LEFT JOIN users.users u ON u.userId = w.ownerId
+        '''
+        params: tuple = ()
+        if owner_id is not None:
+            query += ' WHERE w.ownerId = ?'
+            params = (owner_id,)
+        cursor = self._execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def wells_with_owner_tokens(self, owner_id: str) -> List[Dict[str, Any]]:
+        """Get a user's wells together with the owner's active device tokens."""
+        cursor = self._execute(f'''
+            SELECT w.*, {self.OWNER_COLUMNS},
+                   (SELECT json_group_array(t.token)
+                    FROM deviceTokens.device_tokens t
+                    WHERE t.userId = w.ownerId AND t.isActive = 1) AS ownerTokens
+            FROM wells.wells w
+            LEFT JOIN users.users u ON u.userId = w.ownerId
+            WHERE w.ownerId = ?
+        ''', (owner_id,))
+        return [self._parse_json_fields(row, ['ownerTokens']) for row in cursor.fetchall()]
+
+    def users_with_active_tokens(self, user_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Get users that have at least one active token, with their tokens as a list."""
+        query = '''
+            SELECT u.*, json_group_array(t.token) AS tokens
+            FROM users.users u
+            JOIN deviceTokens.device_tokens t ON t.userId = u.userId
+            WHERE t.isActive = 1
+        '''
+        params: tuple = ()
+        if user_ids is not None:
+            if not user_ids:
+                return []
+            query += f" AND u.userId IN ({', '.join('?' for _ in user_ids)})"
+            params = tuple(user_ids)
+        query += ' GROUP BY u.userId'
+        cursor = self._execute(query, params)
+        return [self._parse_json_fields(row, UserDatabase.JSON_FIELDS + ['tokens'])
+                for row in cursor.fetchall()]
+
+    def owner_of_well(self, well_id: int) -> Optional[Dict[str, Any]]:
+        """Get the user owning a well, with parsed JSON fields."""
+        cursor = self._execute('''
+            SELECT u.*
+            FROM wells.wells w
+            JOIN users.users u ON u.userId = w.ownerId
+            WHERE w.id = ?
+        ''', (well_id,))
+        row = cursor.fetchone()
+        return self._parse_json_fields(row, UserDatabase.JSON_FIELDS) if row else None
+
+    def orphaned_tokens(self) -> List[Dict[str, Any]]:
+        """Get device tokens whose userId does not match any user."""
+        cursor = self._execute('''
+            SELECT t.*
+            FROM deviceTokens.device_tokens t
+            LEFT JOIN users.users u ON u.userId = t.userId
+            WHERE u.userId IS NULL
+        ''')
+        return [dict(row) for row in cursor.fetchall()]
+
+    def purge_tokens(self, inactive: bool = False, unused_before: Optional[str] = None,
+                     orphaned: bool = False, dry_run: bool = False) -> int:
+        """
+        Delete device tokens matching any of the given criteria in one DELETE.
+
+        Args:
+            inactive: Tokens with isActive = 0
+            unused_before: Tokens whose lastUsed is before this timestamp
+            orphaned: Tokens whose userId does not match any user
+            dry_run: Only count the matching tokens
+
+        Returns:
+            Number of tokens deleted (or that would be)
+        """
+        conditions, params = [], []
+        if inactive:
+            conditions.append('isActive = 0')
+        if unused_before is not None:
+            conditions.append('lastUsed < ?')
+            params.append(unused_before)
+        if orphaned:
+            conditions.append('NOT EXISTS (SELECT 1 FROM users.users u WHERE u.userId = device_tokens.userId)')
+        if not conditions:
+            raise ValueError('purge_tokens needs at least one criterion')
+        where_sql = ' OR '.join(f'({condition})' for condition in conditions)
+        if dry_run:
+            return self._execute(f'SELECT COUNT(*) FROM deviceTokens.device_tokens WHERE {where_sql}',
+                                 tuple(params)).fetchone()[0]
+        try:
+            return self._execute_write(f'DELETE FROM deviceTokens.device_tokens WHERE {where_sql}',
+                                       tuple(params)).rowcount
+        except sqlite3.Error as e:
+            print(f"Token purge failed: {str(e)}")
+            raise
+
+# table -> interface class, for settings that depend on a table's declared fields
+TABLE_INTERFACES = {'users': UserDatabase, 'wells': WellDatabase, 'device_tokens': DeviceTokenDatabase}
+
 # Helper functions for user management
 def generate_random_user() -> Dict[str, Any]:
     """Generate a random user with realistic test data."""
@@ -577,10 +2677,10 @@ def display_users(users: List[Dict[str, Any]]) -> None:
         print(f"{idx:<5} | {email:<30} | {name:<20} | {role:<10} | {last_active:<20} | {user_id}")
     print("-" * 100)
 
-# Initialize the database manager
-db = DatabaseManager()
-
 if __name__ == "__main__":
+    # Initialize the database manager (not on import: that would create the databases in the caller's directory)
+    db = DatabaseManager()
+
     # Example usage
     user_db = db.users()
 
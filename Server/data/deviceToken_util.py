@@ -3,6 +3,7 @@ import json
 import sqlite3
 from datetime import datetime
 from database_manager import DatabaseManager
+from profiler import run_main
 
 db = DatabaseManager()
 
@@ -122,4 +123,4 @@ def main():
             print("Invalid choice.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    run_main(main)
@@ -0,0 +1,310 @@
+"""
+python export_tool.py export --table users --format ndjson --output users.ndjson
+python export_tool.py export --table wells --format csv --output wells.csv
+python export_tool.py import --table users --input users.ndjson --on-conflict ignore
+python export_tool.py --data-dir /opt/bluebridge/data export --table wells --output wells.ndjson
+python export_tool.py benchmark --rows 100000
+
+Streams tables out of the SQLite databases as NDJSON, CSV or Parquet (when
+pyarrow is installed) and loads them back through BaseDatabase.bulk_insert.
+Rows are read and written in cursor batches, so memory use does not grow with
+table size.
+
+wells is exported from every shard, one after the other. On import each well
+goes to the shard WellRouter routes it to: the file is read once per shard and
+each shard is loaded in its own transaction. Wells without an id that land
+outside the default shard get one from the shared id counter.
+"""
+
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+from database_manager import DatabaseManager, UserDatabase, WellDatabase, BaseDatabase, generate_random_user
+from profiler import run_main
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# table -> JSON columns; the databases holding it come from DatabaseManager
+TABLES = {
+    'users': UserDatabase.JSON_FIELDS,
+    'wells': WellDatabase.JSON_FIELDS,
+    'device_tokens': [],
+}
+FORMATS = ['ndjson', 'csv', 'parquet']
+BATCH_SIZE = 5000
+
+def _database(manager: DatabaseManager, db_name: str) -> BaseDatabase:
+    return BaseDatabase(manager._get_connection(db_name), manager.stats, manager.retry_policy,
+                        manager.codecs.get(db_name))
+
+def _databases_for(manager: DatabaseManager, table: str) -> List[BaseDatabase]:
+    """An interface per database holding table (every shard for wells)."""
+    if table not in TABLES:
+        raise ValueError(f"Unknown table: {table}")
+    return [_database(manager, db_name) for db_name in manager._databases_of(table)]
+
+def _decode_json(row: Dict[str, Any], json_fields: List[str]) -> Dict[str, Any]:
+    """Turn JSON text columns into nested values; text that is not valid JSON is kept as-is."""
+    for field in json_fields:
+        value = row.get(field)
+        if isinstance(value, str):
+            try:
+                row[field] = json.loads(value)
+            except json.JSONDecodeError:
+                pass
+    return row
+
+def iter_batches(database: BaseDatabase, table: str, batch_size: int = BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows of a table as lists of dicts, batch_size rows at a time (generated columns excluded)."""
+    cursor = database._execute(f"SELECT {', '.join(database.table_columns(table))} FROM {table}")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield [dict(row) for row in rows]
+
+def iter_table(databases: List[BaseDatabase], table: str) -> Iterator[List[Dict[str, Any]]]:
+    """iter_batches over each database holding table in turn."""
+    for database in databases:
+        yield from iter_batches(database, table)
+
+def export_ndjson(databases: List[BaseDatabase], table: str, output: str, json_fields: List[str]) -> int:
+    count = 0
+    with open(output, 'w', encoding='utf-8') as f:
+        for batch in iter_table(databases, table):
+            f.writelines(json.dumps(_decode_json(row, json_fields), ensure_ascii=False) + '\n' for row in batch)
+            count += len(batch)
+    return count
+
+def export_csv(databases: List[BaseDatabase], table: str, output: str) -> int:
+    """Write CSV with JSON columns left as JSON text; NULL is written as an empty field."""
+    count = 0
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(databases[0].table_columns(table))
+        for batch in iter_table(databases, table):
+            writer.writerows(['' if v is None else v for v in row.values()] for row in batch)
+            count += len(batch)
+    return count
+
+def _arrow_schema(database: BaseDatabase, table: str):
+    """Map declared SQLite column types to Arrow types; JSON columns stay as strings."""
+    cursor = database._execute('SELECT name, type FROM pragma_table_info(?)', (table,))
+    fields = []
+    for name, declared in cursor.fetchall():
+        declared = (declared or '').upper()
+        if 'INT' in declared or 'BOOL' in declared:
+            arrow_type = pa.int64()
+        elif 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+def _coerce(value: Any, arrow_type) -> Any:
+    """SQLite columns are loosely typed; coerce values that don't fit the declared type."""
+    if value is None:
+        return None
+    try:
+        if pa.types.is_integer(arrow_type):
+            return int(value)
+        if pa.types.is_floating(arrow_type):
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+def export_parquet(databases: List[BaseDatabase], table: str, output: str) -> int:
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = _arrow_schema(databases[0], table)
+    count = 0
+    with pq.ParquetWriter(output, schema, compression='zstd') as writer:
+        for batch in iter_table(databases, table):
+            columns = {
+                f.name: [_coerce(row[f.name], f.type) for row in batch]
+                for f in schema
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(batch)
+    return count
+
+def export_table(manager: DatabaseManager, table: str, fmt: str, output: str) -> int:
+    """Export a whole table to a file; returns the number of rows written."""
+    databases = _databases_for(manager, table)
+    try:
+        if fmt == 'ndjson':
+            return export_ndjson(databases, table, output, TABLES[table])
+        if fmt == 'csv':
+            return export_csv(databases, table, output)
+        if fmt == 'parquet':
+            return export_parquet(databases, table, output)
+        raise ValueError(f"Unknown format: {fmt}")
+    finally:
+        for database in databases:
+            database.conn.close()
+
+def read_rows(fmt: str, path: str) -> Iterator[Dict[str, Any]]:
+    """Stream row dicts back out of an exported file."""
+    if fmt == 'ndjson':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif fmt == 'csv':
+        with open(path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield {k: (None if v == '' else v) for k, v in row.items()}
+    elif fmt == 'parquet':
+        if pq is None:
+            raise RuntimeError("Parquet import requires pyarrow (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_SIZE):
+            yield from batch.to_pylist()
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+def import_wells(manager: DatabaseManager, fmt: str, path: str, on_conflict: str = 'abort') -> int:
+    """Load exported wells into the shards they route to, one pass over the file and one transaction per shard."""
+    with manager.well_router() as router:
+        largest_id = 0
+
+        def routed(shard: str) -> Iterator[Dict[str, Any]]:
+            nonlocal largest_id
+            for row in read_rows(fmt, path):
+                if router.shard_for(row) != shard:
+                    continue
+                if shard != DatabaseManager.DEFAULT_WELL_SHARD:
+                    if row.get('id') is None:
+                        row['id'] = router._allocate_id()
+                    largest_id = max(largest_id, int(row['id']))
+                yield row
+
+        written = 0
+        for shard in router.shards:
+            database = _database(manager, shard)
+            try:
+                written += database.bulk_insert('wells', routed(shard), on_conflict=on_conflict, batch_size=BATCH_SIZE)
+            finally:
+                database.conn.close()
+        if largest_id:
+            # Explicit ids written outside the default shard must never be handed out again
+            router.reserve_ids(largest_id)
+    return written
+
+def import_table(manager: DatabaseManager, table: str, fmt: str, path: str, on_conflict: str = 'abort') -> int:
+    """Load an exported file into a table in one transaction (per shard for wells); returns the rows written."""
+    if table == 'wells':
+        return import_wells(manager, fmt, path, on_conflict)
+    database = _databases_for(manager, table)[0]
+    try:
+        return database.bulk_insert(table, read_rows(fmt, path), on_conflict=on_conflict, batch_size=BATCH_SIZE)
+    finally:
+        database.conn.close()
+
+def guess_format(path: str) -> str:
+    suffix = Path(path).suffix.lower().lstrip('.')
+    return {'jsonl': 'ndjson', 'json': 'ndjson', 'pq': 'parquet'}.get(suffix, suffix)
+
+def benchmark(rows: int) -> List[Dict[str, Any]]:
+    """Export and re-import a synthetic users table in every available format and time it."""
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            manager = DatabaseManager()
+            users = BaseDatabase(manager._get_connection('users'))
+            # generate_random_user emails are short random hex, so skip the odd collision
+            users.bulk_insert('users', (generate_random_user() for _ in range(rows)), on_conflict='ignore')
+            users.conn.close()
+
+            for fmt in FORMATS:
+                if fmt == 'parquet' and pa is None:
+                    continue
+                path = os.path.join(tmp, f'users.{fmt}')
+                start = time.perf_counter()
+                exported = export_table(manager, 'users', fmt, path)
+                export_seconds = time.perf_counter() - start
+
+                # Import into a fresh database so every row is a real insert
+                os.rename('users.sqlite', f'users_{fmt}.sqlite')
+                DatabaseManager()
+                start = time.perf_counter()
+                imported = import_table(manager, 'users', fmt, path)
+                import_seconds = time.perf_counter() - start
+                os.remove('users.sqlite')
+                os.rename(f'users_{fmt}.sqlite', 'users.sqlite')
+
+                size_mb = os.path.getsize(path) / (1024 * 1024)
+                results.append({
+                    'format': fmt,
+                    'rows': exported,
+                    'fileMB': round(size_mb, 2),
+                    'exportRowsPerSec': round(exported / export_seconds),
+                    'exportMBPerSec': round(size_mb / export_seconds, 2),
+                    'importRowsPerSec': round(imported / import_seconds),
+                })
+        finally:
+            os.chdir(cwd)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk export/import tool for the SQLite databases')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export a table to a file')
+    export_parser.add_argument('--table', required=True, choices=list(TABLES))
+    export_parser.add_argument('--output', required=True, help='File to write')
+    export_parser.add_argument('--format', choices=FORMATS, help='Output format (default: from extension)')
+
+    import_parser = subparsers.add_parser('import', help='Import a file into a table')
+    import_parser.add_argument('--table', required=True, choices=list(TABLES))
+    import_parser.add_argument('--input', required=True, help='File to read')
+    import_parser.add_argument('--format', choices=FORMATS, help='Input format (default: from extension)')
+    import_parser.add_argument('--on-conflict', choices=list(BaseDatabase.CONFLICT_ACTIONS), default='abort',
+                               help='What to do with rows that violate a unique constraint')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Measure export/import throughput')
+    bench_parser.add_argument('--rows', type=int, default=100000, help='Synthetic users to generate')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'export':
+            fmt = args.format or guess_format(args.output)
+            start = time.perf_counter()
+            count = export_table(DatabaseManager(data_dir=args.data_dir), args.table, fmt, args.output)
+            print(f"Exported {count} rows from {args.table} to {args.output} in {time.perf_counter() - start:.2f}s")
+        elif args.command == 'import':
+            if not Path(args.input).exists():
+                print(f"Error: Input file '{args.input}' not found")
+                sys.exit(1)
+            fmt = args.format or guess_format(args.input)
+            start = time.perf_counter()
+            count = import_table(DatabaseManager(data_dir=args.data_dir), args.table, fmt, args.input, args.on_conflict)
+            print(f"Imported {count} rows into {args.table} in {time.perf_counter() - start:.2f}s")
+        elif args.command == 'benchmark':
+            for result in benchmark(args.rows):
+                print(json.dumps(result))
+    except (ValueError, RuntimeError, sqlite3.Error) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_main(main)
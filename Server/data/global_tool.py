@@ -4,6 +4,8 @@ import sys
 import subprocess
 from pathlib import Path
 
+from profiler import profile_args, run_main
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -27,13 +29,13 @@ def main():
 
         if choice == "1":
             clear_screen()
-            subprocess.run([sys.executable, str(script_dir / "users_util.py")])
+            subprocess.run([sys.executable, str(script_dir / "users_util.py"), *profile_args("users_util")])
         elif choice == "2":
             clear_screen()
-            subprocess.run([sys.executable, str(script_dir / "wells_util.py")])
+            subprocess.run([sys.executable, str(script_dir / "wells_util.py"), *profile_args("wells_util")])
         elif choice == "3":
             clear_screen()
-            subprocess.run([sys.executable, str(script_dir / "deviceToken_util.py")])
+            subprocess.run([sys.executable, str(script_dir / "deviceToken_util.py"), *profile_args("deviceToken_util")])
         elif choice == "4":
             print("Goodbye!")
             break
@@ -42,4 +44,4 @@ def main():
             input()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    run_main(main)
@@ -0,0 +1,244 @@
+"""
+python json_normalizer.py --dry-run
+python json_normalizer.py --tables users --workers 4 --report flagged.json
+python json_normalizer.py --data-dir /opt/bluebridge/data --tables wells
+
+Finds JSON columns in users and wells whose text is not plain JSON (values
+encoded twice, wrapped in stray quotes, escaped quotes, Python dict reprs) and
+rewrites them as canonical JSON. Rows are read in keyset-paginated chunks,
+repaired in a process pool and written back chunk by chunk in one transaction
+each. A value is only rewritten while it still holds the text that was read;
+one changed meanwhile is kept and counted as skipped. Values that cannot be
+repaired are left untouched and reported. wells is normalized in every shard.
+"""
+
+
+import argparse
+import ast
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database_manager import DatabaseManager, UserDatabase, WellDatabase, BaseDatabase
+from profiler import run_main
+
+# table -> (key column, JSON columns); the databases holding it come from DatabaseManager
+TABLES = {
+    'users': (UserDatabase.KEY_COLUMN, UserDatabase.JSON_FIELDS),
+    'wells': (WellDatabase.KEY_COLUMN, WellDatabase.JSON_FIELDS),
+}
+LOCATION_FIELDS = {'location', 'wellLocation'}
+MAX_UNWRAP = 5
+
+_INVALID = object()
+
+def _loads(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return _INVALID
+
+def _decode_loose(text: str) -> Any:
+    """Decode text that isn't JSON as-is: stray outer quotes, escaped quotes, Python reprs."""
+    stripped = text.strip()
+    # Same cleanup routes/nearbyUsers.js cleanAndParseLocation applies on every request
+    cleaned = stripped.strip('"').replace('\\"', '"')
+    value = _loads(cleaned)
+    if value is not _INVALID:
+        return value
+    try:
+        value = ast.literal_eval(stripped)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return _INVALID
+    return value if isinstance(value, (dict, list)) else _INVALID
+
+def _fix_location(value: Any) -> Tuple[Any, bool]:
+    """Coerce numeric-string coordinates; returns (value, valid)."""
+    if not isinstance(value, dict):
+        return value, False
+    fixed = dict(value)
+    for axis, bound in (('latitude', 90), ('longitude', 180)):
+        coordinate = fixed.get(axis)
+        if isinstance(coordinate, str):
+            try:
+                coordinate = fixed[axis] = float(coordinate)
+            except ValueError:
+                return value, False
+        if isinstance(coordinate, bool) or not isinstance(coordinate, (int, float)) or abs(coordinate) > bound:
+            return value, False
+    return fixed, True
+
+def repair_json(field: str, text: Any) -> Tuple[str, Any]:
+    """
+    Classify one stored value.
+
+    Returns:
+        ('ok', value) when the text is already plain JSON,
+        ('repaired', value) when it could be recovered (value is what to store),
+        ('invalid', reason) when it could not
+    """
+    if text is None or not isinstance(text, str):
+        return 'ok', text
+    if not text.strip():
+        return 'repaired', None
+
+    value = _loads(text)
+    status = 'ok'
+    if value is _INVALID:
+        value, status = _decode_loose(text), 'repaired'
+    unwraps = 0
+    while isinstance(value, str) and unwraps < MAX_UNWRAP:
+        inner = _loads(value)
+        value = inner if inner is not _INVALID else _decode_loose(value)
+        status, unwraps = 'repaired', unwraps + 1
+    if value is _INVALID or isinstance(value, str):
+        return 'invalid', 'not decodable as JSON'
+
+    if field in LOCATION_FIELDS:
+        fixed, valid = _fix_location(value)
+        if not valid:
+            return 'invalid', 'location is not {latitude, longitude} with numeric coordinates'
+        if fixed != value:
+            value, status = fixed, 'repaired'
+    return status, value
+
+def normalize_chunk(fields: List[str], rows: List[Tuple[Any, Dict[str, tuple]]]) -> Dict[str, Any]:
+    """
+    Worker: repair one chunk of (key, {field: (text, stored)}) rows. Each
+    update carries the stored value it replaces, so the write can check it.
+    """
+    result = {'updates': [], 'flagged': [], 'counts': {}}
+    for key, values in rows:
+        for field in fields:
+            text, stored = values[field]
+            status, value = repair_json(field, text)
+            counts = result['counts'].setdefault(field, {'ok': 0, 'repaired': 0, 'invalid': 0})
+            counts[status] += 1
+            if status == 'repaired':
+                result['updates'].append((field, None if value is None else json.dumps(value), key, stored))
+            elif status == 'invalid':
+                result['flagged'].append({'key': key, 'field': field, 'reason': value, 'value': text[:200]})
+    return result
+
+def iter_chunks(database: BaseDatabase, table: str, key_column: str, fields: List[str],
+                chunk_size: int) -> Iterator[List[Tuple[Any, Dict[str, tuple]]]]:
+    """
+    Read (key, {field: (text, stored)}) rows by rowid ranges so no cursor stays
+    open across writes. stored is the value as it is in the table (compressed
+    columns still compressed), text the decoded value.
+    """
+    decode = database.codec.decode if database.codec else (lambda value: value)
+    last_rowid = -1
+    while True:
+        cursor = database._execute(
+            f"SELECT rowid, {key_column}, {', '.join(fields)} FROM {table} "
+            f"WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield [(row[1], {field: (decode(row[field]), row[field]) for field in fields}) for row in rows]
+
+def write_updates(database: BaseDatabase, table: str, key_column: str, updates: List[tuple]) -> Tuple[set, int]:
+    """
+    Write one chunk of repairs in a single transaction. A value that no longer
+    holds what was read (written since) is left alone.
+
+    Returns:
+        (keys of the rows rewritten, number of values skipped)
+    """
+    rewritten, skipped = set(), 0
+    with database.write_transaction():
+        for field, text, key, stored in updates:
+            cursor = database.conn.execute(f'UPDATE {table} SET {field} = ? WHERE {key_column} = ? AND {field} IS ?',
+                                           (database._compress(table, {field: text})[field], key, stored))
+            if cursor.rowcount:
+                rewritten.add(key)
+            else:
+                skipped += 1
+    return rewritten, skipped
+
+def normalize_database(manager: DatabaseManager, db_name: str, table: str, workers: int, chunk_size: int,
+                       dry_run: bool, report: Dict[str, Any]):
+    """Normalize table in one database, adding to report."""
+    key_column, fields = TABLES[table]
+    database = BaseDatabase(manager._get_connection(db_name), manager.stats, manager.retry_policy,
+                            manager.codecs.get(db_name))
+    # Rows as stored: the writes compare against the stored value, compressed or not
+    database.conn.row_factory = sqlite3.Row
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            chunks = iter_chunks(database, table, key_column, fields, chunk_size)
+            while True:
+                # Keep a bounded number of chunks in flight so memory stays flat
+                while len(pending) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append(pool.submit(normalize_chunk, fields, chunk))
+                if not pending:
+                    break
+                result = pending.pop(0).result()
+                for field, counts in result['counts'].items():
+                    total = report['counts'].setdefault(field, {'ok': 0, 'repaired': 0, 'invalid': 0})
+                    for status, count in counts.items():
+                        total[status] += count
+                report['flagged'].extend(result['flagged'])
+                if dry_run:
+                    report['rowsRewritten'] += len({key for _, _, key, _ in result['updates']})
+                elif result['updates']:
+                    rewritten, skipped = write_updates(database, table, key_column, result['updates'])
+                    report['rowsRewritten'] += len(rewritten)
+                    report['skipped'] += skipped
+    finally:
+        database.conn.close()
+
+def normalize_table(manager: DatabaseManager, table: str, workers: int, chunk_size: int,
+                    dry_run: bool = False) -> Dict[str, Any]:
+    """Normalize table in every database holding it (each wells shard)."""
+    report = {'table': table, 'counts': {}, 'flagged': [], 'rowsRewritten': 0, 'skipped': 0}
+    for db_name in manager._databases_of(table):
+        normalize_database(manager, db_name, table, workers, chunk_size, dry_run, report)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Repair malformed or doubly-encoded JSON columns')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    parser.add_argument('--tables', nargs='+', choices=list(TABLES), default=list(TABLES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per chunk')
+    parser.add_argument('--dry-run', action='store_true', help='Only report, do not write')
+    parser.add_argument('--report', help='Write flagged values to this JSON file')
+
+    args = parser.parse_args()
+
+    manager = DatabaseManager(data_dir=args.data_dir)
+    flagged = []
+    for table in args.tables:
+        start = time.perf_counter()
+        report = normalize_table(manager, table, args.workers, args.chunk_size, args.dry_run)
+        print(f"\n{table} ({time.perf_counter() - start:.2f}s)")
+        for field, counts in report['counts'].items():
+            print(f"  {field:<25} ok={counts['ok']:<8} repaired={counts['repaired']:<8} invalid={counts['invalid']}")
+        repaired = sum(counts['repaired'] for counts in report['counts'].values()) - report['skipped']
+        action = 'would rewrite' if args.dry_run else 'rewrote'
+        print(f"  {action} {repaired} value(s) in {report['rowsRewritten']} row(s), {len(report['flagged'])} flagged"
+              + (f", {report['skipped']} skipped (changed since read)" if report['skipped'] else ''))
+        flagged.extend(dict(entry, table=table) for entry in report['flagged'])
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(flagged, f, indent=2, default=str)
+        print(f"\nFlagged values written to {args.report}")
+    elif flagged:
+        for entry in flagged[:20]:
+            print(f"  {entry['table']}.{entry['field']} [{entry['key']}]: {entry['reason']}")
+        if len(flagged) > 20:
+            print(f"  ... {len(flagged) - 20} more (use --report)")
+
+if __name__ == "__main__":
+    run_main(main)
@@ -13,6 +13,8 @@ import sys
 from pathlib import Path
 import re
 
+from profiler import run_main
+
 # Add a helper for validating table/column names
 SAFE_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
 
@@ -174,4 +176,4 @@ def main():
         migrator.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
@@ -0,0 +1,339 @@
+"""
+python nearest_wells.py rebuild --k 5 --workers 4
+python nearest_wells.py refresh
+python nearest_wells.py show 0000002a-5eed-4000-8000-000000000001
+
+Precomputes every user's k closest active wells into users.sqlite
+(user_nearest_wells), so the lookup is one primary-key read
+(UserDatabase.nearest_wells) instead of a scan of the wells table.
+
+rebuild loads the active wells into a KD-tree and queries it for every user in
+batches (in a process pool with --workers). refresh reads the change_log of
+users and wells since the last run and only recomputes users that moved, users
+whose list contains a changed well, and users for whom a new or moved well is
+closer than their current k-th well. It falls back to a rebuild when the log
+was compacted past its cursor or most rows changed.
+
+Points are unit vectors on the sphere. The straight-line (chord) distance
+between two of them orders points the same way as the haversine distance, so
+the tree can work in plain 3D. Chords are converted to km only for storage.
+"""
+
+
+import argparse
+import heapq
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database_manager import BaseDatabase, DatabaseManager
+from profiler import run_main
+
+EARTH_RADIUS_KM = 6371.0088
+ACTIVE_STATUSES = ('Active',)
+STATE_PREFIX = 'nearestWells.'
+Point = Tuple[float, float, float]
+
+def to_unit_vector(latitude: float, longitude: float) -> Point:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+def chord_to_km(squared_chord: float) -> float:
+    """Great-circle distance for a squared chord between unit vectors (same value as haversine)."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+def km_to_chord(km: float) -> float:
+    """Squared chord for a great-circle distance; inverse of chord_to_km."""
+    return (2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)) ** 2
+
+def valid_coordinates(latitude: Any, longitude: Any) -> bool:
+    return (isinstance(latitude, (int, float)) and isinstance(longitude, (int, float))
+            and not isinstance(latitude, bool) and not isinstance(longitude, bool)
+            and -90 <= latitude <= 90 and -180 <= longitude <= 180)
+
+class KDTree:
+    """Static 3D KD-tree answering k-nearest queries by squared Euclidean distance."""
+
+    LEAF_SIZE = 16
+
+    def __init__(self, points: Sequence[Point], ids: Sequence[Any]):
+        self.points = list(points)
+        self.ids = list(ids)
+        self._order = list(range(len(self.points)))
+        # (axis, split, left, right, start, end); leaves have axis -1 and cover _order[start:end]
+        self._nodes: List[tuple] = []
+        self._root = self._build(0, len(self.points)) if self.points else None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _build(self, start: int, end: int) -> int:
+        node = len(self._nodes)
+        if end - start <= self.LEAF_SIZE:
+            self._nodes.append((-1, 0.0, -1, -1, start, end))
+            return node
+        members = self._order[start:end]
+        spreads = [max(self.points[i][axis] for i in members) - min(self.points[i][axis] for i in members)
+                   for axis in range(3)]
+        axis = spreads.index(max(spreads))
+        members.sort(key=lambda i: self.points[i][axis])
+        self._order[start:end] = members
+        middle = (start + end) // 2
+        split = self.points[members[middle - start]][axis]  # before the children reorder their ranges
+        self._nodes.append(None)
+        left = self._build(start, middle)
+        right = self._build(middle, end)
+        self._nodes[node] = (axis, split, left, right, start, end)
+        return node
+
+    def nearest(self, point: Point, k: int) -> List[Tuple[float, Any]]:
+        """The k closest points as (squared distance, id), closest first."""
+        if self._root is None or k <= 0:
+            return []
+        points, order, nodes = self.points, self._order, self._nodes
+        qx, qy, qz = point
+        heap: List[Tuple[float, int]] = []  # (-squared distance, index): a max-heap of the best k
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(heap) == k and bound >= -heap[0][0]:
+                continue
+            axis, split, left, right, start, end = nodes[node]
+            if axis < 0:
+                for position in range(start, end):
+                    index = order[position]
+                    x, y, z = points[index]
+                    distance = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-distance, index))
+                    elif distance < -heap[0][0]:
+                        heapq.heapreplace(heap, (-distance, index))
+                continue
+            diff = point[axis] - split
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+        return [(-negative, self.ids[index]) for negative, index in sorted(heap, reverse=True)]
+
+# Worker state: each pool process builds the tree once in its initializer
+_tree: Optional[KDTree] = None
+
+def _init_worker(wells: List[Tuple[int, float, float]]):
+    global _tree
+    _tree = build_tree(wells)
+
+def build_tree(wells: List[Tuple[int, float, float]]) -> KDTree:
+    return KDTree([to_unit_vector(lat, lon) for _, lat, lon in wells], [well_id for well_id, _, _ in wells])
+
+def assign_chunk(users: List[Tuple[str, float, float]], k: int, tree: Optional[KDTree] = None) -> List[tuple]:
+    """(userId, rank, wellId, distanceKm) rows for a chunk of (userId, latitude, longitude)."""
+    tree = tree or _tree
+    rows = []
+    for user_id, latitude, longitude in users:
+        for rank, (distance, well_id) in enumerate(tree.nearest(to_unit_vector(latitude, longitude), k), 1):
+            rows.append((user_id, rank, well_id, round(chord_to_km(distance), 4)))
+    return rows
+
+def load_active_wells(wells_db: BaseDatabase) -> List[Tuple[int, float, float]]:
+    placeholders = ', '.join('?' for _ in ACTIVE_STATUSES)
+    cursor = wells_db._execute(
+        f'SELECT id, latitude, longitude FROM wells WHERE status IN ({placeholders})', ACTIVE_STATUSES)
+    return [(row[0], row[1], row[2]) for row in cursor if valid_coordinates(row[1], row[2])]
+
+def load_all_active_wells(manager: DatabaseManager) -> List[Tuple[int, float, float]]:
+    """Active wells of every wells shard, read in parallel."""
+    with manager.well_router() as router:
+        return [well for wells in router.map(load_active_wells).values() for well in wells]
+
+def iter_user_locations(users_db: BaseDatabase, chunk_size: int) -> Iterator[List[Tuple[str, float, float]]]:
+    """(userId, latitude, longitude) of every user with a usable location, in rowid-keyed chunks."""
+    last_rowid = -1
+    while True:
+        rows = users_db._execute('''
+            SELECT rowid, userId, json_extract(location, '$.latitude'), json_extract(location, '$.longitude')
+            FROM users
+            WHERE rowid > ? AND json_valid(location)
+            ORDER BY rowid LIMIT ?
+        ''', (last_rowid, chunk_size)).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        yield [(row[1], row[2], row[3]) for row in rows if valid_coordinates(row[2], row[3])]
+
+def read_state(users_db: BaseDatabase) -> Dict[str, int]:
+    cursor = users_db._execute('SELECT name, value FROM change_log_state WHERE name LIKE ?', (STATE_PREFIX + '%',))
+    return {row[0][len(STATE_PREFIX):]: row[1] for row in cursor}
+
+def write_state(users_db: BaseDatabase, state: Dict[str, int]):
+    users_db.conn.executemany('INSERT OR REPLACE INTO change_log_state (name, value) VALUES (?, ?)',
+                              [(STATE_PREFIX + name, value) for name, value in state.items()])
+
+def rebuild(manager: DatabaseManager, k: int = 5, workers: int = 1, chunk_size: int = 5000) -> Dict[str, Any]:
+    """Recompute every user's k nearest active wells and replace the table in one transaction."""
+    start = time.perf_counter()
+    # Taken first, so anything that changes while we compute is picked up by the next refresh
+    versions = manager.current_versions()
+    users_db = manager.users()
+    try:
+        wells = load_all_active_wells(manager)
+        rows: List[tuple] = []
+        users = 0
+        if workers > 1 and wells:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(wells,)) as pool:
+                pending = []
+                chunks = iter_user_locations(users_db, chunk_size)
+                while True:
+                    # Keep a bounded number of chunks in flight so memory stays flat
+                    while len(pending) < workers * 2:
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        users += len(chunk)
+                        pending.append(pool.submit(assign_chunk, chunk, k))
+                    if not pending:
+                        break
+                    rows.extend(pending.pop(0).result())
+        else:
+            tree = build_tree(wells)
+            for chunk in iter_user_locations(users_db, chunk_size):
+                users += len(chunk)
+                rows.extend(assign_chunk(chunk, k, tree))
+        computed = time.perf_counter()
+
+        with users_db.write_transaction():
+            users_db.conn.execute('DELETE FROM user_nearest_wells')
+            users_db.conn.executemany(
+                'INSERT INTO user_nearest_wells (userId, rank, wellId, distanceKm) VALUES (?, ?, ?, ?)', rows)
+            write_state(users_db, {'k': k, 'users': versions['users'],
+                                   **{shard: versions[shard] for shard in manager.well_shards()}})
+    finally:
+        users_db.conn.close()
+    return {'mode': 'rebuild', 'k': k, 'wells': len(wells), 'users': users, 'rows': len(rows),
+            'computeSeconds': round(computed - start, 4), 'seconds': round(time.perf_counter() - start, 4)}
+
+def read_changes(manager: DatabaseManager, state: Dict[str, int], batch_size: int) -> Optional[Dict[str, Any]]:
+    """Latest change per user and well since the stored cursor, or None when a resync is needed."""
+    # One cursor per wells shard; a shard added since the last run is read from its start
+    cursor = {name: value for name, value in state.items() if name != 'k'}
+    latest: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+    while True:
+        result = manager.changes_since(cursor, tables=['users', 'wells'], limit=batch_size)
+        if result['resyncRequired']:
+            return None
+        for change in result['changes']:
+            latest[(change['table'], change['key'])] = change
+        cursor = result['versions']
+        if not result['hasMore']:
+            return {'changes': latest, 'versions': cursor}
+
+def refresh(manager: DatabaseManager, rebuild_fraction: float = 0.2, batch_size: int = 5000,
+            workers: int = 1) -> Dict[str, Any]:
+    """Bring user_nearest_wells up to date with the change_log; rebuilds when that is cheaper or required."""
+    start = time.perf_counter()
+    users_db = manager.users()
+    try:
+        state = read_state(users_db)
+    finally:
+        users_db.conn.close()
+    if not {'k', 'users', 'wells'} <= state.keys():
+        return rebuild(manager, workers=workers)
+    k = state['k']
+    read = read_changes(manager, state, batch_size)
+    if read is None:
+        return dict(rebuild(manager, k, workers), reason='change_log compacted past cursor')
+
+    changed_users = {key: c['row'] for (table, key), c in read['changes'].items() if table == 'users'}
+    changed_wells = {key: c['row'] for (table, key), c in read['changes'].items() if table == 'wells'}
+    wells = load_all_active_wells(manager)
+    users_db = manager.users()
+    user_count = users_db._execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    if (len(changed_users) > rebuild_fraction * max(user_count, 1)
+            or len(changed_wells) > rebuild_fraction * max(len(wells), 1)):
+        users_db.conn.close()
+        return dict(rebuild(manager, k, workers), reason='too many changes')
+
+    try:
+        tree = build_tree(wells)
+        affected = set(changed_users)
+
+        if changed_wells:
+            # Users whose list holds a well that moved, changed status or disappeared
+            well_ids = list(changed_wells)
+            for i in range(0, len(well_ids), 500):
+                batch = well_ids[i:i + 500]
+                cursor = users_db._execute(
+                    f"SELECT DISTINCT userId FROM user_nearest_wells WHERE wellId IN ({', '.join('?' for _ in batch)})",
+                    tuple(batch))
+                affected.update(row[0] for row in cursor)
+            # Users for whom a new or moved active well beats their current k-th well
+            active_ids = {well_id for well_id, _, _ in wells}
+            candidates = [to_unit_vector(row['latitude'], row['longitude'])
+                          for well_id, row in changed_wells.items() if row is not None and well_id in active_ids]
+            if candidates:
+                kth = {row[0]: km_to_chord(row[1]) for row in users_db._execute(
+                    'SELECT userId, distanceKm FROM user_nearest_wells WHERE rank = ?', (k,))}
+                for chunk in iter_user_locations(users_db, batch_size):
+                    for user_id, latitude, longitude in chunk:
+                        if user_id in affected:
+                            continue
+                        limit = kth.get(user_id, math.inf)  # fewer than k wells so far: any new well counts
+                        ux, uy, uz = to_unit_vector(latitude, longitude)
+                        if any((x - ux) ** 2 + (y - uy) ** 2 + (z - uz) ** 2 < limit for x, y, z in candidates):
+                            affected.add(user_id)
+
+        locations = []
+        affected_list = list(affected)
+        for i in range(0, len(affected_list), 500):
+            batch = affected_list[i:i + 500]
+            cursor = users_db._execute(f'''
+                SELECT userId, json_extract(location, '$.latitude'), json_extract(location, '$.longitude')
+                FROM users WHERE userId IN ({', '.join('?' for _ in batch)}) AND json_valid(location)
+            ''', tuple(batch))
+            locations.extend((row[0], row[1], row[2]) for row in cursor if valid_coordinates(row[1], row[2]))
+        rows = assign_chunk(locations, k, tree)
+
+        with users_db.write_transaction():
+            users_db.conn.executemany('DELETE FROM user_nearest_wells WHERE userId = ?',
+                                      [(user_id,) for user_id in affected])
+            users_db.conn.executemany(
+                'INSERT INTO user_nearest_wells (userId, rank, wellId, distanceKm) VALUES (?, ?, ?, ?)', rows)
+            write_state(users_db, read['versions'])
+    finally:
+        users_db.conn.close()
+    return {'mode': 'refresh', 'k': k, 'changedUsers': len(changed_users), 'changedWells': len(changed_wells),
+            'recomputedUsers': len(affected), 'rows': len(rows), 'seconds': round(time.perf_counter() - start, 4)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the k nearest active wells of every user')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = commands.add_parser('rebuild', help='Recompute every assignment')
+    rebuild_parser.add_argument('--k', type=int, default=5, help='Wells kept per user')
+    refresh_parser = commands.add_parser('refresh', help='Recompute only what changed since the last run')
+    refresh_parser.add_argument('--rebuild-fraction', type=float, default=0.2,
+                                help='Rebuild instead when more than this fraction of users or wells changed')
+    for command_parser in (rebuild_parser, refresh_parser):
+        command_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+        command_parser.add_argument('--chunk-size', type=int, default=5000, help='Users per batch')
+    show_parser = commands.add_parser('show', help="Print a user's assigned wells")
+    show_parser.add_argument('user_id')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    if args.command == 'show':
+        users_db = manager.users()
+        for well in users_db.nearest_wells(args.user_id):
+            print(f"{well['rank']}: well {well['wellId']} ({well['distanceKm']:.2f} km)")
+        users_db.conn.close()
+        return
+    if args.command == 'rebuild':
+        report = rebuild(manager, args.k, args.workers, args.chunk_size)
+    else:
+        report = refresh(manager, args.rebuild_fraction, args.chunk_size, args.workers)
+    print(', '.join(f'{key}={value}' for key, value in report.items()))
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,218 @@
+"""
+python users_util.py --profile users.profile.json
+python json_normalizer.py --dry-run --profile normalizer.profile.json
+python profiler.py summary normalizer.profile.json
+python profiler.py collapsed normalizer.profile.json > normalizer.folded   # flamegraph.pl / speedscope / inferno
+
+Profiling mode for the data tools. Every entry point in Server/data accepts
+--profile REPORT (see run_main); library code can use the context manager:
+
+    with Profiler('report.json') as profiler:
+        manager.wells().get_all_wells()
+    print(profiler.report['queries'])
+
+One JSON report per run holds cProfile function stats, the tracemalloc peak and
+top allocating lines, per-statement timings from BaseDatabase._execute (a
+process-wide QueryStats, so interfaces created before profiling started are
+included) and stacks of the profiled thread sampled every few milliseconds in
+collapsed 'frame;frame;frame count' form. Only the calling thread and process
+are profiled; the worker processes of the pool-based tools are not.
+"""
+
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from query_stats import QueryStats, set_process_stats
+
+_active: Optional['Profiler'] = None
+
+class Profiler:
+    """Collects CPU, memory, query and stack-sample data between start() and stop()."""
+
+    def __init__(self, report_path: Optional[str] = None, sample_interval: float = 0.005,
+                 top: int = 30, slow_threshold: float = 0.05):
+        """
+        Args:
+            report_path: Write the JSON report here on stop() (None keeps it in .report only)
+            sample_interval: Seconds between stack samples
+            top: Number of functions, allocation sites and statements reported
+            slow_threshold: Statements slower than this (seconds) go to the slow-query log
+        """
+        self.report_path = report_path
+        self.sample_interval = sample_interval
+        self.top = top
+        self.report: Optional[Dict[str, Any]] = None
+        self.stats = QueryStats(slow_threshold=slow_threshold)
+        self._profile = cProfile.Profile()
+        self._stacks: Dict[str, int] = {}
+        self._samples = 0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._previous_stats: Optional[QueryStats] = None
+        self._started_tracemalloc = False
+
+    def start(self) -> 'Profiler':
+        global _active
+        self._thread_id = threading.get_ident()
+        self._started_at = datetime.now()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._previous_stats = set_process_stats(self.stats)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        self._profile.enable()
+        _active = self
+        return self
+
+    def stop(self) -> Dict[str, Any]:
+        global _active
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        set_process_stats(self._previous_stats)
+        _active = None
+
+        self.report = {
+            'command': ' '.join(sys.argv),
+            'startedAt': self._started_at.isoformat(),
+            'seconds': round(time.perf_counter() - self._wall_start, 6),
+            'cpuSeconds': round(time.process_time() - self._cpu_start, 6),
+            'functions': self._function_stats(),
+            'memory': {
+                'peakBytes': peak,
+                'currentBytes': current,
+                'topAllocations': [
+                    {'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                     'sizeBytes': stat.size, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.top]
+                ],
+            },
+            'queries': self.stats.to_dict(top=self.top),
+            'samples': {'intervalSeconds': self.sample_interval, 'count': self._samples},
+            'collapsedStacks': [f'{stack} {count}' for stack, count in
+                                sorted(self._stacks.items(), key=lambda item: item[1], reverse=True)],
+        }
+        if self.report_path:
+            Path(self.report_path).write_text(json.dumps(self.report, indent=2, default=str) + '\n')
+            print(f"Profile written to {self.report_path}", file=sys.stderr)
+        return self.report
+
+    def __enter__(self) -> 'Profiler':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sample(self):
+        """Sampler thread: record the profiled thread's stack, root first, every sample_interval."""
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}")
+                frame = frame.f_back
+            if frames:
+                stack = ';'.join(reversed(frames))
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self._samples += 1
+
+    def _function_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Top functions by cumulative and by own time."""
+        stats = pstats.Stats(self._profile).stats
+        rows = [{
+            'function': f'{os.path.basename(filename)}:{line}({name})',
+            'calls': calls,
+            'primitiveCalls': primitive,
+            'ownSeconds': round(own, 6),
+            'cumulativeSeconds': round(cumulative, 6),
+        } for (filename, line, name), (primitive, calls, own, cumulative, _) in stats.items()]
+        return {
+            'byCumulative': sorted(rows, key=lambda r: r['cumulativeSeconds'], reverse=True)[:self.top],
+            'byOwnTime': sorted(rows, key=lambda r: r['ownSeconds'], reverse=True)[:self.top],
+        }
+
+def profile_args(name: str) -> List[str]:
+    """--profile arguments for a child tool launched while profiling, e.g. run.json -> run.users_util.json."""
+    if _active is None or not _active.report_path:
+        return []
+    path = Path(_active.report_path)
+    return ['--profile', str(path.with_name(f'{path.stem}.{name}{path.suffix or ".json"}'))]
+
+def run_main(main: Callable[[], Any]):
+    """
+    Entry-point wrapper: removes '--profile REPORT' from sys.argv and, when it
+    was given, runs main under a Profiler writing REPORT (also on sys.exit).
+    """
+    argv, report_path = [sys.argv[0]], None
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg == '--profile':
+            report_path = next(args, None)
+            if report_path is None:
+                sys.exit('--profile needs a report file')
+        elif arg.startswith('--profile='):
+            report_path = arg.split('=', 1)[1]
+        else:
+            argv.append(arg)
+    if report_path is None:
+        return main()
+    sys.argv = argv
+    with Profiler(report_path):
+        return main()
+
+def print_summary(report: Dict[str, Any], limit: int):
+    print(f"{report['command']}")
+    print(f"  {report['seconds']:.3f}s wall, {report['cpuSeconds']:.3f}s CPU, "
+          f"peak memory {report['memory']['peakBytes'] / 1_048_576:.1f} MiB, {report['samples']['count']} samples")
+
+    print("\nTop functions (cumulative):")
+    for row in report['functions']['byCumulative'][:limit]:
+        print(f"  {row['cumulativeSeconds']:>10.4f}s {row['ownSeconds']:>10.4f}s {row['calls']:>9}  {row['function']}")
+
+    print("\nTop allocations:")
+    for row in report['memory']['topAllocations'][:limit]:
+        print(f"  {row['sizeBytes'] / 1024:>10.1f} KiB {row['count']:>9}  {row['location']}")
+
+    print("\nQueries (total time):")
+    for sql, stats in list(report['queries']['statements'].items())[:limit]:
+        print(f"  {stats['totalSeconds']:>10.4f}s {stats['calls']:>9}  {sql[:100]}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect reports written with --profile')
+    parser.add_argument('command', choices=['summary', 'collapsed'],
+                        help='summary: top functions, allocations and queries; collapsed: stacks for flame graphs')
+    parser.add_argument('report', help='Report file written by --profile')
+    parser.add_argument('--limit', type=int, default=15, help='Rows per summary section')
+
+    args = parser.parse_args()
+    report = json.loads(Path(args.report).read_text())
+    if args.command == 'collapsed':
+        print('\n'.join(report['collapsedStacks']))
+    else:
+        print_summary(report, args.limit)
+
+if __name__ == "__main__":
+    main()
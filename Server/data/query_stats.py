@@ -0,0 +1,289 @@
+"""
+Opt-in query instrumentation for BaseDatabase._execute.
+
+    stats = db.enable_instrumentation(slow_threshold=0.05)
+    ... run queries ...
+    print(stats.to_dict())
+    print(stats.to_prometheus())
+
+Statements are grouped by normalized SQL (literals and IN lists collapsed), and
+each group keeps a latency histogram, call/row/error counters and the slowest
+executions. Latency covers both execution and fetching, because SQLite only
+steps through a SELECT as rows are fetched.
+"""
+
+
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+def normalize_sql(sql: str) -> str:
+    """Reduce a statement to its shape so that executions with different values group together."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _SPACE_RE.sub(' ', sql).strip()
+    return _IN_LIST_RE.sub('IN (?...)', sql)
+
+def sample_params(params: Sequence[Any], max_params: int = 5, max_length: int = 40) -> List[str]:
+    """Keep a short, truncated sample of the parameters for the slow-query log."""
+    sample = []
+    for value in list(params)[:max_params]:
+        text = repr(value)
+        sample.append(text if len(text) <= max_length else text[:max_length - 3] + '...')
+    if len(params) > max_params:
+        sample.append(f'... ({len(params)} total)')
+    return sample
+
+_process_stats: Optional['QueryStats'] = None
+
+def set_process_stats(stats: Optional['QueryStats']) -> Optional['QueryStats']:
+    """
+    Record every BaseDatabase in this process that has no stats of its own into
+    stats (None stops it), including interfaces created before the call.
+    Returns the previous value so it can be restored. Used by profiler.Profiler.
+    """
+    global _process_stats
+    previous, _process_stats = _process_stats, stats
+    return previous
+
+def process_stats() -> Optional['QueryStats']:
+    return _process_stats
+
+class StatementStats:
+    """Counters and latency histogram for one normalized statement."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.traced = 0
+        self.progress_ticks = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+
+    def observe(self, seconds: float, rows: int):
+        self.calls += 1
+        self.rows += rows
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'totalSeconds': round(self.total_seconds, 6),
+            'meanSeconds': round(self.total_seconds / self.calls, 6) if self.calls else 0.0,
+            'maxSeconds': round(self.max_seconds, 6),
+            'traced': self.traced,
+            'progressTicks': self.progress_ticks,
+            'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets)),
+        }
+
+class QueryStats:
+    """Collects per-statement latency, row counts and a slow-query log."""
+
+    def __init__(self, slow_threshold: float = 0.1, slow_log_size: int = 100,
+                 trace: bool = False, progress_interval: int = 0):
+        """
+        Args:
+            slow_threshold: Executions slower than this (seconds) go to the slow-query log
+            slow_log_size: Number of slow executions kept (oldest are dropped)
+            trace: Install sqlite3 trace callbacks to also count statements run outside _execute
+                (executemany, trigger bodies, commits)
+            progress_interval: If > 0, install a progress handler every N VM instructions and
+                attribute the ticks to the running statement, as a measure of work done
+        """
+        self.slow_threshold = slow_threshold
+        self.trace = trace
+        self.progress_interval = progress_interval
+        self.statements: Dict[str, StatementStats] = {}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get(self, key: str) -> StatementStats:
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats()
+        return stats
+
+    def record(self, sql: str, params: Sequence[Any], seconds: float, rows: int):
+        key = normalize_sql(sql)
+        with self._lock:
+            self._get(key).observe(seconds, rows)
+            if seconds >= self.slow_threshold:
+                self.slow_queries.append({
+                    'sql': key,
+                    'seconds': round(seconds, 6),
+                    'rows': rows,
+                    'params': sample_params(params),
+                    'at': datetime.now().isoformat(),
+                })
+
+    def record_error(self, sql: str):
+        with self._lock:
+            self._get(normalize_sql(sql)).errors += 1
+
+    def attach(self, conn):
+        """Install the trace/progress callbacks this instance was configured with on a connection."""
+        if self.trace:
+            conn.set_trace_callback(self._on_trace)
+        if self.progress_interval > 0:
+            conn.set_progress_handler(self._on_progress, self.progress_interval)
+
+    def begin(self, sql: str):
+        """Mark sql as the statement running on this thread, for progress attribution."""
+        self._local.current = normalize_sql(sql)
+
+    def _on_trace(self, statement: str):
+        key = normalize_sql(statement)
+        with self._lock:
+            self._get(key).traced += 1
+
+    def _on_progress(self) -> int:
+        key = getattr(self._local, 'current', None)
+        if key is not None:
+            with self._lock:
+                self._get(key).progress_ticks += 1
+        return 0  # non-zero would abort the statement
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+
+    def to_dict(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """Snapshot of the collected data, statements ordered by total time spent."""
+        with self._lock:
+            ordered = sorted(self.statements.items(), key=lambda item: item[1].total_seconds, reverse=True)
+            if top is not None:
+                ordered = ordered[:top]
+            return {
+                'slowThreshold': self.slow_threshold,
+                'statements': {sql: stats.to_dict() for sql, stats in ordered},
+                'slowQueries': list(self.slow_queries),
+            }
+
+    def to_prometheus(self, prefix: str = 'bluebridge_sqlite') -> str:
+        """Render the histograms and counters in the Prometheus text exposition format."""
+        lines = [
+            f'# HELP {prefix}_query_duration_seconds Query latency by normalized statement.',
+            f'# TYPE {prefix}_query_duration_seconds histogram',
+        ]
+        counters = {'rows': [], 'errors': [], 'traced': []}
+        with self._lock:
+            for sql, stats in self.statements.items():
+                label = 'query="' + sql.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ') + '"'
+                if stats.traced:
+                    counters['traced'].append(f'{prefix}_statements_traced_total{{{label}}} {stats.traced}')
+                if not stats.calls and not stats.errors:
+                    continue  # only seen by the trace callback
+                cumulative = 0
+                for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], stats.buckets):
+                    cumulative += count
+                    lines.append(f'{prefix}_query_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_query_duration_seconds_sum{{{label}}} {stats.total_seconds}')
+                lines.append(f'{prefix}_query_duration_seconds_count{{{label}}} {stats.calls}')
+                counters['rows'].append(f'{prefix}_query_rows_total{{{label}}} {stats.rows}')
+                counters['errors'].append(f'{prefix}_query_errors_total{{{label}}} {stats.errors}')
+        lines.append(f'# HELP {prefix}_query_rows_total Rows returned or modified by normalized statement.')
+        lines.append(f'# TYPE {prefix}_query_rows_total counter')
+        lines.extend(counters['rows'])
+        lines.append(f'# HELP {prefix}_query_errors_total Failed executions by normalized statement.')
+        lines.append(f'# TYPE {prefix}_query_errors_total counter')
+        lines.extend(counters['errors'])
+        if counters['traced']:
+            lines.append(f'# HELP {prefix}_statements_traced_total Statements seen by the sqlite3 trace callback.')
+            lines.append(f'# TYPE {prefix}_statements_traced_total counter')
+            lines.extend(counters['traced'])
+        return '\n'.join(lines) + '\n'
+
+class InstrumentedCursor:
+    """
+    Wraps a sqlite3.Cursor and reports the statement to QueryStats once its
+    results are exhausted (or the cursor is dropped), so the recorded latency
+    includes the time spent stepping through rows.
+    """
+
+    def __init__(self, cursor, stats: QueryStats, sql: str, params: Sequence[Any], seconds: float):
+        self._cursor = cursor
+        self._stats = stats
+        self._sql = sql
+        self._params = params
+        self._seconds = seconds
+        self._rows = 0
+        self._done = False
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._seconds += time.perf_counter() - start
+
+    def _finish(self):
+        if self._done:
+            return
+        self._done = True
+        rows = self._rows if self._cursor.description is not None else max(self._cursor.rowcount, 0)
+        self._stats.record(self._sql, self._params, self._seconds, rows)
+
+    def fetchone(self):
+        row = self._timed(self._cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self._cursor.arraysize if size is None else size
+        rows = self._timed(self._cursor.fetchmany, size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cursor.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
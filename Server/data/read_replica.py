@@ -0,0 +1,136 @@
+"""
+python read_replica.py query "SELECT wellStatus, COUNT(*) FROM wells GROUP BY wellStatus"
+python read_replica.py query --repeat 10 --interval 30 "SELECT COUNT(*) FROM well_readings"
+python read_replica.py shell --refresh-interval 60 --databases wells users
+python read_replica.py status
+
+Runs analytic queries against in-memory copies of the databases
+(DatabaseManager.enable_read_replica, see ReadReplica), so long scans and
+aggregates never hold a lock on the files the server and the gateways write
+to. Every database is attached under its own name (users.users,
+wells.well_readings, wells_east.wells, ...); unqualified names resolve to the
+first database holding the table.
+
+The copies are taken once at start and then refreshed from change_log: by
+query --repeat before every run after the first, and by shell once
+--refresh-interval has passed, or on .refresh. .reload copies the files again,
+which also picks up the tables a refresh does not follow (nearest wells,
+clusters). Queries are read-only; anything that writes fails.
+"""
+
+
+import argparse
+import sqlite3
+import sys
+import time
+
+from database_manager import DatabaseManager, ReadReplica
+from profiler import run_main
+
+def run_query(replica: ReadReplica, sql: str, limit: int) -> int:
+    """Print the result of one statement as tab-separated rows; returns the row count."""
+    database = replica.attached()
+    try:
+        start = time.perf_counter()
+        cursor = database._execute(sql)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+    finally:
+        database.conn.close()
+    if cursor.description:
+        print('\t'.join(column[0] for column in cursor.description))
+    for row in rows[:limit]:
+        print('\t'.join('' if value is None else str(value) for value in row))
+    if len(rows) > limit:
+        print(f"... {len(rows) - limit} more row(s)")
+    print(f"({len(rows)} row(s) in {elapsed * 1000:.1f} ms)", file=sys.stderr)
+    return len(rows)
+
+def print_refresh(report) -> None:
+    changed = {name: entry for name, entry in report.items()
+               if entry['changes'] or entry['appended'] or entry['recopied'] or entry['reloaded']}
+    if not changed:
+        print("Refreshed: no changes", file=sys.stderr)
+    for name, entry in changed.items():
+        print(f"Refreshed {name}: {', '.join(f'{key}={value}' for key, value in entry.items())}", file=sys.stderr)
+
+def print_status(replica: ReadReplica) -> None:
+    status = replica.status()
+    for name in replica.databases:
+        entry = status[name]
+        if 'version' in entry:
+            print(f"{name:<20} version {entry['version']:>10} of {entry['primaryVersion']:>10} "
+                  f"({entry['behind']} behind)")
+        else:
+            print(f"{name:<20} not in change_log (appended tables only)")
+    print(f"{status['secondsSinceRefresh']}s since the last refresh")
+
+def shell(replica: ReadReplica, limit: int) -> None:
+    """Read statements from stdin, one per line (.refresh, .reload, .status, .quit)."""
+    interactive = sys.stdin.isatty()
+    while True:
+        if interactive:
+            print('replica> ', end='', flush=True)
+        line = sys.stdin.readline()
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        if line in ('.quit', '.exit'):
+            break
+        if line == '.refresh':
+            print_refresh(replica.refresh())
+        elif line == '.reload':
+            replica.reload()
+            print("Reloaded", file=sys.stderr)
+        elif line == '.status':
+            print_status(replica)
+        else:
+            try:
+                run_query(replica, line, limit)
+            except sqlite3.Error as e:
+                print(f"Error: {e}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Query in-memory copies of the databases')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    query_parser = commands.add_parser('query', help='Run statements and print their rows')
+    query_parser.add_argument('sql', nargs='+')
+    query_parser.add_argument('--repeat', type=int, default=1, help='Run the statements this many times')
+    query_parser.add_argument('--interval', type=float, default=10.0, help='Seconds between repeats')
+    shell_parser = commands.add_parser('shell', help='Run statements read from stdin')
+    shell_parser.add_argument('--refresh-interval', type=float, default=60.0,
+                              help='Refresh before a statement once this many seconds have passed')
+    for command in (query_parser, shell_parser):
+        command.add_argument('--limit', type=int, default=100, help='Rows printed per statement')
+    status_parser = commands.add_parser('status', help='Load the copies and print how far each is behind')
+    for command in (query_parser, shell_parser, status_parser):
+        command.add_argument('--databases', nargs='+', help='Databases to copy (default: all)')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    start = time.perf_counter()
+    try:
+        replica = manager.enable_read_replica(args.databases, getattr(args, 'refresh_interval', None))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Loaded {len(replica.databases)} database(s) in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    try:
+        if args.command == 'query':
+            for run in range(args.repeat):
+                if run:
+                    time.sleep(args.interval)
+                    print_refresh(replica.refresh())
+                for sql in args.sql:
+                    run_query(replica, sql, args.limit)
+        elif args.command == 'shell':
+            shell(replica, args.limit)
+        else:
+            print_status(replica)
+    finally:
+        manager.disable_read_replica()
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,413 @@
+"""
+python readings_archive.py archive --older-than-days 28
+python readings_archive.py series 17 --since 2025-01-01 --until 2025-03-01
+python readings_archive.py aggregate ph --since 2025-01-01 --wells 17 18
+python readings_archive.py stats
+
+Moves old well_readings into readingsArchive.sqlite as columnar blocks, one
+block per well and calendar month. Only months that ended at least
+--older-than-days ago are archived, and each batch of wells is copied and
+deleted in one transaction spanning both files (atomic while the databases use
+a rollback journal). Readings that arrive late for an archived month are
+archived as an extra block on the next run.
+
+Block layout (little-endian, every array 8-byte aligned):
+
+    header  magic 'BBRB', version, flags, float/NULL field masks, count, time unit, first time
+    id      int64[count]
+    time    uint32[count] (int64 with FLAG_WIDE_TIMES): delta from the previous reading, in time units
+    fields  per READING_FIELDS: int32[count] holding value x 10^READING_DECIMALS (NULL_SCALED for NULL),
+            or float64[count] (NaN for NULL) when a value does not round-trip exactly
+
+Times are microseconds since 1970 divided by the coarsest unit (s, ms or us)
+that keeps them exact, and recordedAt is rebuilt byte for byte; readings whose
+timestamps would not round-trip stay in well_readings. A reading takes about
+32 bytes, against roughly 100 in well_readings and its index.
+
+Blocks are decoded in place: Block columns are memoryview casts over the blob,
+and the archive connection reads the file through SQLite's memory map, so
+aggregate scans count, sum and compare whole columns without unpacking rows.
+series merges archived and live readings for one well; WellDatabase.get_readings
+still only reads the live table. Every wells shard (well_shards.py) is archived
+into the same file; well ids are unique across shards.
+"""
+
+
+import argparse
+import itertools
+import math
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from database_manager import DatabaseManager, WellDatabase
+from profiler import run_main
+
+FIELDS = WellDatabase.READING_FIELDS
+READING_DECIMALS = {'waterLevel': 3, 'waterConsumption': 3, 'ph': 3, 'turbidity': 3, 'tds': 2}
+MAGIC = b'BBRB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHHxxIIq')
+FLAG_SPACE_SEPARATOR = 1  # recordedAt uses ' ' instead of 'T' (SQLite CURRENT_TIMESTAMP style)
+FLAG_WIDE_TIMES = 2
+NULL_SCALED = -2 ** 31
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+MMAP_SIZE = 256 * 1024 * 1024
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+def parse_time(text: Any) -> Optional[Tuple[int, str]]:
+    """(microseconds since 1970, date/time separator) for a timestamp that formats back to the same text."""
+    if not isinstance(text, str) or len(text) < 19:
+        return None
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    separator = text[10]
+    if parsed.tzinfo is not None or parsed.isoformat(separator) != text:
+        return None
+    return (parsed - EPOCH) // MICROSECOND, separator
+
+def format_time(micros: int, separator: str) -> str:
+    return (EPOCH + micros * MICROSECOND).isoformat(separator)
+
+def _typed(code: str, values: List[Any]) -> bytes:
+    column = array(code, values)
+    if not LITTLE_ENDIAN:
+        column.byteswap()
+    return column.tobytes()
+
+def _column(view: memoryview, code: str):
+    """A column over view without copying (a byte-swapped copy on big-endian hosts)."""
+    if LITTLE_ENDIAN:
+        return view.cast(code)
+    column = array(code)
+    column.frombytes(view)
+    column.byteswap()
+    return column
+
+def _scaled(values: List[Any], scale: int) -> Optional[List[int]]:
+    """Values as int32 multiples of 1/scale, or None unless every value round-trips exactly."""
+    result = []
+    for value in values:
+        if value is None:
+            result.append(NULL_SCALED)
+            continue
+        if not isinstance(value, (int, float)) or not math.isfinite(value):
+            return None
+        scaled = round(value * scale)
+        if not NULL_SCALED < scaled < 2 ** 31 or scaled / scale != value:
+            return None
+        result.append(scaled)
+    return result
+
+def encode_block(rows: List[tuple]) -> bytes:
+    """
+    Encode (id, micros, separator, *READING_FIELDS) rows of one well, sorted by
+    time and sharing one separator. Raises ValueError for non-numeric values.
+    """
+    times = [row[1] for row in rows]
+    unit = next(u for u in (1_000_000, 1000, 1) if all(t % u == 0 for t in times))
+    deltas = [0] + [(b - a) // unit for a, b in zip(times, times[1:])]
+    wide = max(deltas) >= 2 ** 32
+    flags = (FLAG_SPACE_SEPARATOR if rows[0][2] == ' ' else 0) | (FLAG_WIDE_TIMES if wide else 0)
+    float_mask = null_mask = 0
+    columns = []
+    for i, field in enumerate(FIELDS):
+        values = [row[3 + i] for row in rows]
+        if any(value is None for value in values):
+            null_mask |= 1 << i
+        scaled = _scaled(values, 10 ** READING_DECIMALS[field])
+        if scaled is not None:
+            columns.append(_typed('i', scaled))
+            continue
+        if not all(value is None or isinstance(value, (int, float)) for value in values):
+            raise ValueError(f"Non-numeric {field} value")
+        float_mask |= 1 << i
+        columns.append(_typed('d', [math.nan if value is None else float(value) for value in values]))
+    data = bytearray(HEADER.pack(MAGIC, VERSION, flags, float_mask, null_mask, len(rows), unit, times[0]))
+    for chunk in (_typed('q', [row[0] for row in rows]), _typed('q' if wide else 'I', deltas), *columns):
+        data += bytes(-len(data) % 8)
+        data += chunk
+    return bytes(data)
+
+def _bit(mask: int, index: int) -> bool:
+    return bool((mask >> index) & 1)
+
+class Block:
+    """Read-only view of an encoded block; columns are memoryviews over the blob."""
+
+    def __init__(self, data: bytes):
+        magic, version, flags, self.float_mask, self.null_mask, self.count, self.unit, self.base = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a well reading block')
+        self.separator = ' ' if flags & FLAG_SPACE_SEPARATOR else 'T'
+        view = memoryview(data)
+        offset = HEADER.size
+
+        def take(code: str, size: int):
+            nonlocal offset
+            offset += -offset % 8
+            column = _column(view[offset:offset + size * self.count], code)
+            offset += size * self.count
+            return column
+
+        self.ids = take('q', 8)
+        self.deltas = take('q', 8) if flags & FLAG_WIDE_TIMES else take('I', 4)
+        self.columns = {field: take('d', 8) if _bit(self.float_mask, i) else take('i', 4)
+                        for i, field in enumerate(FIELDS)}
+
+    def times(self) -> List[int]:
+        """Microseconds since 1970 of every reading."""
+        return [self.base + total * self.unit for total in itertools.accumulate(self.deltas)]
+
+    def values(self, field: str) -> List[Optional[float]]:
+        column = self.columns[field]
+        if _bit(self.float_mask, FIELDS.index(field)):
+            return [None if math.isnan(value) else value for value in column]
+        scale = 10 ** READING_DECIMALS[field]
+        return [None if value == NULL_SCALED else value / scale for value in column]
+
+    def rows(self, well_id: int) -> Iterator[Dict[str, Any]]:
+        """Readings shaped like WellDatabase.get_readings rows."""
+        values = [self.values(field) for field in FIELDS]
+        for i, (reading_id, micros) in enumerate(zip(self.ids, self.times())):
+            row = {'id': reading_id, 'wellId': well_id, 'recordedAt': format_time(micros, self.separator)}
+            row.update((field, values[f][i]) for f, field in enumerate(FIELDS))
+            yield row
+
+    def summary(self, field: str) -> Tuple[int, Optional[float], Optional[float], float]:
+        """(count, min, max, sum) of a field's non-NULL values, straight from the column."""
+        index = FIELDS.index(field)
+        is_float = _bit(self.float_mask, index)
+        column = self.columns[field]
+        if _bit(self.null_mask, index):
+            column = [v for v in column if not (math.isnan(v) if is_float else v == NULL_SCALED)]
+        if not len(column):
+            return 0, None, None, 0.0
+        scale = 1 if is_float else 10 ** READING_DECIMALS[field]
+        return len(column), min(column) / scale, max(column) / scale, sum(column) / scale
+
+def _archive_connection(manager: DatabaseManager):
+    conn = manager._get_connection('readingsArchive')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    return conn
+
+def archive(manager: DatabaseManager, older_than_days: float = 28, now: Optional[datetime] = None,
+            wells_per_batch: int = 200) -> Dict[str, Any]:
+    """Move the readings of closed months into blocks; returns counts and sizes."""
+    start = time.perf_counter()
+    boundary = (now or datetime.now()) - timedelta(days=older_than_days)
+    cutoff = boundary.replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
+    report = {'cutoff': cutoff, 'readings': 0, 'blocks': 0, 'blockBytes': 0, 'skipped': 0}
+    for shard in manager.well_shards():
+        _archive_shard(manager, shard, cutoff, wells_per_batch, report)
+    report['bytesPerReading'] = round(report['blockBytes'] / report['readings'], 1) if report['readings'] else 0
+    report['seconds'] = round(time.perf_counter() - start, 4)
+    return report
+
+def _archive_shard(manager: DatabaseManager, shard: str, cutoff: str, wells_per_batch: int, report: Dict[str, Any]):
+    wells_db = manager.wells(shard)
+    conn = wells_db.conn
+    try:
+        conn.execute('ATTACH DATABASE ? AS archive', (manager.databases['readingsArchive'].path,))
+        well_ids = [row[0] for row in wells_db._execute(
+            'SELECT DISTINCT wellId FROM well_readings WHERE recordedAt < ?', (cutoff,))]
+        for i in range(0, len(well_ids), wells_per_batch):
+            batch = well_ids[i:i + wells_per_batch]
+            with wells_db.write_transaction():
+                rows = conn.execute(f'''
+                    SELECT id, wellId, recordedAt, {', '.join(FIELDS)} FROM well_readings
+                    WHERE wellId IN ({', '.join('?' for _ in batch)}) AND recordedAt < ?
+                ''', (*batch, cutoff)).fetchall()
+                groups: Dict[tuple, List[tuple]] = {}
+                for row in rows:
+                    parsed = parse_time(row[2])
+                    if parsed is None:
+                        report['skipped'] += 1
+                        continue
+                    # parse_time guarantees the text starts with YYYY-MM of the reading
+                    groups.setdefault((row[1], row[2][:7], parsed[1]), []).append((row[0], *parsed, *row[3:]))
+                blocks, archived_ids = [], []
+                for (well_id, _, _), members in groups.items():
+                    members.sort(key=lambda member: (member[1], member[0]))
+                    try:
+                        data = encode_block(members)
+                    except ValueError:
+                        report['skipped'] += len(members)
+                        continue
+                    blocks.append((well_id, members[0][1], members[-1][1], len(members), data))
+                    archived_ids.extend((member[0],) for member in members)
+                conn.executemany('''
+                    INSERT INTO archive.reading_blocks (wellId, startTime, endTime, count, data) VALUES (?, ?, ?, ?, ?)
+                ''', blocks)
+                conn.executemany('DELETE FROM well_readings WHERE id = ?', archived_ids)
+            report['readings'] += len(archived_ids)
+            report['blocks'] += len(blocks)
+            report['blockBytes'] += sum(len(block[4]) for block in blocks)
+    finally:
+        conn.close()
+
+def _micros(text: Optional[str], default: int) -> int:
+    if text is None:
+        return default
+    try:
+        return (datetime.fromisoformat(text).replace(tzinfo=None) - EPOCH) // MICROSECOND
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {text}")
+
+def archived_blocks(manager: DatabaseManager, well_ids: Optional[List[int]], since: Optional[str],
+                    until: Optional[str]) -> Iterator[Tuple[int, int, int, Block]]:
+    """(wellId, startTime, endTime, Block) for every block that may hold readings in [since, until)."""
+    # A day of slack either side: since/until compare as text against the rebuilt recordedAt
+    slack = 86_400_000_000
+    params: List[Any] = [_micros(since, -2 ** 62) - slack, _micros(until, 2 ** 62) + slack]
+    where = 'endTime >= ? AND startTime < ?'
+    if well_ids is not None:
+        where += f" AND wellId IN ({', '.join('?' for _ in well_ids)})"
+        params.extend(well_ids)
+    conn = _archive_connection(manager)
+    try:
+        cursor = conn.execute(f'''
+            SELECT wellId, startTime, endTime, data FROM reading_blocks WHERE {where} ORDER BY wellId, startTime
+        ''', params)
+        for well_id, start_time, end_time, data in cursor:
+            yield well_id, start_time, end_time, Block(data)
+    finally:
+        conn.close()
+
+def series(manager: DatabaseManager, well_id: int, since: Optional[str] = None,
+           until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """A well's readings in [since, until) from the archive and the live table, in time order."""
+    rows = [row for _, _, _, block in archived_blocks(manager, [well_id], since, until)
+            for row in block.rows(well_id)
+            if (since is None or row['recordedAt'] >= since) and (until is None or row['recordedAt'] < until)]
+    with manager.well_router() as router:
+        rows.extend(router.get_readings(well_id, since, until))
+    return sorted(rows, key=lambda row: (row['recordedAt'], row['id']))
+
+def aggregate(manager: DatabaseManager, field: str, since: Optional[str] = None, until: Optional[str] = None,
+              well_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    count/min/max/mean of a reading field over [since, until), archive and live
+    table together. Blocks entirely inside the range are summarized column-wise.
+    """
+    if field not in FIELDS:
+        raise ValueError(f"Unknown reading field: {field}")
+    count, low, high, total = 0, None, None, 0.0
+    since_micros, until_micros = _micros(since, -2 ** 62), _micros(until, 2 ** 62)
+    for well_id, start_time, end_time, block in archived_blocks(manager, well_ids, since, until):
+        if since_micros <= start_time and end_time < until_micros:
+            n, block_low, block_high, block_total = block.summary(field)
+        else:
+            values = [value for micros, value in zip(block.times(), block.values(field))
+                      if since_micros <= micros < until_micros and value is not None]
+            n, block_low, block_high, block_total = (len(values), min(values, default=None),
+                                                     max(values, default=None), sum(values))
+        if n:
+            count += n
+            total += block_total
+            low = block_low if low is None else min(low, block_low)
+            high = block_high if high is None else max(high, block_high)
+
+    conditions, params = ['1'], []
+    if since:
+        conditions.append('recordedAt >= ?')
+        params.append(since)
+    if until:
+        conditions.append('recordedAt < ?')
+        params.append(until)
+    if well_ids is not None:
+        conditions.append(f"wellId IN ({', '.join('?' for _ in well_ids)})")
+        params.extend(well_ids)
+    with manager.well_router() as router:
+        live = router.map(lambda wells_db: wells_db._execute(
+            f"SELECT COUNT({field}), MIN({field}), MAX({field}), TOTAL({field}) FROM well_readings "
+            f"WHERE {' AND '.join(conditions)}", tuple(params)).fetchone())
+    for n, hot_low, hot_high, hot_total in live.values():
+        if n:
+            count += n
+            total += hot_total
+            low = hot_low if low is None else min(low, hot_low)
+            high = hot_high if high is None else max(high, hot_high)
+    return {'field': field, 'count': count, 'min': low, 'max': high, 'mean': total / count if count else None}
+
+def repoint_wells(manager: DatabaseManager, keep_id: int, duplicate_ids: List[int]) -> int:
+    """Move archived blocks of merged duplicate wells to the kept well (see well_dedup.py merge)."""
+    conn = _archive_connection(manager)
+    try:
+        with conn:
+            return conn.execute(f'''
+                UPDATE reading_blocks SET wellId = ? WHERE wellId IN ({', '.join('?' for _ in duplicate_ids)})
+            ''', (keep_id, *duplicate_ids)).rowcount
+    finally:
+        conn.close()
+
+def stats(manager: DatabaseManager) -> Dict[str, Any]:
+    """Live and archived reading counts and sizes."""
+    with manager.well_router() as router:
+        shards = router.map(lambda wells_db: wells_db._execute(
+            'SELECT COUNT(*), MIN(recordedAt) FROM well_readings').fetchone())
+    oldest = [row[1] for row in shards.values() if row[1] is not None]
+    live = (sum(row[0] for row in shards.values()), min(oldest, default=None))
+    conn = _archive_connection(manager)
+    try:
+        archived = conn.execute('''
+            SELECT COUNT(*), TOTAL(count), TOTAL(length(data)), MIN(startTime), MAX(endTime) FROM reading_blocks
+        ''').fetchone()
+    finally:
+        conn.close()
+    return {
+        'liveReadings': live[0],
+        'oldestLiveReading': live[1],
+        'archivedBlocks': archived[0],
+        'archivedReadings': int(archived[1]),
+        'archivedBytes': int(archived[2]),
+        'archivedFrom': format_time(archived[3], 'T') if archived[3] is not None else None,
+        'archivedThrough': format_time(archived[4], 'T') if archived[4] is not None else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old well readings into columnar blocks')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    archive_parser = commands.add_parser('archive', help='Move readings of closed months into the archive')
+    archive_parser.add_argument('--older-than-days', type=float, default=28,
+                                help='Archive months that ended at least this long ago')
+    archive_parser.add_argument('--wells-per-batch', type=int, default=200, help='Wells moved per transaction')
+    series_parser = commands.add_parser('series', help="Print a well's readings from archive and live table")
+    series_parser.add_argument('well_id', type=int)
+    aggregate_parser = commands.add_parser('aggregate', help='count/min/max/mean of a reading field')
+    aggregate_parser.add_argument('field', choices=FIELDS)
+    aggregate_parser.add_argument('--wells', type=int, nargs='+', help='Only these wells (default: all)')
+    for command in (series_parser, aggregate_parser):
+        command.add_argument('--since', help='Inclusive start timestamp')
+        command.add_argument('--until', help='Exclusive end timestamp')
+    commands.add_parser('stats', help='Live and archived reading counts and sizes')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    try:
+        if args.command == 'archive':
+            result = archive(manager, args.older_than_days, wells_per_batch=args.wells_per_batch)
+        elif args.command == 'series':
+            rows = series(manager, args.well_id, args.since, args.until)
+            for row in rows:
+                print(row['recordedAt'], ' '.join(f'{field}={row[field]}' for field in FIELDS))
+            print(f"{len(rows)} reading(s)")
+            return
+        elif args.command == 'aggregate':
+            result = aggregate(manager, args.field, args.since, args.until, args.wells)
+        else:
+            result = stats(manager)
+    except ValueError as e:
+        parser.error(str(e))
+    print(', '.join(f'{key}={value}' for key, value in result.items()))
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,142 @@
+"""
+Retry policy for 'database is locked' / 'database table is locked' errors.
+
+    policy = RetryPolicy(max_total_wait=5.0)
+    manager.set_retry_policy(policy)
+    ... concurrent writers ...
+    print(policy.stats.to_dict())
+
+Connections wait busy_timeout inside SQLite first; if the lock is still held
+the operation is retried after an exponentially growing, fully jittered sleep
+until max_total_wait has passed since the first attempt. Write transactions are
+opened with BEGIN IMMEDIATE (see BaseDatabase.write_transaction), so the only
+statements that can hit a lock are BEGIN, COMMIT and autocommit reads, all of
+which are safe to repeat.
+"""
+
+
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from query_stats import LATENCY_BUCKETS
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+def is_busy(error: sqlite3.Error) -> bool:
+    """True for SQLITE_BUSY / SQLITE_LOCKED (including extended codes), i.e. errors worth retrying."""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (SQLITE_BUSY, SQLITE_LOCKED)
+    return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+class LockStats:
+    """Lock-wait counters and a histogram of the time operations spent waiting before they succeeded or gave up."""
+
+    def __init__(self):
+        self.operations_waited = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last bucket is +Inf
+        self._lock = threading.Lock()
+
+    def record(self, waited: float, retries: int, gave_up: bool):
+        with self._lock:
+            self.operations_waited += 1
+            self.retries += retries
+            self.gave_up += gave_up
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if waited <= bound:
+                    self.buckets[i] += 1
+                    return
+            self.buckets[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self.__init__()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'operationsWaited': self.operations_waited,
+                'retries': self.retries,
+                'gaveUp': self.gave_up,
+                'waitSeconds': round(self.wait_seconds, 6),
+                'maxWaitSeconds': round(self.max_wait_seconds, 6),
+                'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets)),
+            }
+
+    def to_prometheus(self, prefix: str = 'bluebridge_sqlite') -> str:
+        """Render the lock-wait histogram and counters in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                f'# HELP {prefix}_lock_wait_seconds Time operations waited on a locked database.',
+                f'# TYPE {prefix}_lock_wait_seconds histogram',
+            ]
+            cumulative = 0
+            for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets):
+                cumulative += count
+                lines.append(f'{prefix}_lock_wait_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_lock_wait_seconds_sum {self.wait_seconds}')
+            lines.append(f'{prefix}_lock_wait_seconds_count {self.operations_waited}')
+            lines.append(f'# TYPE {prefix}_lock_retries_total counter')
+            lines.append(f'{prefix}_lock_retries_total {self.retries}')
+            lines.append(f'# TYPE {prefix}_lock_gave_up_total counter')
+            lines.append(f'{prefix}_lock_gave_up_total {self.gave_up}')
+        return '\n'.join(lines) + '\n'
+
+@dataclass
+class RetryPolicy:
+    busy_timeout: float = 0.05  # seconds SQLite itself waits before reporting the lock (sqlite3.connect timeout)
+    base_delay: float = 0.005  # first backoff ceiling; doubles every retry
+    max_delay: float = 0.5  # backoff ceiling
+    max_total_wait: float = 10.0  # give up once this much time has passed since the first attempt
+    stats: LockStats = field(default_factory=LockStats)
+
+    def backoff(self, retry: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2^retry)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+    def run(self, operation: Callable[[], Any], on_busy: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Call operation until it does not fail with a lock error or the wait budget is spent.
+
+        Args:
+            operation: Idempotent callable (a single statement, BEGIN IMMEDIATE or COMMIT)
+            on_busy: Called after each lock error, before sleeping (e.g. to roll back an implicit transaction)
+
+        Raises:
+            The last lock error once max_total_wait is exceeded; other errors immediately
+        """
+        first_attempt = None
+        retries = 0
+        while True:
+            attempt_start = time.perf_counter()
+            try:
+                result = operation()
+            except sqlite3.Error as e:
+                if not is_busy(e):
+                    raise
+                if first_attempt is None:
+                    first_attempt = attempt_start
+                if on_busy:
+                    on_busy()
+                delay = self.backoff(retries)
+                waited = time.perf_counter() - first_attempt
+                if waited + delay > self.max_total_wait:
+                    self.stats.record(waited, retries, gave_up=True)
+                    raise
+                time.sleep(delay)
+                retries += 1
+                continue
+            if first_attempt is not None:
+                self.stats.record(attempt_start - first_attempt, retries, gave_up=False)
+            return result
@@ -0,0 +1,561 @@
+"""
+python standby.py init /mnt/standby/data
+python standby.py run /mnt/standby/data --interval 1 --reconcile-interval 300
+python standby.py status /mnt/standby/data
+python standby.py promote /mnt/standby/data
+python standby.py promote /mnt/standby/data --into /opt/bluebridge/data.new --no-catch-up
+
+Keeps warm standby copies of every database (users, wells and its shards,
+deviceTokens, readingsArchive) in a second directory, ideally on another disk,
+so a failed disk loses seconds of data instead of everything since the last
+backup-db.sh run. init takes an online snapshot of each file (backup_tool.py)
+and run then ships what the primaries commit.
+
+The databases use a rollback journal, not WAL: the readings archive moves rows
+between files in one ATTACH transaction, which is only atomic across files
+with a rollback journal. So there are no WAL frames to ship; run ships
+change_log batches instead. Each batch copies the current contents of the
+changed rows and the change_log entries themselves in one transaction on the
+standby. Rows appended to well_readings and reading_blocks are shipped by key.
+All other tables, and rows of the appended tables that are deleted or
+re-pointed in place (archiving, well merges), are caught by the reconcile pass
+every --reconcile-interval. It compares key ranges of --chunk-size rows by
+digest and copies the ranges that differ. A database whose schema changed, or
+whose change_log was compacted past the standby, is snapshotted again. New
+wells shards are picked up by the reconcile pass.
+
+run is a separate process, so writes on the primaries never wait for the
+standby. It only reads the primaries, one batch or chunk per short read
+transaction; in rollback-journal mode a commit waits for open readers, so
+--batch-size and --chunk-size bound that wait. Each standby file is consistent
+on its own after every batch. Across files the standby converges: for a moment
+it may hold an archived reading in both the wells and the archive copy.
+
+status reports the lag per database: change_log entries and appended rows not
+shipped yet, and the age in seconds of the oldest unshipped change. promote
+first catches up from whatever primary is still readable, checks each copy and
+marks it promoted, so run refuses to ship into it any more. Then it opens the
+copies with DatabaseManager, which recreates the change_log triggers the
+standby drops. The Node server reads Server/data, so either point that at the
+standby directory or copy the promoted files into a fresh directory with --into.
+"""
+
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backup_tool import integrity_check, online_backup
+from database_manager import BaseDatabase, DatabaseConfig, DatabaseManager, ReadReplica
+from profiler import run_main
+
+STATE_SCHEMA = 'CREATE TABLE IF NOT EXISTS standby_state (name TEXT PRIMARY KEY, value)'
+
+class RowDigest:
+    """SQL aggregate: row count and sum of each row's crc32, independent of row order."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def step(self, *values):
+        self.count += 1
+        self.total += zlib.crc32(repr(values).encode('utf-8'))
+
+    def finalize(self) -> str:
+        return f'{self.count}:{self.total}'
+
+class Standby:
+    """Standby copies of a manager's databases in standby_dir, under the same file names."""
+
+    def __init__(self, manager: DatabaseManager, standby_dir: str, batch_size: int = 5000, chunk_size: int = 5000,
+                 busy_timeout: float = 5.0):
+        """
+        Args:
+            manager: Manager of the primary databases
+            standby_dir: Directory holding the standby copies
+            batch_size: change_log entries (or appended rows) shipped per transaction
+            chunk_size: Rows compared per transaction by the reconcile pass
+            busy_timeout: Seconds to wait for a primary's writer; waiting readers do not hold writers up
+        """
+        primary_dir = Path(manager.databases[DatabaseManager.DEFAULT_WELL_SHARD].path).resolve().parent
+        if Path(standby_dir).resolve() == primary_dir:
+            raise ValueError(f"The standby directory is the primary directory: {standby_dir}")
+        self.manager = manager
+        self.standby_dir = standby_dir
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.busy_timeout = busy_timeout
+        self._connections: Dict[str, sqlite3.Connection] = {}
+
+    def path(self, db_name: str) -> str:
+        return os.path.join(self.standby_dir, Path(self.manager.databases[db_name].path).name)
+
+    def close(self):
+        for conn in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+    def init(self, db_name: str, pages: int = 256, pause: float = 0.01) -> Dict[str, Any]:
+        """Snapshot a primary into its standby copy (replacing any existing copy)."""
+        if db_name in self._connections:
+            self._connections.pop(db_name).close()
+        config = self.manager.databases[db_name]
+        path = self.path(db_name)
+        pending = path + '.init'
+        start = time.perf_counter()
+        online_backup(config.path, pending, pages=pages, pause=pause)
+        with closing(sqlite3.connect(pending)) as conn, conn:
+            # Shipped rows arrive with their change_log entries; the copy must not log them again
+            for table in config.tracked_tables:
+                for operation in ('insert', 'update', 'delete'):
+                    conn.execute(f'DROP TRIGGER IF EXISTS {table}_changes_{operation}')
+            conn.execute(STATE_SCHEMA)
+            version = BaseDatabase(conn).change_log_version() if config.tracked_tables else 0
+            for name, value in (('primaryPath', str(Path(config.path).resolve())),
+                                ('primaryFile', self._file_id(config.path)), ('appliedVersion', version)):
+                self._set_state(conn, name, value)
+            self._set_state(conn, 'promotedAt', None)
+            self._touch(conn, 'shippedAt')
+            self._touch(conn, 'reconciledAt')
+        integrity = integrity_check(pending)
+        if integrity != 'ok':
+            os.rename(pending, pending + '.corrupt')
+            raise RuntimeError(f"Standby snapshot of {db_name} failed integrity check: {integrity}")
+        os.replace(pending, path)
+        return {'database': db_name, 'path': path, 'bytes': os.path.getsize(path), 'version': version,
+                'seconds': round(time.perf_counter() - start, 3)}
+
+    @staticmethod
+    def _file_id(path: str) -> str:
+        stat = os.stat(path)
+        return f'{stat.st_dev}:{stat.st_ino}'
+
+    @staticmethod
+    def _state(conn: sqlite3.Connection, name: str) -> Any:
+        row = conn.execute('SELECT value FROM main.standby_state WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_state(conn: sqlite3.Connection, name: str, value: Any):
+        conn.execute('INSERT OR REPLACE INTO main.standby_state (name, value) VALUES (?, ?)', (name, value))
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, name: str):
+        conn.execute("INSERT OR REPLACE INTO main.standby_state (name, value) "
+                     "VALUES (?, strftime('%Y-%m-%dT%H:%M:%f', 'now'))", (name,))
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        """One transaction, so every read of the primary inside sees the same snapshot."""
+        conn.execute('BEGIN')
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _connect(self, db_name: str) -> sqlite3.Connection:
+        """The standby copy with its primary attached read-only as source."""
+        if db_name not in self._connections:
+            path = self.path(db_name)
+            if not os.path.exists(path):
+                raise ValueError(f"No standby copy of {db_name} in {self.standby_dir}; run init first")
+            conn = sqlite3.connect(path, timeout=self.busy_timeout)
+            try:
+                promoted = self._state(conn, 'promotedAt')
+                if promoted:
+                    raise RuntimeError(f"The standby copy of {db_name} was promoted at {promoted}")
+                conn.execute('PRAGMA recursive_triggers = ON')  # rows dropped by REPLACE leave the search index too
+                conn.create_aggregate('row_digest', -1, RowDigest)
+                source = Path(self.manager.databases[db_name].path).resolve().as_uri() + '?mode=ro'
+                conn.execute('ATTACH DATABASE ? AS source', (source,))
+            except BaseException:
+                conn.close()
+                raise
+            self._connections[db_name] = conn
+        return self._connections[db_name]
+
+    def _check_primary(self, conn: sqlite3.Connection, db_name: str):
+        """
+        Refuse to follow a primary other than the file the copy was taken from:
+        a tool opening a missing file recreates it empty, and a restored backup
+        is older than the copy. Either would otherwise be shipped over the copy.
+        """
+        config = self.manager.databases[db_name]
+        if self._file_id(config.path) != self._state(conn, 'primaryFile'):
+            raise RuntimeError(f"{config.path} is not the file the standby copy of {db_name} was taken from; "
+                               f"run init again to follow it")
+        if config.tracked_tables:
+            row = conn.execute("SELECT seq FROM source.sqlite_sequence WHERE name = 'change_log'").fetchone()
+            applied = self._state(conn, 'appliedVersion')
+            if (row[0] if row else 0) < applied:
+                raise RuntimeError(f"change_log of {db_name} went back from {applied} to {row[0] if row else 0}; "
+                                   f"run init again to follow it")
+
+    def ship(self, db_name: str) -> Dict[str, Any]:
+        """
+        Ship what the primary committed since the last call.
+
+        Returns:
+            {'changes': change_log entries applied, 'appended': rows appended, 'reinitialized': bool}
+        """
+        conn = self._connect(db_name)
+        self._check_primary(conn, db_name)
+        config = self.manager.databases[db_name]
+        report: Dict[str, Any] = {'changes': 0, 'appended': 0, 'reinitialized': False}
+        if config.tracked_tables:
+            applied = self._state(conn, 'appliedVersion')
+            compacted = conn.execute(
+                "SELECT value FROM source.change_log_state WHERE name = 'compactedThrough'").fetchone()
+            if compacted and applied < compacted[0]:
+                print(f"change_log of {db_name} was compacted past the standby ({applied} < {compacted[0]}); "
+                      f"taking a new snapshot")
+                self.init(db_name)
+                report['reinitialized'] = True
+                return report
+            while True:
+                applied_now = self._ship_changes(conn, config)
+                if not applied_now:
+                    break
+                report['changes'] += applied_now
+        for table, key in ReadReplica.APPENDED_TABLES.items():
+            if table in config.schema:
+                report['appended'] += self._ship_appended(conn, table, key)
+        self._ship_sequences(conn)
+        return report
+
+    def _ship_changes(self, conn: sqlite3.Connection, config: DatabaseConfig) -> int:
+        """Apply the next batch of change_log entries; returns how many there were."""
+        with self._transaction(conn):
+            since = self._state(conn, 'appliedVersion')
+            window = conn.execute('''
+                SELECT MAX(version), COUNT(*) FROM (
+                    SELECT version FROM source.change_log WHERE version > ? ORDER BY version LIMIT ?)
+            ''', (since, self.batch_size)).fetchone()
+            if window[0] is None:
+                return 0
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS changed_keys (tableName TEXT NOT NULL, rowKey NOT NULL)')
+            conn.execute('DELETE FROM temp.changed_keys')
+            conn.execute('''
+                INSERT INTO temp.changed_keys SELECT DISTINCT tableName, rowKey FROM source.change_log
+                WHERE version > ? AND version <= ?
+            ''', (since, window[0]))
+            for table, key in config.tracked_tables.items():
+                columns = self._columns(conn, table)
+                keys = 'SELECT rowKey FROM temp.changed_keys WHERE tableName = ?'
+                conn.execute(f'DELETE FROM main.{table} WHERE {key} IN ({keys})', (table,))
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table} WHERE {key} IN ({keys})
+                ''', (table,))
+            # The reconcile pass may already have copied some of these entries
+            conn.execute('''
+                INSERT OR REPLACE INTO main.change_log SELECT * FROM source.change_log WHERE version > ? AND version <= ?
+            ''', (since, window[0]))
+            self._set_state(conn, 'appliedVersion', window[0])
+            self._touch(conn, 'shippedAt')
+        return window[1]
+
+    def _ship_appended(self, conn: sqlite3.Connection, table: str, key: str) -> int:
+        """Copy the rows added to an appended table, batch_size per transaction."""
+        columns = self._columns(conn, table)
+        appended = 0
+        while True:
+            with self._transaction(conn):
+                last = conn.execute(f'SELECT MAX({key}) FROM main.{table}').fetchone()[0]
+                count = conn.execute(f'''
+                    INSERT INTO main.{table} ({columns})
+                    SELECT {columns} FROM source.{table} WHERE {key} > ? ORDER BY {key} LIMIT ?
+                ''', (last if last is not None else -2 ** 63, self.batch_size)).rowcount
+            appended += count
+            if count < self.batch_size:
+                return appended
+
+    @staticmethod
+    def _ship_sequences(conn: sqlite3.Connection):
+        """Carry AUTOINCREMENT counters over, including ids WellRouter allocated for other shards."""
+        if not conn.execute("SELECT 1 FROM source.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            return
+        with Standby._transaction(conn):
+            for name, seq in conn.execute('SELECT name, seq FROM source.sqlite_sequence').fetchall():
+                if not conn.execute('UPDATE main.sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?',
+                                    (seq, name)).rowcount:
+                    conn.execute('INSERT INTO main.sqlite_sequence (name, seq) VALUES (?, ?)', (name, seq))
+
+    @staticmethod
+    def _columns(conn: sqlite3.Connection, table: str) -> str:
+        return ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+
+    @staticmethod
+    def _schema(conn: sqlite3.Connection, schema: str) -> List[tuple]:
+        return conn.execute(fr'''
+            SELECT type, name, sql FROM {schema}.sqlite_master
+            WHERE name NOT LIKE '%\_changes\_%' ESCAPE '\' AND tbl_name != 'standby_state' ORDER BY type, name
+        ''').fetchall()
+
+    def _reconciled_tables(self, conn: sqlite3.Connection, db_name: str) -> List[str]:
+        """Every table change_log does not cover, search indexes (kept by their triggers) aside."""
+        config = self.manager.databases[db_name]
+        tables = []
+        for (table,) in conn.execute("SELECT name FROM source.sqlite_master WHERE type = 'table' ORDER BY name"):
+            if table in config.tracked_tables or table.startswith('sqlite_'):
+                continue
+            if any(table == fts or table.startswith(f'{fts}_') for fts in config.search_tables):
+                continue
+            tables.append(table)
+        return tables
+
+    @staticmethod
+    def _layout(conn: sqlite3.Connection, table: str) -> Tuple[List[str], List[str]]:
+        """(key columns, copied columns): the primary key, else the rowid, which is then copied too."""
+        info = conn.execute(f'PRAGMA main.table_info({table})').fetchall()
+        columns = [row[1] for row in info]
+        keys = [row[1] for row in sorted((row for row in info if row[5]), key=lambda row: row[5])]
+        return (keys, columns) if keys else (['rowid'], ['rowid'] + columns)
+
+    def reconcile(self, db_name: str) -> Dict[str, Any]:
+        """
+        Compare every table change_log does not cover with the primary, one key
+        range of chunk_size rows per transaction, and copy the ranges that differ.
+        """
+        conn = self._connect(db_name)
+        self._check_primary(conn, db_name)
+        report: Dict[str, Any] = {'tables': 0, 'chunks': 0, 'rows': 0, 'reinitialized': False}
+        if self._schema(conn, 'main') != self._schema(conn, 'source'):
+            print(f"Schema of {db_name} changed; taking a new snapshot")
+            self.init(db_name)
+            report['reinitialized'] = True
+            return report
+        for table in self._reconciled_tables(conn, db_name):
+            report['tables'] += 1
+            keys, columns = self._layout(conn, table)
+            key_list, column_list = ', '.join(keys), ', '.join(columns)
+            key_tuple = f'({key_list})'
+            low: Optional[tuple] = None
+            while True:
+                with self._transaction(conn):
+                    bounds, params = [], []
+                    if low is not None:
+                        bounds.append(f'{key_tuple} > ({", ".join("?" for _ in keys)})')
+                        params.extend(low)
+                    where = ' AND '.join(bounds) or '1'
+                    high = conn.execute(f'''
+                        SELECT {key_list} FROM source.{table} WHERE {where} ORDER BY {key_list} LIMIT 1 OFFSET ?
+                    ''', (*params, self.chunk_size - 1)).fetchone()
+                    if high is not None:
+                        bounds.append(f'{key_tuple} <= ({", ".join("?" for _ in keys)})')
+                        params.extend(high)
+                    where = ' AND '.join(bounds) or '1'
+                    digests = [conn.execute(f'SELECT row_digest({column_list}) FROM {schema}.{table} WHERE {where}',
+                                            params).fetchone()[0] for schema in ('main', 'source')]
+                    if digests[0] != digests[1]:
+                        conn.execute(f'DELETE FROM main.{table} WHERE {where}', params)
+                        report['rows'] += conn.execute(f'''
+                            INSERT INTO main.{table} ({column_list}) SELECT {column_list} FROM source.{table} WHERE {where}
+                        ''', params).rowcount
+                        report['chunks'] += 1
+                if high is None:
+                    break
+                low = tuple(high)
+        with conn:
+            self._touch(conn, 'reconciledAt')
+        return report
+
+    def add_missing_copies(self) -> List[str]:
+        """Snapshot every database without a standby copy, wells shards created since the start included."""
+        with closing(self.manager._get_connection(DatabaseManager.DEFAULT_WELL_SHARD)) as conn:
+            shards = conn.execute('SELECT name, filename FROM well_shards ORDER BY rowid').fetchall()
+        for name, filename in shards:
+            if name not in self.manager.databases:
+                self.manager._register_well_shard(name, filename)
+        added = [db_name for db_name in self.manager.databases if not os.path.exists(self.path(db_name))]
+        for db_name in added:
+            self.init(db_name)
+        return added
+
+    def lag(self, db_name: str) -> Dict[str, Any]:
+        """How far a standby copy is behind its primary, in rows and seconds."""
+        conn = self._connect(db_name)
+        config = self.manager.databases[db_name]
+        applied = self._state(conn, 'appliedVersion')
+        lag: Dict[str, Any] = {'appliedVersion': applied, 'rows': 0, 'seconds': 0.0}
+        with self._transaction(conn):
+            if config.tracked_tables:
+                row = conn.execute("SELECT seq FROM source.sqlite_sequence WHERE name = 'change_log'").fetchone()
+                lag['primaryVersion'] = row[0] if row else 0
+                pending, oldest = conn.execute('''
+                    SELECT COUNT(*), (julianday('now') - julianday(MIN(changedAt))) * 86400
+                    FROM source.change_log WHERE version > ?
+                ''', (applied,)).fetchone()
+                lag['changes'] = pending
+                lag['rows'] += pending
+                lag['seconds'] = round(oldest or 0.0, 3)
+            for table, key in ReadReplica.APPENDED_TABLES.items():
+                if table in config.schema:
+                    pending = conn.execute(f'''
+                        SELECT COUNT(*) FROM source.{table}
+                        WHERE {key} > COALESCE((SELECT MAX({key}) FROM main.{table}), -9223372036854775808)
+                    ''').fetchone()[0]
+                    lag[table] = pending
+                    lag['rows'] += pending
+            for name in ('shippedAt', 'reconciledAt'):
+                lag[name] = self._state(conn, name)
+        return lag
+
+    def run(self, interval: float = 1.0, reconcile_interval: float = 300.0, once: bool = False):
+        """Ship every interval seconds and reconcile every reconcile_interval, until interrupted."""
+        for db_name in self.add_missing_copies():
+            print(f"Took a standby copy of {db_name}")
+        next_reconcile = 0.0 if once else time.monotonic() + reconcile_interval
+        while True:
+            for db_name in list(self.manager.databases):
+                try:
+                    report = self.ship(db_name)
+                except (sqlite3.Error, OSError, RuntimeError) as e:
+                    print(f"Shipping {db_name} failed: {str(e)}")
+                    continue
+                if report['changes'] or report['appended']:
+                    print(f"{db_name}: shipped {report['changes']} change(s), {report['appended']} appended row(s)")
+            if time.monotonic() >= next_reconcile:
+                try:
+                    for db_name in self.add_missing_copies():
+                        print(f"Took a standby copy of {db_name}")
+                except (sqlite3.Error, OSError, RuntimeError) as e:
+                    print(f"Checking for new shards failed: {str(e)}")
+                for db_name in list(self.manager.databases):
+                    try:
+                        report = self.reconcile(db_name)
+                    except (sqlite3.Error, OSError, RuntimeError) as e:
+                        print(f"Reconciling {db_name} failed: {str(e)}")
+                        continue
+                    if report['chunks']:
+                        print(f"{db_name}: reconciled {report['rows']} row(s) in {report['chunks']} range(s)")
+                next_reconcile = time.monotonic() + reconcile_interval
+            if once:
+                return
+            time.sleep(interval)
+
+    def _copies(self) -> Dict[str, str]:
+        """{db_name: standby path} of every database, taking the shards from the standby's own shard map."""
+        copies = {db_name: self.path(db_name) for db_name in self.manager.databases}
+        wells_copy = copies[DatabaseManager.DEFAULT_WELL_SHARD]
+        if os.path.exists(wells_copy):
+            with closing(sqlite3.connect(wells_copy)) as conn:
+                for name, filename in conn.execute('SELECT name, filename FROM well_shards ORDER BY rowid'):
+                    copies.setdefault(name, os.path.join(self.standby_dir, filename))
+        for db_name, path in copies.items():
+            if not os.path.exists(path):
+                raise ValueError(f"No standby copy of {db_name} in {self.standby_dir}")
+        return copies
+
+    def promote(self, catch_up: bool = True, into: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Turn the standby copies into primaries.
+
+        Args:
+            catch_up: First ship and reconcile from every primary that is still readable
+            into: Copy the promoted files into this directory (default: promote them in place)
+
+        Returns:
+            Per database: path, appliedVersion and the result of PRAGMA quick_check
+        """
+        if catch_up:
+            for db_name in list(self.manager.databases):
+                try:
+                    self.ship(db_name)
+                    self.reconcile(db_name)
+                except (sqlite3.Error, OSError, RuntimeError) as e:
+                    print(f"Catching up {db_name} failed, promoting it as shipped: {str(e)}")
+        self.close()
+        report = {}
+        for db_name, path in self._copies().items():
+            with closing(sqlite3.connect(path)) as conn, conn:
+                check = conn.execute('PRAGMA quick_check').fetchone()[0]
+                if check != 'ok':
+                    raise RuntimeError(f"Standby copy of {db_name} failed quick_check: {check}")
+                self._set_state(conn, 'promotedAt', time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()))
+                applied = self._state(conn, 'appliedVersion')
+            if into:
+                os.makedirs(into, exist_ok=True)
+                target = os.path.join(into, os.path.basename(path))
+                if os.path.exists(target):
+                    raise ValueError(f"{target} already exists")
+                online_backup(path, target)
+                path = target
+            report[db_name] = {'path': path, 'appliedVersion': applied, 'quickCheck': check}
+        # Opening the copies recreates the change_log triggers the standby dropped
+        DatabaseManager(data_dir=into or self.standby_dir)
+        return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm standby copies of the databases kept current by log shipping')
+    parser.add_argument('--data-dir', help='Directory holding the primary .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    init_parser = commands.add_parser('init', help='Snapshot every primary into the standby directory')
+    init_parser.add_argument('--databases', nargs='+', help='Databases to snapshot (default: all)')
+    init_parser.add_argument('--pages', type=int, default=256, help='Pages copied per backup step')
+    init_parser.add_argument('--pause', type=float, default=0.01, help='Seconds to sleep between steps')
+    run_parser = commands.add_parser('run', help='Ship changes continuously')
+    run_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between shipping rounds')
+    run_parser.add_argument('--reconcile-interval', type=float, default=300.0,
+                            help='Seconds between reconcile passes over the tables change_log does not cover')
+    run_parser.add_argument('--once', action='store_true', help='Ship and reconcile once, then exit')
+    run_parser.add_argument('--batch-size', type=int, default=5000, help='Rows shipped per transaction')
+    run_parser.add_argument('--chunk-size', type=int, default=5000, help='Rows compared per reconcile transaction')
+    status_parser = commands.add_parser('status', help='Print the replication lag of every standby copy')
+    promote_parser = commands.add_parser('promote', help='Make the standby copies the primaries')
+    promote_parser.add_argument('--no-catch-up', action='store_true',
+                                help='Do not ship from the primaries first (they are gone)')
+    promote_parser.add_argument('--into', help='Copy the promoted files into this new directory')
+    for command in (init_parser, run_parser, promote_parser, status_parser):
+        command.add_argument('standby_dir', help='Directory holding the standby copies')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    try:
+        standby = Standby(manager, args.standby_dir, getattr(args, 'batch_size', 5000),
+                          getattr(args, 'chunk_size', 5000))
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        if args.command == 'init':
+            os.makedirs(args.standby_dir, exist_ok=True)
+            for db_name in args.databases or list(manager.databases):
+                result = standby.init(db_name, args.pages, args.pause)
+                print(f"{db_name}: {result['bytes'] / (1024 * 1024):.2f} MB at version {result['version']} "
+                      f"in {result['seconds']}s -> {result['path']}")
+        elif args.command == 'run':
+            try:
+                standby.run(args.interval, args.reconcile_interval, args.once)
+            except KeyboardInterrupt:
+                pass
+        elif args.command == 'status':
+            for db_name in manager.databases:
+                lag = standby.lag(db_name)
+                print(f"{db_name:<20} {lag['rows']:>8} row(s) {lag['seconds']:>10.3f}s behind "
+                      f"(version {lag['appliedVersion']} of {lag.get('primaryVersion', '-')}), "
+                      f"shipped {lag['shippedAt']}, reconciled {lag['reconciledAt']}")
+        else:
+            report = standby.promote(not args.no_catch_up, args.into)
+            for db_name, entry in report.items():
+                print(f"{db_name}: promoted at version {entry['appliedVersion']}, "
+                      f"quick_check {entry['quickCheck']} -> {entry['path']}")
+            print(f"Point Server/data at {args.into or args.standby_dir} (or copy the files there) "
+                  f"and restart the server")
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        standby.close()
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,327 @@
+"""
+python synthetic_data.py --output-dir fixtures --users 1000000 --wells 100000
+python synthetic_data.py --output-dir fixtures --users 100000 --wells 20000 --tokens 150000 --readings-per-well 48 --seed 7 --force
+
+Builds a fresh set of users.sqlite / wells.sqlite / deviceTokens.sqlite filled
+with synthetic data for load testing. Output is fully determined by --seed, the
+row counts and --chunk-size: every chunk of rows is generated from its own
+seeded RNG, so the number of worker processes does not change the result.
+
+Wells are grouped in geographic clusters (users live around the same clusters),
+every well gets an hourly history of sensor readings, and wells/tokens reference
+existing users. Rows are generated in a process pool and written by the main
+process in one transaction per table, with the FTS and change-log triggers
+dropped during the load and restored afterwards (search indexes are rebuilt;
+the change log starts empty).
+"""
+
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from database_manager import DatabaseManager, WellDatabase
+from profiler import run_main
+
+FIRST_NAMES = ['John', 'Jane', 'Robert', 'Emily', 'Michael', 'Sarah', 'Amina', 'Kwame', 'Fatou', 'Ibrahim',
+               'Lucia', 'Mateo', 'Priya', 'Arjun', 'Mei', 'Hiroshi', 'Olga', 'Pierre', 'Chloe', 'Youssef']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Diallo', 'Mensah', 'Okafor', 'Traore',
+              'Silva', 'Rossi', 'Patel', 'Singh', 'Wang', 'Tanaka', 'Ivanova', 'Martin', 'Dubois', 'Haddad']
+ROLES = ['user'] * 18 + ['manager', 'admin']
+WATER_NEEDS = ['drinking', 'irrigation', 'industrial']
+WATER_TYPES = ['Clean', 'Mineral', 'Spring', 'Artesian', 'Borehole']
+WELL_STATUSES = ['Active'] * 6 + ['Inactive', 'Maintenance', 'Unknown']
+DEVICE_TYPES = ['android'] * 3 + ['ios']
+
+USER_COLUMNS = ['userId', 'email', 'password', 'firstName', 'lastName', 'username', 'role', 'location',
+                'waterNeeds', 'lastActive', 'registrationDate', 'notificationPreferences', 'phoneNumber',
+                'isWellOwner', 'themePreference', 'createdAt', 'updatedAt']
+WELL_COLUMNS = ['id', 'name', 'description', 'location', 'latitude', 'longitude', 'water_level', 'water_quality',
+                'status', 'owner', 'espId', 'wellWaterConsumption', 'wellWaterType', 'wellName', 'wellOwner',
+                'wellLocation', 'wellCapacity', 'wellWaterLevel', 'wellStatus', 'waterQuality', 'extraData',
+                'lastUpdated', 'last_update', 'ownerId']
+TOKEN_COLUMNS = ['tokenId', 'userId', 'token', 'deviceType', 'lastUsed', 'isActive']
+READING_COLUMNS = ['wellId', 'recordedAt'] + WellDatabase.READING_FIELDS
+
+# JSON values below are formatted directly (json.dumps separators) since their shape is fixed
+JSON_BOOL = ('false', 'true')
+
+CHUNK_SIZE = 20000
+WELLS_PER_CLUSTER = 250
+
+def user_id(seed: int, i: int) -> str:
+    """Deterministic UUID-shaped id for user i, so other tables can reference users without generating them."""
+    return f"{seed & 0xffffffff:08x}-5eed-4000-8000-{i:012x}"
+
+def cluster_centers(seed: int, wells: int) -> List[Tuple[float, float, float]]:
+    """(latitude, longitude, spread in degrees) for each well cluster."""
+    rng = random.Random(f"{seed}:clusters")
+    count = max(1, math.ceil(wells / WELLS_PER_CLUSTER))
+    return [(rng.uniform(-55.0, 70.0), rng.uniform(-180.0, 180.0), rng.uniform(0.05, 1.0)) for _ in range(count)]
+
+def _point(rng: random.Random, centers: List[Tuple[float, float, float]]) -> Tuple[float, float]:
+    lat, lon, spread = centers[int(rng.random() * len(centers))]
+    lat = max(-90.0, min(90.0, rng.gauss(lat, spread)))
+    lon = (rng.gauss(lon, spread) + 180.0) % 360.0 - 180.0
+    return round(lat, 6), round(lon, 6)
+
+def _timestamp(start: datetime, seconds: float) -> str:
+    return (start - timedelta(seconds=seconds)).isoformat(timespec='seconds')
+
+# Hot loops pick with int(rand() * n) rather than rng.choice/randint, which cost several calls each
+
+def generate_users(rng: random.Random, ctx: Dict[str, Any], first: int, count: int) -> List[tuple]:
+    seed, start, centers = ctx['seed'], ctx['start'], ctx['centers']
+    rand = rng.random
+    rows = []
+    for i in range(first, first + count):
+        lat, lon = _point(rng, centers)
+        registered = _timestamp(start, rand() * 3 * 365 * 86400)
+        first_name, last_name = FIRST_NAMES[int(rand() * 20)], LAST_NAMES[int(rand() * 20)]
+        rows.append((
+            user_id(seed, i),
+            f"user_{i}@example.com",
+            f"$2b$10${rng.getrandbits(224):056x}",
+            first_name,
+            last_name,
+            f"{first_name.lower()}_{i}",
+            ROLES[int(rand() * 20)],
+            f'{{"latitude": {lat}, "longitude": {lon}}}',
+            f'{{"type": "{WATER_NEEDS[int(rand() * 3)]}", "amount": {int(rand() * 100) + 1}}}',
+            _timestamp(start, rand() * 30 * 86400),
+            registered,
+            f'{{"weatherAlerts": {JSON_BOOL[rand() < 0.7]}, "wellUpdates": {JSON_BOOL[rand() < 0.5]}, '
+            f'"nearbyUsers": {JSON_BOOL[rand() < 0.3]}}}',
+            f"+{int(rand() * 999) + 1}{int(rand() * 900000000) + 100000000}",
+            int(i < ctx['wells']),
+            int(rand() * 3),
+            registered,
+            registered,
+        ))
+    return rows
+
+def generate_wells(rng: random.Random, ctx: Dict[str, Any], first: int, count: int) -> List[tuple]:
+    seed, start, centers, users = ctx['seed'], ctx['start'], ctx['centers'], ctx['users']
+    rand = rng.random
+    rows = []
+    for i in range(first, first + count):
+        lat, lon = _point(rng, centers)
+        location = f'{{"latitude": {lat}, "longitude": {lon}}}'
+        quality = (f'{{"ph": {round(6.0 + rand() * 2.5, 2)}, "turbidity": {round(0.1 + rand() * 4.9, 2)}, '
+                   f'"tds": {int(rand() * 451) + 50}}}')
+        capacity = round(100.0 + rand() * 900.0, 2)
+        level = round((0.1 + rand() * 0.9) * capacity, 2)
+        status = WELL_STATUSES[int(rand() * 9)]
+        name = f"{LAST_NAMES[int(rand() * 20)]} Well {i + 1}"
+        owner = f"{FIRST_NAMES[int(rand() * 20)]} {LAST_NAMES[int(rand() * 20)]}"
+        updated = _timestamp(start, rand() * 7 * 86400)
+        rows.append((
+            i + 1, name, f"Well installed in {2010 + int(rand() * 15)}", location, lat, lon, level, quality,
+            status, owner, f"ESP-{i:08d}", round(5.0 + rand() * 95.0, 2), WATER_TYPES[int(rand() * 5)], name,
+            owner, location, capacity, level, status, quality, '{"notes": "synthetic"}',
+            updated, updated,
+            # the first `wells` users are marked isWellOwner; fall back to any user if there are fewer
+            user_id(seed, i if i < users else int(rand() * users)) if users else None,
+        ))
+    return rows
+
+def generate_tokens(rng: random.Random, ctx: Dict[str, Any], first: int, count: int) -> List[tuple]:
+    seed, start, users = ctx['seed'], ctx['start'], ctx['users']
+    return [(
+        f"{seed & 0xffffffff:08x}-70ce-4000-8000-{i:012x}",
+        user_id(seed, i % users),
+        f"synthetic-{seed}-{i:012d}-{rng.getrandbits(64):016x}",
+        DEVICE_TYPES[int(rng.random() * 4)],
+        _timestamp(start, rng.random() * 60 * 86400),
+        int(rng.random() < 0.9),
+    ) for i in range(first, first + count)]
+
+def generate_readings(rng: random.Random, ctx: Dict[str, Any], first: int, count: int) -> List[tuple]:
+    """count wells starting at well index first; readings_per_well rows each, oldest first."""
+    start, per_well, interval = ctx['start'], ctx['readings_per_well'], ctx['reading_interval']
+    rows = []
+    for well_index in range(first, first + count):
+        capacity = rng.uniform(100.0, 1000.0)
+        level = rng.uniform(0.3, 1.0) * capacity
+        ph, turbidity, tds = rng.uniform(6.0, 8.5), rng.uniform(0.1, 5.0), rng.uniform(50, 500)
+        for step in range(per_well, 0, -1):
+            consumption = rng.uniform(0.0, capacity * 0.02)
+            level = min(capacity, max(0.0, level - consumption + rng.uniform(0.0, capacity * 0.02)))
+            rows.append((
+                well_index + 1,
+                _timestamp(start, step * interval),
+                round(level, 2),
+                round(consumption, 2),
+                round(ph + rng.gauss(0, 0.05), 2),
+                round(max(0.0, turbidity + rng.gauss(0, 0.1)), 2),
+                round(tds + rng.gauss(0, 5)),
+            ))
+    return rows
+
+GENERATORS = {
+    'users': generate_users,
+    'wells': generate_wells,
+    'device_tokens': generate_tokens,
+    'well_readings': generate_readings,
+}
+
+def generate_chunk(table: str, ctx: Dict[str, Any], first: int, count: int) -> List[tuple]:
+    """Worker: rows for one chunk, from an RNG seeded by (seed, table, first) only."""
+    rng = random.Random(f"{ctx['seed']}:{table}:{first}")
+    return GENERATORS[table](rng, ctx, first, count)
+
+def iter_chunks(pool: ProcessPoolExecutor, workers: int, table: str, ctx: Dict[str, Any],
+                total: int, chunk_size: int) -> Iterator[List[tuple]]:
+    """Yield generated chunks in order, keeping at most workers * 2 in flight."""
+    pending = []
+    starts = iter(range(0, total, chunk_size))
+    while True:
+        while len(pending) < workers * 2:
+            first = next(starts, None)
+            if first is None:
+                break
+            pending.append(pool.submit(generate_chunk, table, ctx, first, min(chunk_size, total - first)))
+        if not pending:
+            return
+        yield pending.pop(0).result()
+
+def load_database(path: str, search_tables: List[str], loads: List[Tuple[str, List[str], Iterator[List[tuple]]]]) -> Dict[str, int]:
+    """
+    Write generated chunks into a freshly created database file.
+
+    Triggers are dropped for the load (they would write one FTS/change_log row
+    per inserted row) and recreated afterwards together with the explicit
+    indexes, then the FTS tables are rebuilt.
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    counts = {}
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        # Explicit indexes are cheaper to build once over the loaded table than to maintain row by row
+        deferred = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'index') AND sql IS NOT NULL"
+        ).fetchall()
+        for kind, name, _ in deferred:
+            conn.execute(f'DROP {kind.upper()} {name}')
+
+        for table, columns, chunks in loads:
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+            counts[table] = 0
+            conn.execute('BEGIN')
+            for rows in chunks:
+                conn.executemany(sql, rows)
+                counts[table] += len(rows)
+            conn.execute('COMMIT')
+
+        conn.execute('BEGIN')
+        for _, _, sql in deferred:
+            conn.execute(sql)
+        for fts_table in search_tables:
+            conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+        conn.execute('COMMIT')
+        conn.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        conn.close()
+    return counts
+
+def generate(output_dir: str, users: int, wells: int, tokens: int, readings_per_well: int, seed: int,
+             workers: int, chunk_size: int = CHUNK_SIZE, reading_interval: int = 3600,
+             start: datetime = datetime(2025, 1, 1)) -> Dict[str, Dict[str, Any]]:
+    """Generate all tables into output_dir; returns {table: {'rows', 'seconds', 'rowsPerSec'}}."""
+    if (wells or tokens) and not users:
+        raise ValueError("wells and device tokens reference users; generate at least one user")
+    manager = DatabaseManager(data_dir=output_dir)
+    ctx = {
+        'seed': seed,
+        'start': start,
+        'users': users,
+        'wells': wells,
+        'centers': cluster_centers(seed, wells),
+        'readings_per_well': readings_per_well,
+        'reading_interval': reading_interval,
+    }
+    # readings are generated per well, so size their chunks in wells
+    wells_per_reading_chunk = max(1, chunk_size // max(1, readings_per_well))
+    plan = {
+        'users': [('users', USER_COLUMNS, users, chunk_size)],
+        'wells': [('wells', WELL_COLUMNS, wells, chunk_size),
+                  ('well_readings', READING_COLUMNS, wells if readings_per_well else 0, wells_per_reading_chunk)],
+        'deviceTokens': [('device_tokens', TOKEN_COLUMNS, tokens, chunk_size)],
+    }
+
+    report = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for db_name, tables in plan.items():
+            config = manager.databases[db_name]
+            timings = {}
+
+            def timed(table: str, chunks: Iterator[List[tuple]]) -> Iterator[List[tuple]]:
+                started = time.perf_counter()
+                yield from chunks
+                timings[table] = time.perf_counter() - started
+
+            loads = [(table, columns, timed(table, iter_chunks(pool, workers, table, ctx, total, size)))
+                     for table, columns, total, size in tables]
+            started = time.perf_counter()
+            counts = load_database(config.path, config.search_tables, loads)
+            finish = time.perf_counter() - started - sum(timings.values())  # trigger restore + FTS rebuild
+            for table, rows in counts.items():
+                # the index/FTS rebuild is charged to the database's first table
+                seconds = timings[table] + (finish if table == tables[0][0] else 0.0)
+                report[table] = {'rows': rows, 'seconds': round(seconds, 3),
+                                 'rowsPerSec': round(rows / seconds) if seconds else 0}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate deterministic synthetic databases for load testing')
+    parser.add_argument('--output-dir', required=True, help='Directory for the generated .sqlite files')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--wells', type=int, default=20000)
+    parser.add_argument('--tokens', type=int, help='Device tokens (default: one per user)')
+    parser.add_argument('--readings-per-well', type=int, default=24, help='Hourly readings per well')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Generator processes')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per generated chunk')
+    parser.add_argument('--force', action='store_true', help='Replace existing database files in the output dir')
+
+    args = parser.parse_args()
+
+    output = Path(args.output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    existing = [output / name for name in ('users.sqlite', 'wells.sqlite', 'deviceTokens.sqlite')
+                if (output / name).exists()]
+    if existing:
+        if not args.force:
+            print(f"Error: {', '.join(map(str, existing))} already exist (use --force to replace)")
+            sys.exit(1)
+        for path in existing:
+            path.unlink()
+
+    tokens = args.users if args.tokens is None else args.tokens
+    try:
+        started = time.perf_counter()
+        report = generate(str(output), args.users, args.wells, tokens, args.readings_per_well,
+                          args.seed, args.workers, args.chunk_size)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - started
+
+    total = 0
+    for table, result in report.items():
+        print(f"{table:<15} {result['rows']:>12,} rows  {result['seconds']:>8.2f}s  {result['rowsPerSec']:>10,} rows/s")
+        total += result['rows']
+    print(f"{'total':<15} {total:>12,} rows  {elapsed:>8.2f}s  {round(total / elapsed):>10,} rows/s")
+
+if __name__ == "__main__":
+    run_main(main)
@@ -1,4 +1,5 @@
 from database_manager import DatabaseManager
+from profiler import run_main
 import json
 import re
 import uuid
@@ -87,7 +88,8 @@ def interactive_menu():
     print("2 - Edit a user")
     print("3 - Delete a user")
     print("4 - Create a random user")
-    print("5 - Exit")
+    print("5 - Search users")
+    print("6 - Exit")
 
 def select_user(users):
     while True:
@@ -147,7 +149,7 @@ def main():
                 
             value = selected_user[selected_field]
             try:
-                parsed = json.loads(value)
+                parsed = json.loads(value) if isinstance(value, str) else value
                 if not isinstance(parsed, list):
                     print("The field is not a JSON list.")
                     continue
@@ -167,10 +169,13 @@ def main():
                 continue
 
             for i in reversed(to_delete):
-                removed = parsed.pop(i)
-                print(f"Deleted index {i}: {removed}")
+                print(f"Deleting index {i}: {parsed[i]}")
 
-            update_user_field(selected_user['email'], selected_field, json.dumps(parsed))
+            # One UPDATE with json_remove instead of rewriting the whole column from Python
+            if db.users().json_remove_indices(selected_field, to_delete, {'userId': selected_user['userId']}):
+                print("Field updated successfully!")
+            else:
+                print("Failed to update the field: no matching user with a JSON list there, or nothing to delete.")
 
         elif choice == "3":
             users = db.users().get_all_users()
@@ -197,6 +202,14 @@ def main():
                 print("Failed to create random user.")
 
         elif choice == "5":
+            text = input("Search (name, username or email): ").strip()
+            users = db.users().search(text, limit=50)
+            if users:
+                display_users(users)
+            else:
+                print("No matching users found.")
+
+        elif choice == "6":
             print("Goodbye!")
             break
 
@@ -204,4 +217,4 @@ def main():
             print("Invalid choice.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
@@ -0,0 +1,192 @@
+"""
+python well_clusters.py rebuild
+python well_clusters.py refresh
+python well_clusters.py show --bbox -5 30 5 40 --zoom 6
+
+Builds the map cluster pyramid behind WellDatabase.clusters. Every well is
+placed in a Web Mercator cell at CLUSTER_MAX_ZOOM (well_cluster_members). The
+finest level of well_clusters groups those members by cell and status, and
+each coarser level sums the four child cells of the level below. A map view
+therefore reads a few rows per visible cell, however many wells there are.
+
+refresh reads the wells change_log since the last run, moves the changed wells
+in well_cluster_members, and recomputes only the cells they left or entered,
+from the finest level up to zoom 0. It falls back to a rebuild when the log
+was compacted past its cursor. Wells of every shard (well_shards.py) are
+clustered; the pyramid lives in the default shard.
+"""
+
+
+import argparse
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from database_manager import DatabaseManager, WellDatabase
+from nearest_wells import valid_coordinates
+from profiler import run_main
+
+STATE_PREFIX = 'wellClusters.'  # followed by the wells shard name
+MAX_ZOOM = WellDatabase.CLUSTER_MAX_ZOOM
+
+def read_state(wells_db: WellDatabase) -> Dict[str, int]:
+    """change_log cursor per wells shard."""
+    cursor = wells_db._execute('SELECT name, value FROM change_log_state WHERE name LIKE ?', (STATE_PREFIX + '%',))
+    return {row[0][len(STATE_PREFIX):]: row[1] for row in cursor}
+
+def write_state(wells_db: WellDatabase, versions: Dict[str, int]):
+    wells_db.conn.executemany('INSERT OR REPLACE INTO change_log_state (name, value) VALUES (?, ?)',
+                              [(STATE_PREFIX + shard, version) for shard, version in versions.items()])
+
+def member_row(well: Dict[str, Any]) -> Optional[tuple]:
+    """(wellId, cellX, cellY, latitude, longitude, status) for a well row, None without usable coordinates."""
+    latitude, longitude = well['latitude'], well['longitude']
+    if not valid_coordinates(latitude, longitude):
+        return None
+    x, y = WellDatabase.cluster_cell(latitude, longitude, MAX_ZOOM)
+    return well['id'], x, y, latitude, longitude, well['status'] or 'Unknown'
+
+def recompute_finest(wells_db: WellDatabase, cells: Iterable[Tuple[int, int]]):
+    """Regroup the members of the given finest-level cells."""
+    conn = wells_db.conn
+    for x, y in cells:
+        conn.execute('DELETE FROM well_clusters WHERE zoom = ? AND cellX = ? AND cellY = ?', (MAX_ZOOM, x, y))
+        conn.execute('''
+            INSERT INTO well_clusters (zoom, cellX, cellY, status, count, sumLatitude, sumLongitude, wellId)
+            SELECT ?, cellX, cellY, status, COUNT(*), SUM(latitude), SUM(longitude), MIN(wellId)
+            FROM well_cluster_members
+            WHERE cellX = ? AND cellY = ?
+            GROUP BY status
+        ''', (MAX_ZOOM, x, y))
+
+def roll_up(wells_db: WellDatabase, zoom: int, cells: Optional[Set[Tuple[int, int]]] = None):
+    """Rebuild cells at zoom from their four children at zoom + 1 (every cell when cells is None)."""
+    conn = wells_db.conn
+    insert = '''
+        INSERT INTO well_clusters (zoom, cellX, cellY, status, count, sumLatitude, sumLongitude, wellId)
+        SELECT ?, cellX >> 1, cellY >> 1, status, SUM(count), SUM(sumLatitude), SUM(sumLongitude), MIN(wellId)
+        FROM well_clusters
+        WHERE zoom = ? {where}
+        GROUP BY cellX >> 1, cellY >> 1, status
+    '''
+    if cells is None:
+        conn.execute('DELETE FROM well_clusters WHERE zoom = ?', (zoom,))
+        conn.execute(insert.format(where=''), (zoom, zoom + 1))
+        return
+    for x, y in cells:
+        conn.execute('DELETE FROM well_clusters WHERE zoom = ? AND cellX = ? AND cellY = ?', (zoom, x, y))
+        conn.execute(insert.format(where='AND cellX BETWEEN ? AND ? AND cellY BETWEEN ? AND ?'),
+                     (zoom, zoom + 1, 2 * x, 2 * x + 1, 2 * y, 2 * y + 1))
+
+def rebuild(manager: DatabaseManager) -> Dict[str, Any]:
+    """Recompute the whole pyramid in one transaction."""
+    start = time.perf_counter()
+    # Taken first, so anything that changes while we read is picked up by the next refresh
+    versions = manager.current_versions()
+    with manager.well_router() as router:
+        found = router.map(lambda wells_db: wells_db._execute('SELECT id, latitude, longitude, status FROM wells').fetchall())
+    members = [row for rows in found.values() for row in (member_row(well) for well in rows) if row is not None]
+    wells_db = manager.wells()
+    try:
+        with wells_db.write_transaction():
+            conn = wells_db.conn
+            conn.execute('DELETE FROM well_cluster_members')
+            conn.executemany('''
+                INSERT INTO well_cluster_members (wellId, cellX, cellY, latitude, longitude, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', members)
+            conn.execute('DELETE FROM well_clusters WHERE zoom = ?', (MAX_ZOOM,))
+            conn.execute('''
+                INSERT INTO well_clusters (zoom, cellX, cellY, status, count, sumLatitude, sumLongitude, wellId)
+                SELECT ?, cellX, cellY, status, COUNT(*), SUM(latitude), SUM(longitude), MIN(wellId)
+                FROM well_cluster_members
+                GROUP BY cellX, cellY, status
+            ''', (MAX_ZOOM,))
+            for zoom in range(MAX_ZOOM - 1, -1, -1):
+                roll_up(wells_db, zoom)
+            write_state(wells_db, {shard: versions[shard] for shard in manager.well_shards()})
+        rows = wells_db._execute('SELECT COUNT(*) FROM well_clusters').fetchone()[0]
+    finally:
+        wells_db.conn.close()
+    return {'mode': 'rebuild', 'wells': len(members), 'clusterRows': rows,
+            'seconds': round(time.perf_counter() - start, 4)}
+
+def refresh(manager: DatabaseManager, batch_size: int = 5000) -> Dict[str, Any]:
+    """Apply the wells changed since the last run to the pyramid."""
+    start = time.perf_counter()
+    wells_db = manager.wells()
+    try:
+        cursor = read_state(wells_db)
+    finally:
+        wells_db.conn.close()
+    if manager.DEFAULT_WELL_SHARD not in cursor:
+        return rebuild(manager)
+    changed: Dict[int, Optional[Dict[str, Any]]] = {}
+    while True:
+        result = manager.changes_since(cursor, tables=['wells'], limit=batch_size)
+        if result['resyncRequired']:
+            return dict(rebuild(manager), reason='change_log compacted past cursor')
+        for change in result['changes']:
+            changed[change['key']] = change['row']
+        cursor = result['versions']
+        if not result['hasMore']:
+            break
+
+    wells_db = manager.wells()
+    try:
+        cells: Set[Tuple[int, int]] = set()
+        with wells_db.write_transaction():
+            conn = wells_db.conn
+            well_ids = list(changed)
+            for i in range(0, len(well_ids), 500):
+                batch = well_ids[i:i + 500]
+                old = conn.execute(
+                    f"SELECT cellX, cellY FROM well_cluster_members WHERE wellId IN ({', '.join('?' for _ in batch)})",
+                    tuple(batch))
+                cells.update((row[0], row[1]) for row in old)
+            conn.executemany('DELETE FROM well_cluster_members WHERE wellId = ?', [(i,) for i in well_ids])
+            members = [row for row in (member_row(well) for well in changed.values() if well is not None)
+                       if row is not None]
+            conn.executemany('''
+                INSERT INTO well_cluster_members (wellId, cellX, cellY, latitude, longitude, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', members)
+            cells.update((row[1], row[2]) for row in members)
+
+            recompute_finest(wells_db, cells)
+            level = cells
+            for zoom in range(MAX_ZOOM - 1, -1, -1):
+                level = {(x >> 1, y >> 1) for x, y in level}
+                roll_up(wells_db, zoom, level)
+            write_state(wells_db, cursor)
+    finally:
+        wells_db.conn.close()
+    return {'mode': 'refresh', 'changedWells': len(changed), 'finestCells': len(cells),
+            'seconds': round(time.perf_counter() - start, 4)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the well map cluster pyramid')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help='Recompute every cluster')
+    commands.add_parser('refresh', help='Recompute only the cells whose wells changed')
+    show_parser = commands.add_parser('show', help='Print the clusters in a map view')
+    show_parser.add_argument('--bbox', type=float, nargs=4, required=True,
+                             metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'))
+    show_parser.add_argument('--zoom', type=int, required=True)
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    if args.command == 'show':
+        wells_db = manager.wells()
+        clusters = wells_db.clusters(tuple(args.bbox), args.zoom)
+        wells_db.conn.close()
+        for cluster in clusters:
+            print(f"({cluster['cellX']}, {cluster['cellY']}) {cluster['count']} well(s) at "
+                  f"{cluster['latitude']:.4f}, {cluster['longitude']:.4f} {cluster['statusCounts']}")
+        print(f"{len(clusters)} cluster(s)")
+        return
+    report = rebuild(manager) if args.command == 'rebuild' else refresh(manager)
+    print(', '.join(f'{key}={value}' for key, value in report.items()))
+
+if __name__ == "__main__":
+    run_main(main)
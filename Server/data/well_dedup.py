@@ -0,0 +1,248 @@
+"""
+python well_dedup.py scan --output suggestions.json
+python well_dedup.py scan --radius-km 0.05 --name-radius-km 5 --threshold 0.85
+python well_dedup.py merge 120 4711 4712
+python well_dedup.py merge --suggestions suggestions.json --min-score 0.9
+
+Finds wells entered more than once: almost the same coordinates under slightly
+different names (random espIds from wells_util.add_well, repeated manual
+entry). Pairs are never compared all against all. Candidates come from two
+blocking passes:
+
+  - spatial: wells in the same or a neighbouring grid cell of --radius-km
+    (cells are built on unit vectors, so they work at any latitude)
+  - name: wells with the same normalized name within --name-radius-km
+    (catches duplicates whose coordinates were typed imprecisely)
+
+Each candidate pair is scored from distance and name similarity. Pairs at or
+above --threshold are grouped into merge suggestions that keep the oldest well
+(lowest id). merge folds the duplicates into the kept well in one transaction
+(WellDatabase.merge_wells): readings are re-pointed, empty owner/contact data
+is filled in and the duplicates are deleted. Duplicates stored in another
+shard (well_shards.py) are moved into the kept well's shard first, and archived
+readings (readings_archive.py) follow in a last step. nearest_wells.py and
+well_clusters.py pick the deletions up on their next refresh.
+"""
+
+
+import argparse
+import json
+import math
+import re
+import sys
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from database_manager import DatabaseManager, WellDatabase, WellRouter
+from nearest_wells import chord_to_km, km_to_chord, to_unit_vector, valid_coordinates
+from profiler import run_main
+from readings_archive import repoint_wells
+from well_shards import move_wells
+
+NAME_STOPWORDS = {'well', 'wells', 'borehole', 'the', 'of'}
+NAME_WEIGHT = 0.6  # the rest of the score comes from distance
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase, strip accents and punctuation, drop filler words: 'Kibéra Well #2' -> 'kibera 2'."""
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    return ' '.join(word for word in re.findall(r'[a-z0-9]+', text) if word not in NAME_STOPWORDS)
+
+def name_key(normalized: str) -> str:
+    """Blocking key: word order does not matter ('kibera 2' and '2 kibera' block together)."""
+    return ' '.join(sorted(normalized.split()))
+
+def name_similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+class WellRecord:
+    __slots__ = ('id', 'name', 'normalized', 'latitude', 'longitude', 'point')
+
+    def __init__(self, well_id: int, name: str, latitude: float, longitude: float):
+        self.id = well_id
+        self.name = name
+        self.normalized = normalize_name(name)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.point = to_unit_vector(latitude, longitude)
+
+def load_wells(wells_db: WellDatabase) -> List[WellRecord]:
+    cursor = wells_db._execute('SELECT id, COALESCE(NULLIF(name, \'\'), wellName) AS name, latitude, longitude FROM wells')
+    return [WellRecord(row[0], row[1] or '', row[2], row[3]) for row in cursor if valid_coordinates(row[2], row[3])]
+
+def squared_chord(a: WellRecord, b: WellRecord) -> float:
+    return sum((p - q) ** 2 for p, q in zip(a.point, b.point))
+
+def spatial_pairs(wells: List[WellRecord], radius_km: float) -> Iterator[Tuple[WellRecord, WellRecord]]:
+    """Pairs within radius_km, from a 3D grid with cells one radius wide (own cell plus 26 neighbours)."""
+    size = math.sqrt(km_to_chord(radius_km))
+    limit = km_to_chord(radius_km)
+    cells: Dict[Tuple[int, int, int], List[WellRecord]] = {}
+    for well in wells:
+        cells.setdefault(tuple(math.floor(c / size) for c in well.point), []).append(well)
+    for (cx, cy, cz), members in cells.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    neighbours = cells.get((cx + dx, cy + dy, cz + dz))
+                    if not neighbours:
+                        continue
+                    for a in members:
+                        for b in neighbours:
+                            if a.id < b.id and squared_chord(a, b) <= limit:
+                                yield a, b
+
+def name_pairs(wells: List[WellRecord], radius_km: float, max_block_size: int,
+               skipped: List[str]) -> Iterator[Tuple[WellRecord, WellRecord]]:
+    """Pairs sharing a normalized name within radius_km; blocks larger than max_block_size are skipped."""
+    limit = km_to_chord(radius_km)
+    blocks: Dict[str, List[WellRecord]] = {}
+    for well in wells:
+        if well.normalized:
+            blocks.setdefault(name_key(well.normalized), []).append(well)
+    for key, members in blocks.items():
+        if len(members) > max_block_size:
+            skipped.append(key)
+            continue
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if squared_chord(a, b) <= limit:
+                    yield (a, b) if a.id < b.id else (b, a)
+
+def score_pair(a: WellRecord, b: WellRecord, name_radius_km: float) -> Dict[str, Any]:
+    distance = chord_to_km(squared_chord(a, b))
+    similarity = name_similarity(a.normalized, b.normalized)
+    distance_score = max(0.0, 1 - distance / name_radius_km)
+    return {'a': a.id, 'b': b.id, 'names': [a.name, b.name], 'distanceKm': round(distance, 4),
+            'nameSimilarity': round(similarity, 3),
+            'score': round(NAME_WEIGHT * similarity + (1 - NAME_WEIGHT) * distance_score, 3)}
+
+def group_pairs(pairs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Union the scored pairs into suggestions that keep the lowest id of each group."""
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for pair in pairs:
+        a, b = find(pair['a']), find(pair['b'])
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    groups: Dict[int, Dict[str, Any]] = {}
+    for pair in pairs:
+        group = groups.setdefault(find(pair['a']), {'keep': find(pair['a']), 'merge': set(), 'pairs': []})
+        group['merge'].update((pair['a'], pair['b']))
+        group['pairs'].append(pair)
+    suggestions = []
+    for group in groups.values():
+        group['merge'] = sorted(group['merge'] - {group['keep']})
+        group['score'] = min(pair['score'] for pair in group['pairs'])
+        suggestions.append(group)
+    return sorted(suggestions, key=lambda s: (-s['score'], s['keep']))
+
+def scan(manager: DatabaseManager, radius_km: float = 0.1, name_radius_km: float = 2.0,
+         threshold: float = 0.8, max_block_size: int = 50) -> Dict[str, Any]:
+    """Find duplicate candidates and group them into merge suggestions."""
+    start = time.perf_counter()
+    with manager.well_router() as router:
+        wells = [well for shard_wells in router.map(load_wells).values() for well in shard_wells]
+    skipped: List[str] = []
+    seen: Set[Tuple[int, int]] = set()
+    scored = []
+    for a, b in (*spatial_pairs(wells, radius_km), *name_pairs(wells, name_radius_km, max_block_size, skipped)):
+        if (a.id, b.id) in seen:
+            continue
+        seen.add((a.id, b.id))
+        pair = score_pair(a, b, name_radius_km)
+        if pair['score'] >= threshold:
+            scored.append(pair)
+    suggestions = group_pairs(scored)
+    return {
+        'wells': len(wells),
+        'comparisons': len(seen),
+        'allPairs': len(wells) * (len(wells) - 1) // 2,
+        'matchedPairs': len(scored),
+        'skippedNameBlocks': skipped,
+        'seconds': round(time.perf_counter() - start, 4),
+        'suggestions': suggestions,
+    }
+
+def merge(manager: DatabaseManager, router: WellRouter, keep_id: int, duplicate_ids: List[int]) -> Dict[str, int]:
+    """Merge duplicates into keep_id in the kept well's shard, then re-point their archived readings."""
+    shard = router.locate(keep_id)
+    if shard is None:
+        raise ValueError(f"Unknown wells: [{keep_id}]")
+    elsewhere: Dict[str, List[int]] = {}
+    for duplicate_id in duplicate_ids:
+        duplicate_shard = router.locate(duplicate_id)
+        if duplicate_shard not in (shard, None):
+            elsewhere.setdefault(duplicate_shard, []).append(duplicate_id)
+    for source, ids in elsewhere.items():
+        move_wells(manager, source, shard, ids)
+    wells_db = manager.wells(shard)
+    try:
+        result = wells_db.merge_wells(keep_id, duplicate_ids)
+    finally:
+        wells_db.conn.close()
+    result['blocks'] = repoint_wells(manager, keep_id, duplicate_ids)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Find and merge near-duplicate wells')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    scan_parser = commands.add_parser('scan', help='Emit merge suggestions')
+    scan_parser.add_argument('--radius-km', type=float, default=0.1, help='Spatial blocking radius')
+    scan_parser.add_argument('--name-radius-km', type=float, default=2.0,
+                             help='Radius for wells with the same normalized name; also scales the distance score')
+    scan_parser.add_argument('--threshold', type=float, default=0.8, help='Minimum pair score (0-1)')
+    scan_parser.add_argument('--max-block-size', type=int, default=50, help='Skip name blocks larger than this')
+    scan_parser.add_argument('--output', help='Write the suggestions as JSON to this file (default: stdout)')
+    merge_parser = commands.add_parser('merge', help='Merge duplicates into a kept well')
+    merge_parser.add_argument('ids', type=int, nargs='*', help='KEEP_ID DUPLICATE_ID [DUPLICATE_ID ...]')
+    merge_parser.add_argument('--suggestions', help='Apply every suggestion in a file written by scan')
+    merge_parser.add_argument('--min-score', type=float, default=0.0, help='Only apply suggestions scoring this high')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+
+    if args.command == 'scan':
+        report = scan(manager, args.radius_km, args.name_radius_km, args.threshold, args.max_block_size)
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            print(output)
+        print(f"{report['wells']} wells, {report['comparisons']} comparisons (of {report['allPairs']} pairs), "
+              f"{len(report['suggestions'])} suggestion(s) in {report['seconds']}s", file=sys.stderr)
+        return
+
+    if args.suggestions:
+        with open(args.suggestions, encoding='utf-8') as f:
+            merges = [(s['keep'], s['merge']) for s in json.load(f)['suggestions'] if s['score'] >= args.min_score]
+    elif len(args.ids) >= 2:
+        merges = [(args.ids[0], args.ids[1:])]
+    else:
+        parser.error('merge needs KEEP_ID DUPLICATE_ID [...] or --suggestions')
+    with manager.well_router() as router:
+        for keep_id, duplicate_ids in merges:
+            try:
+                result = merge(manager, router, keep_id, duplicate_ids)
+            except ValueError as e:
+                print(f"Skipped {keep_id} <- {duplicate_ids}: {e}")
+                continue
+            print(f"Merged {duplicate_ids} into {keep_id}: {result['readings']} reading(s) and {result['blocks']} "
+                  f"archived block(s) moved, {result['filled']} field(s) filled, {result['deleted']} well(s) deleted")
+
+if __name__ == "__main__":
+    run_main(main)
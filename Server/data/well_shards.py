@@ -0,0 +1,190 @@
+"""
+python well_shards.py add-shard east
+python well_shards.py add-region kenya wells_east --bbox -4.7 33.9 5.0 41.9
+python well_shards.py add-region bucket0 wells_east --hash 0 4
+python well_shards.py move-region kenya wells_west
+python well_shards.py place
+python well_shards.py show
+
+Shards the wells and their readings over several SQLite files, so gateways in
+different regions stop queueing behind one writer lock. wells.sqlite is the
+default shard and holds the shard map (well_shards, well_regions); every other
+shard is wells_<name>.sqlite with the same schema and its own change_log.
+DatabaseManager registers the shards as databases of their own, so backups,
+changes_since and compact_change_log cover them, and manager.well_router()
+routes well operations (see WellRouter).
+
+Regions are bboxes or espId hash buckets. A well belongs to the smallest bbox
+containing it, else to its hash bucket, else to the default shard. Changing
+the map does not move stored wells: place moves every well whose shard no
+longer matches, and move-region repoints a region and then runs place. Each
+batch of wells is copied with its readings and deleted from the old shard in
+one transaction spanning both files (atomic while the databases use a rollback
+journal). Wells keep their ids (WellRouter takes every id from the default
+shard's counter); readings get new ids in their new shard. place
+repeats until a pass finds nothing to move, which also catches wells a
+process created from a map it read before the change. Long-running processes
+should reload their router after the map changes.
+"""
+
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Tuple
+
+from database_manager import DatabaseManager, WellRouter
+from profiler import run_main
+
+def misplaced(router: WellRouter) -> Dict[Tuple[str, str], List[int]]:
+    """{(current shard, routed shard): well ids} for every well stored in the wrong shard."""
+    found = router.map(lambda wells_db: wells_db._execute('SELECT id, latitude, longitude, espId FROM wells').fetchall())
+    moves: Dict[Tuple[str, str], List[int]] = {}
+    for shard, rows in found.items():
+        for well_id, latitude, longitude, esp_id in rows:
+            target = router.route(latitude, longitude, esp_id)
+            if target != shard:
+                moves.setdefault((shard, target), []).append(well_id)
+    return moves
+
+def move_wells(manager: DatabaseManager, source: str, target: str, well_ids: List[int],
+               batch_size: int = 500) -> Dict[str, int]:
+    """Move wells and their readings from source to target shard, one transaction per batch."""
+    wells_db = manager.wells(source)
+    conn = wells_db.conn
+    moved = {'wells': 0, 'readings': 0}
+    try:
+        conn.execute('ATTACH DATABASE ? AS target', (manager.databases[target].path,))
+        columns = ', '.join(wells_db.table_columns('wells'))
+        reading_columns = ', '.join(c for c in wells_db.table_columns('well_readings') if c != 'id')
+        with wells_db.write_transaction():
+            # Compressed values are copied as stored, so the target needs their dictionaries
+            conn.execute('INSERT OR IGNORE INTO target.compression_dictionaries SELECT * FROM main.compression_dictionaries')
+        for i in range(0, len(well_ids), batch_size):
+            batch = well_ids[i:i + batch_size]
+            placeholders = ', '.join('?' for _ in batch)
+            try:
+                with wells_db.write_transaction():
+                    moved['wells'] += conn.execute(f'''
+                        INSERT INTO target.wells ({columns}) SELECT {columns} FROM main.wells WHERE id IN ({placeholders})
+                    ''', batch).rowcount
+                    moved['readings'] += conn.execute(f'''
+                        INSERT INTO target.well_readings ({reading_columns})
+                        SELECT {reading_columns} FROM main.well_readings WHERE wellId IN ({placeholders}) ORDER BY id
+                    ''', batch).rowcount
+                    conn.execute(f'DELETE FROM main.well_readings WHERE wellId IN ({placeholders})', batch)
+                    conn.execute(f'DELETE FROM main.wells WHERE id IN ({placeholders})', batch)
+            except sqlite3.Error as e:
+                print(f"Moving wells from {source} to {target} failed: {str(e)}")
+                raise
+    finally:
+        conn.close()
+    manager._load_compression(target)
+    return moved
+
+def place(manager: DatabaseManager, batch_size: int = 500, max_passes: int = 5) -> Dict[str, Any]:
+    """Move every well into the shard the map routes it to, until a pass finds nothing to move."""
+    start = time.perf_counter()
+    report: Dict[str, Any] = {'passes': 0, 'wells': 0, 'readings': 0, 'moves': {}}
+    with manager.well_router() as router:
+        while report['passes'] < max_passes:
+            moves = misplaced(router)
+            report['passes'] += 1
+            if not moves:
+                break
+            for (source, target), well_ids in moves.items():
+                moved = move_wells(manager, source, target, well_ids, batch_size)
+                key = f'{source}->{target}'
+                report['moves'][key] = report['moves'].get(key, 0) + moved['wells']
+                report['wells'] += moved['wells']
+                report['readings'] += moved['readings']
+    report['seconds'] = round(time.perf_counter() - start, 4)
+    return report
+
+def move_region(manager: DatabaseManager, region: str, shard: str, batch_size: int = 500) -> Dict[str, Any]:
+    """Route a region to another shard, then move its wells there."""
+    rule = next((r for r in manager.well_regions() if r['region'] == region), None)
+    if rule is None:
+        raise ValueError(f"Unknown region: {region}")
+    if rule['kind'] == 'bbox':
+        manager.set_well_region(region, shard, bbox=(rule['minLatitude'], rule['minLongitude'],
+                                                     rule['maxLatitude'], rule['maxLongitude']))
+    else:
+        manager.set_well_region(region, shard, bucket=(rule['hashBucket'], rule['hashBuckets']))
+    return dict(place(manager, batch_size), region=region, fromShard=rule['shard'], toShard=shard)
+
+def show(manager: DatabaseManager) -> Dict[str, Any]:
+    """Shards with their well and reading counts and file sizes, and the routing rules."""
+    with manager.well_router() as router:
+        counts = router.map(lambda wells_db: wells_db._execute(
+            'SELECT (SELECT COUNT(*) FROM wells), (SELECT COUNT(*) FROM well_readings)').fetchone())
+    shards = []
+    for shard, (wells, readings) in counts.items():
+        path = manager.databases[shard].path
+        shards.append({'shard': shard, 'path': path, 'wells': wells, 'readings': readings,
+                       'bytes': os.path.getsize(path) if os.path.exists(path) else 0})
+    return {'shards': shards, 'regions': manager.well_regions()}
+
+def shard_name(manager: DatabaseManager, name: str) -> str:
+    """Accept 'east' as well as 'wells_east'."""
+    for candidate in (name, f'wells_{name}'):
+        if candidate in manager.well_shards():
+            return candidate
+    raise ValueError(f"Unknown well shard: {name} (have: {', '.join(manager.well_shards())})")
+
+def main():
+    parser = argparse.ArgumentParser(description='Shard wells across several database files')
+    parser.add_argument('--data-dir', help='Directory holding the .sqlite files (default: current directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_shard_parser = commands.add_parser('add-shard', help='Create an empty shard wells_NAME.sqlite')
+    add_shard_parser.add_argument('name', help='Letters and digits')
+    add_region_parser = commands.add_parser('add-region', help='Route a region to a shard (existing wells stay put)')
+    add_region_parser.add_argument('region')
+    add_region_parser.add_argument('shard')
+    rule = add_region_parser.add_mutually_exclusive_group(required=True)
+    rule.add_argument('--bbox', type=float, nargs=4, metavar=('MIN_LAT', 'MIN_LON', 'MAX_LAT', 'MAX_LON'))
+    rule.add_argument('--hash', type=int, nargs=2, metavar=('BUCKET', 'BUCKETS'),
+                      help='Wells whose crc32(espId) %% BUCKETS == BUCKET')
+    remove_parser = commands.add_parser('remove-region', help='Drop a routing rule (its wells route to the default shard)')
+    remove_parser.add_argument('region')
+    move_parser = commands.add_parser('move-region', help='Route a region to another shard and move its wells')
+    move_parser.add_argument('region')
+    move_parser.add_argument('shard')
+    place_parser = commands.add_parser('place', help='Move every well into the shard the map routes it to')
+    for command in (move_parser, place_parser):
+        command.add_argument('--batch-size', type=int, default=500, help='Wells moved per transaction')
+    commands.add_parser('show', help='Print the shards and routing rules')
+
+    args = parser.parse_args()
+    manager = DatabaseManager(data_dir=args.data_dir)
+    try:
+        if args.command == 'add-shard':
+            print(f"Created shard {manager.add_well_shard(args.name)}")
+        elif args.command == 'add-region':
+            manager.set_well_region(args.region, shard_name(manager, args.shard),
+                                    bbox=tuple(args.bbox) if args.bbox else None,
+                                    bucket=tuple(args.hash) if args.hash else None)
+            print(f"Routed {args.region} to {shard_name(manager, args.shard)}; run place to move its wells")
+        elif args.command == 'remove-region':
+            print(f"Removed {args.region}" if manager.remove_well_region(args.region) else f"No region {args.region}")
+        elif args.command == 'move-region':
+            report = move_region(manager, args.region, shard_name(manager, args.shard), args.batch_size)
+            print(', '.join(f'{key}={value}' for key, value in report.items()))
+        elif args.command == 'place':
+            print(', '.join(f'{key}={value}' for key, value in place(manager, args.batch_size).items()))
+        else:
+            report = show(manager)
+            for shard in report['shards']:
+                print(f"{shard['shard']:<20} {shard['wells']:>8} well(s) {shard['readings']:>10} reading(s) "
+                      f"{shard['bytes'] / 1024:>10.1f} KiB  {shard['path']}")
+            for region in report['regions']:
+                rule = (f"bbox {region['minLatitude']} {region['minLongitude']} {region['maxLatitude']} "
+                        f"{region['maxLongitude']}" if region['kind'] == 'bbox'
+                        else f"hash {region['hashBucket']}/{region['hashBuckets']}")
+                print(f"{region['region']:<20} -> {region['shard']:<20} {rule}")
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    run_main(main)
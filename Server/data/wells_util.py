@@ -1,19 +1,22 @@
 from database_manager import DatabaseManager
+from profiler import run_main
 import json
 import random
 import string
 from datetime import datetime
 
 db = DatabaseManager()
+# Every well lookup and write goes through the router, which finds the shard holding the well
+router = db.well_router()
 
 def get_all_wells():
-    return db.wells().get_all_wells()
+    return router.get_all_wells()
 
 def get_well_by_id(well_id):
-    return db.wells().get_well(well_id)
+    return router.get_well(well_id)
 
 def update_well_data(well_id, data):
-    return db.wells().update_well(well_id, {
+    return router.update_well(well_id, {
         'wellWaterLevel': data.get('wellWaterLevel'),
         'waterQuality': json.dumps(data.get('waterQuality')),
         'wellStatus': data.get('wellStatus'),
@@ -21,173 +24,92 @@ def update_well_data(well_id, data):
     })
 
 def add_well(well_data):
-    print(f"DEBUG: add_well called with keys: {list(well_data.keys())}")
-
-    # Fill missing required fields with dummy data
+    """Create a well in one INSERT, filling missing required fields with dummy data."""
     if not well_data.get('espId'):
         well_data['espId'] = f"ESP-{random.randint(1000, 9999)}-{''.join(random.choices(string.ascii_uppercase, k=2))}"
-        print(f"DEBUG: Generated espId: {well_data['espId']}")
     if not well_data.get('wellName'):
         well_data['wellName'] = f"Auto Well {random.randint(1, 999)}"
-        print(f"DEBUG: Generated wellName: {well_data['wellName']}")
     if well_data.get('wellCapacity') is None:
         well_data['wellCapacity'] = round(random.uniform(100.0, 1000.0), 2)
-        print(f"DEBUG: Generated wellCapacity: {well_data['wellCapacity']}")
     if well_data.get('wellWaterLevel') is None:
         well_data['wellWaterLevel'] = round(random.uniform(10.0, 100.0), 2)
-        print(f"DEBUG: Generated wellWaterLevel: {well_data['wellWaterLevel']}")
     if well_data.get('wellWaterConsumption') is None:
         well_data['wellWaterConsumption'] = round(random.uniform(5.0, 100.0), 2)
-        print(f"DEBUG: Generated wellWaterConsumption: {well_data['wellWaterConsumption']}")
     if not well_data.get('wellStatus'):
         well_data['wellStatus'] = 'Unknown'
-        print(f"DEBUG: Generated wellStatus: {well_data['wellStatus']}")
-
-    print(f"DEBUG: Final well_data keys: {list(well_data.keys())}")
-    print(f"DEBUG: All required field values:")
-    required_fields = ['espId', 'wellName', 'wellCapacity', 'wellWaterLevel', 'wellWaterConsumption', 'wellStatus']
-    for field in required_fields:
-        print(f"  {field}: {well_data.get(field)} (type: {type(well_data.get(field))})")
-
-    # Validate required fields
-    for field in required_fields:
-        if field not in well_data or well_data[field] is None:
-            raise ValueError(f"Missing required field: {field}")
-
-    # Prepare location data
-    location = None
-    if well_data.get('latitude') and well_data.get('longitude'):
-        location = {
-            'latitude': well_data['latitude'],
-            'longitude': well_data['longitude']
-        }
 
     # Prepare water quality data
     water_quality = well_data.get('waterQuality', {})
     if not isinstance(water_quality, dict):
         water_quality = {}
 
-    # Prepare final data for database - include all possible required fields
-    db_data = {
+    # WellSchema maps, coerces and validates these; a bad field raises WellValidationError
+    return router.create_well({
         'espId': well_data['espId'],
         'wellName': well_data['wellName'],
         'wellOwner': well_data.get('wellOwner'),
-        'wellLocation': json.dumps(location) if location else None,
+        'latitude': well_data.get('latitude'),  # location is built from the coerced coordinates
+        'longitude': well_data.get('longitude'),
         'wellWaterType': well_data.get('wellWaterType', 'Clean'),
-        'wellCapacity': float(well_data['wellCapacity']),
-        'wellWaterLevel': float(well_data['wellWaterLevel']),
-        'wellWaterConsumption': float(well_data['wellWaterConsumption']),
-        'waterQuality': json.dumps(water_quality),
+        'wellCapacity': well_data['wellCapacity'],
+        'wellWaterLevel': well_data['wellWaterLevel'],
+        'wellWaterConsumption': well_data['wellWaterConsumption'],
+        'waterQuality': water_quality,
         'wellStatus': well_data['wellStatus'],
-        'extraData': json.dumps(well_data.get('extraData', {})),
+        'extraData': well_data.get('extraData', {}),
         'lastUpdated': datetime.now().isoformat(),
         'ownerId': well_data.get('ownerId', 1)  # Default to user ID 1
-    }
-
-    print(f"DEBUG: Sending to database: {list(db_data.keys())}")
-    print(f"DEBUG: Database data values:")
-    for key, value in db_data.items():
-        print(f"  {key}: {value} (type: {type(value)})")
-
-    try:
-        result = db.wells().create_well(db_data)
-        print(f"DEBUG: Database create_well returned: {result}")
-        return result
-    except Exception as e:
-        print(f"DEBUG: Database error: {e}")
-        print(f"DEBUG: Database error type: {type(e)}")
-
-        # Try with just the absolute minimum fields
-        print("DEBUG: Trying with minimal fields...")
-        minimal_data = {
-            'espId': well_data['espId'],
-            'wellName': well_data['wellName'],
-            'wellCapacity': float(well_data['wellCapacity']),
-            'wellWaterLevel': float(well_data['wellWaterLevel']),
-            'wellWaterConsumption': float(well_data['wellWaterConsumption']),
-            'wellStatus': well_data['wellStatus']
-        }
-
-        try:
-            result = db.wells().create_well(minimal_data)
-            print(f"DEBUG: Minimal create_well succeeded: {result}")
-            return result
-        except Exception as e2:
-            print(f"DEBUG: Minimal create_well also failed: {e2}")
-
-            # Try adding fields one by one to see which one breaks it
-            test_fields = ['wellOwner', 'wellLocation', 'wellWaterType', 'waterQuality', 'extraData', 'lastUpdated', 'ownerId']
-            working_data = minimal_data.copy()
-
-            for field in test_fields:
-                if field in db_data:
-                    working_data[field] = db_data[field]
-                    try:
-                        print(f"DEBUG: Testing with field '{field}'...")
-                        result = db.wells().create_well(working_data.copy())
-                        print(f"DEBUG: Success with {field}!")
-                        return result
-                    except Exception as e3:
-                        print(f"DEBUG: Failed with {field}: {e3}")
-                        # Remove the field and continue testing
-                        del working_data[field]
-
-            raise Exception(f"Could not create well with any field combination. Original error: {e}")
+    })
 
 def update_well_field(well_id, field_name, new_value):
-    return db.wells().update_well(well_id, {field_name: new_value})
+    return router.update_well(well_id, {field_name: new_value})
 
 def generate_random_string(length=8):
     return ''.join(random.choices(string.ascii_letters, k=length)).capitalize()
 
-def generate_random_wells(count=5):
-    """Generate random well data"""
+def generate_random_well_data(i=0):
+    """Generate the input dict for one random well (as accepted by add_well)"""
     water_types = ['Clean', 'Mineral', 'Spring', 'Artesian', 'Borehole']
     statuses = ['Active', 'Inactive', 'Maintenance', 'Unknown']
 
+    return {
+        'espId': f"ESP-{random.randint(1000, 9999)}-{''.join(random.choices(string.ascii_uppercase, k=2))}",
+        'wellName': f"{generate_random_string()} Well {i+1}",
+        'wellOwner': f"{generate_random_string()} Water Co.",
+        'latitude': round(random.uniform(-90, 90), 6),
+        'longitude': round(random.uniform(-180, 180), 6),
+        'wellWaterType': random.choice(water_types),
+        'wellCapacity': round(random.uniform(100.0, 1000.0), 2),
+        'wellWaterLevel': round(random.uniform(10.0, 100.0), 2),
+        'wellWaterConsumption': round(random.uniform(5.0, 100.0), 2),
+        'wellStatus': random.choice(statuses),
+        'waterQuality': {
+            'ph': round(random.uniform(6.0, 8.5), 2),
+            'turbidity': round(random.uniform(0.1, 5.0), 2),
+            'tds': random.randint(50, 500)
+        },
+        'extraData': {
+            'description': f"Well installed in {random.randint(2010, 2023)}",
+            'contact': f"{random.randint(100, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}",
+            'notes': "Automatically generated test data"
+        }
+    }
+
+def generate_random_wells(count=5):
+    """Generate random well data"""
     created_count = 0
     for i in range(count):
-        # Generate all required fields with dummy data
-        well_data = {
-            'espId': f"ESP-{random.randint(1000, 9999)}-{''.join(random.choices(string.ascii_uppercase, k=2))}",
-            'wellName': f"{generate_random_string()} Well {i+1}",
-            'wellOwner': f"{generate_random_string()} Water Co.",
-            'latitude': round(random.uniform(-90, 90), 6),
-            'longitude': round(random.uniform(-180, 180), 6),
-            'wellWaterType': random.choice(water_types),
-            'wellCapacity': round(random.uniform(100.0, 1000.0), 2),
-            'wellWaterLevel': round(random.uniform(10.0, 100.0), 2),
-            'wellWaterConsumption': round(random.uniform(5.0, 100.0), 2),
-            'wellStatus': random.choice(statuses),
-            'waterQuality': {
-                'ph': round(random.uniform(6.0, 8.5), 2),
-                'turbidity': round(random.uniform(0.1, 5.0), 2),
-                'tds': random.randint(50, 500)
-            },
-            'extraData': {
-                'description': f"Well installed in {random.randint(2010, 2023)}",
-                'contact': f"{random.randint(100, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}",
-                'notes': "Automatically generated test data"
-            }
-        }
+        well_data = generate_random_well_data(i)
 
         try:
-            print(f"\nAttempting to create well {i+1}:")
-            print(f"  ESP ID: {well_data['espId']}")
-            print(f"  Name: {well_data['wellName']}")
-            print(f"  Capacity: {well_data['wellCapacity']} (type: {type(well_data['wellCapacity'])})")
-            print(f"  Water Level: {well_data['wellWaterLevel']} (type: {type(well_data['wellWaterLevel'])})")
-            print(f"  Consumption: {well_data['wellWaterConsumption']} (type: {type(well_data['wellWaterConsumption'])})")
-            print(f"  Status: {well_data['wellStatus']}")
-
             result = add_well(well_data)
-            print(f"✓ Created: {well_data['wellName']} (DB ID: {result})")
-            created_count += 1
-        except Exception as e:
+            if result:
+                print(f"✓ Created: {well_data['wellName']} (DB ID: {result})")
+                created_count += 1
+            else:
+                print(f"✗ Failed to create well {i+1}")
+        except ValueError as e:
             print(f"✗ Failed to create well {i+1}: {e}")
-            print(f"  Error type: {type(e)}")
-            import traceback
-            print(f"  Full traceback: {traceback.format_exc()}")
 
     print(f"\nSuccessfully created {created_count}/{count} wells")
     return created_count
@@ -237,10 +159,12 @@ def edit_well_list_field(well, field_name):
     try:
         to_delete = parse_indices(delete_input, len(parsed))
         for i in reversed(to_delete):
-            removed = parsed.pop(i)
-            print(f"Deleted index {i}: {removed}")
+            print(f"Deleting index {i}: {parsed[i]}")
 
-        update_well_field(well['id'], field_name, json.dumps(parsed))
+        # One UPDATE with json_remove instead of rewriting the whole column from Python
+        if not router.json_remove_indices(well['id'], field_name, to_delete):
+            print("Failed to update the field: no matching well with a JSON list there, or nothing to delete.")
+            return False
         print("Field updated successfully!")
         return True
     except Exception as e:
@@ -274,13 +198,26 @@ def create_new_well():
             }
         }
 
-        add_well(well_data)
+        if not add_well(well_data):
+            print("\n✗ Failed to create well")
+            return False
         print("\n✓ Well created successfully!")
         return True
     except Exception as e:
         print(f"\n✗ Failed to create well: {e}")
         return False
 
+def search_wells():
+    """Interactive full-text well search"""
+    text = input("Search (name, description, notes or owner): ").strip()
+    results = router.search(text, limit=50)
+    if not results:
+        print("No matching wells found.")
+        return
+    print(f"\n=== Matches ({len(results)}) ===")
+    for well in results:
+        print(f"{well['id']}: {well['name']} (Owner: {well['owner'] or well['wellOwner'] or 'N/A'}, Status: {well['status']})")
+
 def main():
     wells = get_all_wells()
 
@@ -307,8 +244,9 @@ def main():
     print("1. Edit well list field")
     print("2. Add new well")
     print("3. Generate random wells")
+    print("4. Search wells")
 
-    choice = input("\nChoice (1-3): ").strip()
+    choice = input("\nChoice (1-4): ").strip()
 
     if choice == '1':
         try:
@@ -340,8 +278,11 @@ def main():
         count = int(input("How many wells to generate? (default 5): ").strip() or 5)
         generate_random_wells(count)
 
+    elif choice == '4':
+        search_wells()
+
     else:
         print("Invalid choice.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
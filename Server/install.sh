@@ -53,6 +53,11 @@ mkdir -p "$DEST_DIR/html"
 echo -e "${YELLOW}Copying server files...${NC}"
 rsync -av --exclude 'data/' --exclude 'install.sh' --exclude '.git/' "$SOURCE_DIR/" "$DEST_DIR/"
 
+# The Python data tools (backups, maintenance) sit in data/ in the source tree; ship them to tools/
+echo -e "${YELLOW}Copying data tools...${NC}"
+mkdir -p "$DEST_DIR/tools"
+rsync -av --include '*.py' --exclude '*' "$SOURCE_DIR/data/" "$DEST_DIR/tools/"
+
 # Install dependencies in the destination
 echo -e "${YELLOW}Installing npm dependencies in $DEST_DIR...${NC}"
 cd "$DEST_DIR" || { echo -e "${RED}Failed to change directory to $DEST_DIR${NC}"; exit 1; }
@@ -1,59 +1,51 @@
 #!/bin/bash
 
 # Configuration
-USER_DB_PATH="/opt/bluebridge/data/users.sqlite"
-DEVICE_TOKENS_DB_PATH="/opt/bluebridge/data/deviceTokens.sqlite"
-WELLS_DB_PATH="/opt/bluebridge/data/wells.sqlite"
+DATA_DIR="/opt/bluebridge/data"
+TOOLS_DIR="/opt/bluebridge/tools"  # Python data tools, copied there by install.sh
 BACKUP_DIR="/opt/bluebridge/backups"
 TIMESTAMP=$(date +%Y%m%d_%H%M%S)
+MAX_LOCAL_BACKUPS=10
+LOCAL_DAILY_BACKUP_DAYS=14
 
-USER_BACKUP_FILENAME="users_db_$TIMESTAMP.sqlite"
-DEVICE_TOKENS_BACKUP_FILENAME="device_tokens_db_$TIMESTAMP.sqlite"
-WELLS_BACKUP_FILENAME="wells_db_$TIMESTAMP.sqlite"
-
-COMPRESSED_USER_BACKUP_FILE="$BACKUP_DIR/$USER_BACKUP_FILENAME.gz"
-COMPRESSED_DEVICE_TOKENS_BACKUP_FILE="$BACKUP_DIR/$DEVICE_TOKENS_BACKUP_FILENAME.gz"
-COMPRESSED_WELLS_BACKUP_FILE="$BACKUP_DIR/$WELLS_BACKUP_FILENAME.gz"
+# Snapshots written by this run (every database, readings archive and wells shards included)
+MANIFEST="$BACKUP_DIR/manifest_$TIMESTAMP.txt"
 
 # Google Drive configuration
 RCLONE_REMOTE="gdrive:bluebridge_backups"  # 'bluebridge_backups' is the folder in your Drive
-MAX_CLOUD_BACKUPS=10
+MAX_CLOUD_BACKUPS=10  # per database
 
 # Ensure backup directory exists
 mkdir -p "$BACKUP_DIR"
 
-# Create local backup
-echo "Creating backup of users database..."
-cp "$USER_DB_PATH" "$BACKUP_DIR/$USER_BACKUP_FILENAME"
-gzip "$BACKUP_DIR/$USER_BACKUP_FILENAME"
-
-echo "Creating backup of device tokens database..."
-cp "$DEVICE_TOKENS_DB_PATH" "$BACKUP_DIR/$DEVICE_TOKENS_BACKUP_FILENAME"
-gzip "$BACKUP_DIR/$DEVICE_TOKENS_BACKUP_FILENAME"
-
-echo "Creating backup of wells database..."
-cp "$WELLS_DB_PATH" "$BACKUP_DIR/$WELLS_BACKUP_FILENAME"
-gzip "$BACKUP_DIR/$WELLS_BACKUP_FILENAME"
+# Create local backup (online snapshot, verified and gzipped by backup_tool.py)
+echo "Creating verified snapshots of all databases..."
+python3 "$TOOLS_DIR/backup_tool.py" --data-dir "$DATA_DIR" --dest "$BACKUP_DIR" --compress --timestamp "$TIMESTAMP" \
+    --keep-last "$MAX_LOCAL_BACKUPS" --keep-daily "$LOCAL_DAILY_BACKUP_DAYS" --manifest "$MANIFEST" || exit 1
 
 # Upload to Google Drive
 echo "Uploading to Google Drive..."
-rclone copy "$COMPRESSED_USER_BACKUP_FILE" "$RCLONE_REMOTE"
-rclone copy "$COMPRESSED_DEVICE_TOKENS_BACKUP_FILE" "$RCLONE_REMOTE"
-rclone copy "$COMPRESSED_WELLS_BACKUP_FILE" "$RCLONE_REMOTE"
-# Clean up old cloud backups (keep only the last $MAX_CLOUD_BACKUPS)
+while read -r file; do
+    rclone copy "$file" "$RCLONE_REMOTE"
+done < "$MANIFEST"
+# Clean up old cloud backups (keep only the last $MAX_CLOUD_BACKUPS of each database)
 echo "Pruning old backups from Google Drive..."
-rclone ls "$RCLONE_REMOTE" | sort -k2 | head -n -"$MAX_CLOUD_BACKUPS" | awk '{print $2}' | while read -r file; do
-    echo "Deleting $file from Google Drive..."
-    rclone delete "$RCLONE_REMOTE/$file"
-done
+while read -r file; do
+    db_name=$(basename "$file" | sed "s/_db_$TIMESTAMP.*//")
+    rclone lsf "$RCLONE_REMOTE" --include "${db_name}_db_*" | sort | head -n -"$MAX_CLOUD_BACKUPS" | while read -r old; do
+        echo "Deleting $old from Google Drive..."
+        rclone delete "$RCLONE_REMOTE/$old"
+    done
+done < "$MANIFEST"
 
 # Set permissions for local backup
 chown -R bluebridge:bluebridge "$BACKUP_DIR"
 chmod -R 644 "$BACKUP_DIR"/*.gz
 
-echo "Backup completed: $(basename "$COMPRESSED_USER_BACKUP_FILE")"
-echo "Backup completed: $(basename "$COMPRESSED_DEVICE_TOKENS_BACKUP_FILE")"
-echo "Backup completed: $(basename "$COMPRESSED_WELLS_BACKUP_FILE")"
+while read -r file; do
+    echo "Backup completed: $(basename "$file")"
+done < "$MANIFEST"
+rm -f "$MANIFEST"
 
 # List local backups
 echo "Local backups:"